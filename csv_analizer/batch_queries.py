@@ -0,0 +1,141 @@
+"""
+Consultas por lote sobre el conjunto de claves `(user_id, transport_id)` de un CSV.
+
+En vez de emitir un `SELECT` por fila del CSV (patrón N+1, con los valores
+interpolados en el texto de la consulta), las claves se cargan una sola vez en una
+tabla temporal `#keys` de la misma conexión y cada tabla se resuelve con una única
+consulta que hace join contra ella. El resultado vuelve alineado con las filas del
+CSV de entrada, así los notebooks arman sus tablas igual que antes.
+"""
+import pandas as pd
+from sqlalchemy import text
+
+KEYS_TABLE = "#keys"
+
+# SQL Server admite hasta 1000 filas por INSERT ... VALUES (y 2100 parámetros)
+_INSERT_BATCH = 1000
+
+# `COLLATE DATABASE_DEFAULT` evita conflictos de collation entre tempdb y la base de datos
+_CREATE_KEYS = f"""
+CREATE TABLE {KEYS_TABLE} (
+    user_id nvarchar(400) COLLATE DATABASE_DEFAULT NOT NULL,
+    transport_id nvarchar(400) COLLATE DATABASE_DEFAULT NOT NULL
+)
+"""
+
+# Mismo criterio que la consulta por fila: primer DrivingInsights del usuario cuyo JSON menciona el viaje
+SENTIANCE_EVENTOS_QUERY = f"""
+SELECT k.user_id, k.transport_id, se.found, se.JSON
+FROM {KEYS_TABLE} k
+OUTER APPLY (
+    SELECT TOP 1 1 AS found, s.JSON
+    FROM SentianceEventos s
+    WHERE s.sentianceid = k.user_id
+    AND s.tipo = 'DrivingInsights'
+    AND s.JSON LIKE '%' + k.transport_id + '%'
+) se
+"""
+
+PUNTAJES_PRIMARIOS_QUERY = f"""
+SELECT k.user_id, k.transport_id, p.found, p.legal, p.suavidad, p.atencion, p.promedio
+FROM {KEYS_TABLE} k
+OUTER APPLY (
+    SELECT TOP 1 1 AS found, legal, suavidad, atencion, promedio
+    FROM PuntajesPrirmariosTr
+    WHERE usuario = k.user_id AND viaje = k.transport_id
+) p
+"""
+
+PUNTAJES_SECUNDARIOS_QUERY = f"""
+SELECT k.user_id, k.transport_id, p.found, p.concentracion, p.aceleracion_fuerte, p.frenado_fuerte,
+    p.curvas_fuertes, p.anticipacion, p.celular_fijo, p.eventos_fuertes
+FROM {KEYS_TABLE} k
+OUTER APPLY (
+    SELECT TOP 1 1 AS found, concentracion, aceleracion_fuerte, frenado_fuerte, curvas_fuertes, anticipacion, celular_fijo, eventos_fuertes
+    FROM PuntajesSecundariosTr
+    WHERE usuario = k.user_id AND viaje = k.transport_id
+) p
+"""
+
+
+def normalize_key(user_id, transport_id):
+    # Las claves se comparan como texto: el CSV puede traerlas como int y la DB como nvarchar
+    return str(user_id), str(transport_id)
+
+
+def unique_keys(keys_df, user_col="user_id", transport_col="transport_id"):
+    """Claves `(user_id, transport_id)` distintas de `keys_df`, como texto y sin nulos."""
+    pairs = keys_df[[user_col, transport_col]].dropna().drop_duplicates()
+    return list(dict.fromkeys(normalize_key(u, t) for u, t in pairs.itertuples(index=False, name=None)))
+
+
+def load_keys(conn, keys):
+    """
+    Crea `#keys` en la conexión `conn` y la llena con `keys` en tandas de INSERT multi-fila.
+
+    La tabla temporal vive mientras viva la conexión, así que todas las consultas que
+    la usan deben ejecutarse sobre el mismo `conn`.
+    """
+    conn.execute(text(f"IF OBJECT_ID('tempdb..{KEYS_TABLE}') IS NOT NULL DROP TABLE {KEYS_TABLE}"))
+    conn.execute(text(_CREATE_KEYS))
+    for start in range(0, len(keys), _INSERT_BATCH):
+        batch = keys[start:start + _INSERT_BATCH]
+        values = ", ".join(f"(:u{i}, :t{i})" for i in range(len(batch)))
+        params = {}
+        for i, (user_id, transport_id) in enumerate(batch):
+            params[f"u{i}"] = user_id
+            params[f"t{i}"] = transport_id
+        conn.execute(text(f"INSERT INTO {KEYS_TABLE} (user_id, transport_id) VALUES {values}"), params)
+
+
+def fetch_by_keys(engine, keys_df, queries, user_col="user_id", transport_col="transport_id"):
+    """
+    Ejecuta cada consulta de `queries` (`{nombre: sql}`) contra `#keys` y devuelve
+    `{nombre: DataFrame}`.
+
+    Todas las consultas comparten una única conexión y una única carga de claves.
+    Cada `sql` debe devolver las columnas `user_id` y `transport_id` de `#keys` y una
+    columna `found` no nula cuando la tabla tiene fila para la clave.
+    """
+    keys = unique_keys(keys_df, user_col, transport_col)
+    if not keys:
+        return {name: pd.DataFrame(columns=["user_id", "transport_id", "found"]) for name in queries}
+    with engine.connect() as conn:
+        load_keys(conn, keys)
+        return {name: pd.read_sql(text(sql), conn) for name, sql in queries.items()}
+
+
+def rows_by_key(result_df, columns):
+    """
+    Indexa `result_df` por clave: `{(user_id, transport_id): {col: valor}}`.
+
+    Las claves sin fila en la tabla consultada (`found` nulo tras el `OUTER APPLY`)
+    quedan afuera, para que el notebook las marque como faltantes.
+    """
+    found = result_df[result_df["found"].notna()]
+    return {
+        normalize_key(row["user_id"], row["transport_id"]): {col: row[col] for col in columns}
+        for row in found.to_dict("records")
+    }
+
+
+def align_to_keys(keys_df, matches, build_row, missing_row, user_col="user_id", transport_col="transport_id"):
+    """
+    Arma un DataFrame con una fila por fila de `keys_df`, en el mismo orden.
+
+    Para cada clave se llama a `build_row(user_id, transport_id, match)` si aparece en
+    `matches` (ver `rows_by_key`) o a `missing_row(user_id, transport_id)` si no.
+    """
+    rows = []
+    for user_id, transport_id in keys_df[[user_col, transport_col]].itertuples(index=False, name=None):
+        match = matches.get(normalize_key(user_id, transport_id))
+        rows.append(build_row(user_id, transport_id, match) if match is not None else missing_row(user_id, transport_id))
+    return pd.DataFrame(rows)
+
+
+def error_rows(keys_df, error, user_col="user_id", transport_col="transport_id"):
+    """Filas `{user_id, transport_id, error}` para todas las claves, cuando falla la consulta por lote."""
+    return pd.DataFrame([
+        {"user_id": user_id, "transport_id": transport_id, "error": str(error)}
+        for user_id, transport_id in keys_df[[user_col, transport_col]].itertuples(index=False, name=None)
+    ])
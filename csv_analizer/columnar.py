@@ -0,0 +1,66 @@
+"""
+Lectura/escritura columnar (Parquet) para los datasets de `../csv`.
+
+Parquet conserva los dtypes `category`/`string` que se pierden en un CSV, ocupa
+bastante menos disco y permite leer sólo las columnas (y particiones) necesarias.
+Los notebooks usan `read_table` para preferir la versión Parquet de un dataset y
+caer al CSV cuando sólo existe ese formato.
+
+Requiere `pyarrow`.
+"""
+import os
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+
+def parquet_path(base_dir, name):
+    """Ruta del dataset Parquet `name` (archivo `<name>.parquet` o directorio particionado `<name>/`)."""
+    file_path = os.path.join(base_dir, f"{name}.parquet")
+    if os.path.exists(file_path):
+        return file_path
+    dir_path = os.path.join(base_dir, name)
+    if os.path.isdir(dir_path) and dataset_exists(dir_path):
+        return dir_path
+    return None
+
+
+def dataset_exists(path):
+    """Indica si `path` es un archivo Parquet o un directorio con al menos un archivo Parquet."""
+    if os.path.isfile(path):
+        return path.endswith(".parquet")
+    for _root, _dirs, files in os.walk(path):
+        if any(f.endswith(".parquet") and not f.startswith((".", "_")) for f in files):
+            return True
+    return False
+
+
+def table_exists(base_dir, name):
+    """Indica si existe el dataset `name` en Parquet o en CSV."""
+    return parquet_path(base_dir, name) is not None or os.path.exists(os.path.join(base_dir, f"{name}.csv"))
+
+
+def read_table(base_dir, name, columns=None, filters=None):
+    """
+    Lee el dataset `name` de `base_dir` con sólo las `columns` pedidas.
+
+    Prefiere `<name>.parquet` o el directorio particionado `<name>/`; si no existen lee
+    `<name>.csv` (con `usecols`, sin `filters`). Devuelve `None` si no hay ninguno.
+    """
+    path = parquet_path(base_dir, name)
+    if path is not None:
+        return pd.read_parquet(path, columns=columns, filters=filters)
+    csv_path = os.path.join(base_dir, f"{name}.csv")
+    if os.path.exists(csv_path):
+        return pd.read_csv(csv_path, usecols=columns)
+    return None
+
+
+def write_parquet_atomic(df, path):
+    """Escribe `df` en `path` pasando por un temporal oculto, para no dejar archivos truncados."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = os.path.join(os.path.dirname(path), f".{os.path.basename(path)}.tmp")
+    pq.write_table(pa.Table.from_pandas(df, preserve_index=False), tmp_path)
+    os.replace(tmp_path, path)
+    return path
@@ -0,0 +1,157 @@
+"""
+Verificación de consistencia de transportes contra las tablas de resultados.
+
+Para cada viaje `(user_id, transport_id)` de `transports.csv` indica si existe al
+menos una fila en cada tabla de resultados (`Conduccion`, `Eventos`, ...). Las
+claves se cargan una vez en la tabla temporal `#keys` (ver `batch_queries`) y la
+presencia se resuelve con una consulta `EXISTS` por tabla, en lugar de un
+`SELECT COUNT(*)` por viaje y por tabla.
+
+Se usa desde `primary_scores.py` y también por consola, para jobs nocturnos:
+
+    python consistency.py [../csv/transports.csv [salida.csv]]
+
+Código de salida: 0 si todos los viajes están en todas las tablas, 2 si alguno falta
+(o falló la consulta de alguna tabla) y 3 si no se pudo consultar la base.
+
+Por consola sólo se leen las columnas `user_id` y `transport_id`, así que la matriz
+guardada tiene las claves y una columna por tabla. Un archivo indicado se lee tal
+cual (Parquet si termina en `.parquet`, si no CSV); sin argumentos se usa el dataset
+`transports` de `../csv` vía `columnar.read_table`, que prefiere la versión Parquet.
+
+Las credenciales se leen de `../marimo_lab/.env` (`DB_SERVER`, `DB_NAME`, `DB_USER`,
+`DB_PASS`, `DB_PORT`), igual que en los notebooks.
+"""
+import os
+import sys
+
+import pandas as pd
+from sqlalchemy import text
+
+import batch_queries
+import columnar
+
+# `sentiance_common` vive en la raíz del repositorio (un nivel arriba de csv_analizer/)
+_REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if _REPO_ROOT not in sys.path:
+    sys.path.insert(0, _REPO_ROOT)
+
+from sentiance_common import db
+
+TABLES_TO_CHECK = (
+    "Conduccion",
+    "Eventos",
+    "EventosSignificantes",
+    "PuntajesPrirmariosTr",
+    "PuntajesSecundariosTr",
+    "Recorridos",
+    "Transporte",
+)
+
+PRESENT, MISSING, ERROR = "✓", "✗", "Error"
+
+_EXISTS_QUERY = """
+SELECT k.user_id, k.transport_id
+FROM {keys} k
+WHERE EXISTS (SELECT 1 FROM {table} t WHERE t.usuario = k.user_id AND t.viaje = k.transport_id)
+"""
+
+
+def check_consistency(engine, keys_df, tables=TABLES_TO_CHECK, user_col="user_id", transport_col="transport_id"):
+    """
+    Devuelve la matriz de consistencia: las columnas de `keys_df` más una por tabla
+    con `✓` (hay filas para el viaje), `✗` (no hay) o `Error` (falló la consulta de esa tabla).
+
+    Si falla la conexión o la carga de claves, todas las celdas quedan en `Error` y se
+    agrega la columna `error` con el mensaje (como `batch_queries.error_rows`).
+    """
+    matrix = keys_df.reset_index(drop=True).copy()
+    keys = batch_queries.unique_keys(keys_df, user_col, transport_col)
+    row_keys = [batch_queries.normalize_key(u, t) for u, t in matrix[[user_col, transport_col]].itertuples(index=False, name=None)]
+
+    if not keys:
+        for table in tables:
+            matrix[table] = MISSING
+        return matrix
+
+    try:
+        with engine.connect() as conn:
+            batch_queries.load_keys(conn, keys)
+            for table in tables:
+                try:
+                    found = pd.read_sql(text(_EXISTS_QUERY.format(keys=batch_queries.KEYS_TABLE, table=table)), conn)
+                except Exception:
+                    matrix[table] = ERROR
+                    continue
+                present = {batch_queries.normalize_key(u, t) for u, t in found[["user_id", "transport_id"]].itertuples(index=False, name=None)}
+                matrix[table] = [PRESENT if key in present else MISSING for key in row_keys]
+    except Exception as e:
+        # Sin conexión o sin tabla de claves no se pudo verificar ninguna tabla
+        for table in tables:
+            matrix[table] = ERROR
+        matrix["error"] = str(e)
+    return matrix
+
+
+def summarize(matrix, tables=TABLES_TO_CHECK):
+    """Conteos agregados por tabla: viajes presentes, faltantes, con error y % de cobertura."""
+    total = len(matrix)
+    rows = []
+    for table in tables:
+        counts = matrix[table].value_counts()
+        present = int(counts.get(PRESENT, 0))
+        rows.append({
+            "tabla": table,
+            "presentes": present,
+            "faltantes": int(counts.get(MISSING, 0)),
+            "errores": int(counts.get(ERROR, 0)),
+            "cobertura_pct": round(present / total * 100, 1) if total else 0.0,
+        })
+    return pd.DataFrame(rows)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 3 or any(arg in ("-h", "--help") for arg in sys.argv[1:]):
+        print("Usage: python consistency.py [transports.csv|transports.parquet [output_csv]]")
+        sys.exit(1)
+
+    input_path = sys.argv[1] if len(sys.argv) > 1 else None
+    output_path = sys.argv[2] if len(sys.argv) > 2 else None
+
+    db.load_env()
+    engine = db.get_engine()
+    if engine is None:
+        print("❌ Set DB_SERVER, DB_NAME, DB_USER and DB_PASS in ../marimo_lab/.env")
+        sys.exit(1)
+
+    # Sólo hacen falta las claves
+    key_columns = ["user_id", "transport_id"]
+    if input_path is None:
+        # Dataset por defecto: `transports.parquet` si existe, si no `transports.csv`
+        default_dir = os.path.join(_REPO_ROOT, "csv")
+        trans_df = columnar.read_table(default_dir, "transports", columns=key_columns)
+        if trans_df is None:
+            print(f"❌ No existe transports.parquet ni transports.csv en {default_dir}")
+            sys.exit(1)
+    elif not os.path.exists(input_path):
+        print(f"❌ No existe {input_path}")
+        sys.exit(1)
+    elif input_path.endswith(".parquet") or os.path.isdir(input_path):
+        trans_df = pd.read_parquet(input_path, columns=key_columns)
+    else:
+        trans_df = pd.read_csv(input_path, usecols=key_columns)
+
+    matrix = check_consistency(engine, trans_df)
+    if "error" in matrix.columns:
+        print(f"❌ No se pudo consultar la base de datos: {matrix['error'].iloc[0]}")
+        sys.exit(3)
+    summary = summarize(matrix)
+    print(f"Viajes verificados: {len(matrix)}")
+    print(summary.to_string(index=False))
+
+    if output_path:
+        matrix.to_csv(output_path, index=False)
+        print(f"✅ Matriz de consistencia guardada en {output_path}")
+
+    # Código de salida distinto de 0 si algún viaje falta (o falló) en alguna tabla
+    sys.exit(0 if (summary["faltantes"] + summary["errores"]).sum() == 0 else 2)
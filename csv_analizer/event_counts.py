@@ -0,0 +1,135 @@
+"""
+Conteo vectorizado de eventos de manejo en `driving_events_all.csv` / `driving_events_significant.csv`.
+
+Cada columna de evento guarda una lista JSON de objetos planos por viaje, y para la
+comparativa sólo hace falta su largo. En lugar de recorrer el DataFrame con
+`iterrows()` y decodificar cada celda, se procesa columna por columna y el largo se
+obtiene contando objetos sobre el texto crudo, una vez validada la forma de la celda
+con una gramática (una llave dentro de un valor de texto no altera el conteo). Sólo
+las celdas que no tienen la forma esperada (objetos anidados, listas de otro tipo,
+espacios entre objetos) pasan por el parser JSON, con el mismo resultado que el
+conteo original.
+
+Los resultados se cachean en memoria por `(ruta, mtime, tamaño)` del archivo, así
+que volver a ejecutar la celda no relee ni recuenta un CSV que no cambió.
+"""
+import os
+import re
+import sys
+
+import pandas as pd
+
+# `sentiance_common` vive en la raíz del repositorio (un nivel arriba de csv_analizer/)
+_REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if _REPO_ROOT not in sys.path:
+    sys.path.insert(0, _REPO_ROOT)
+
+from sentiance_common import fastjson
+
+EVENT_COLUMNS = ['accelerating', 'phone_handling', 'turning', 'mounted', 'braking', 'speeding', 'calls', 'screens']
+
+# (ruta absoluta) -> ((mtime_ns, size), DataFrame de eventos, DataFrame de conteos)
+_cache = {}
+
+
+def _count_with_parser(value):
+    # Mismo criterio que el conteo original: lo que no se puede parsear cuenta 0
+    try:
+        # Marimo/Pandas a veces escapa las comillas de forma distinta
+        # Reemplazar "" por " si es necesario, pero json.loads suele manejarlo si viene del CSV bien
+        return len(fastjson.loads(value))
+    except Exception:
+        return 0
+
+
+# Gramática de la forma habitual de las celdas: lista compacta de objetos planos
+# (`[{"k":v,...},...]`, valores escalares). Las celdas que la cumplen se cuentan
+# sin decodificar, contando coincidencias del patrón de objeto completo: cada una
+# consume sus textos entre comillas enteros, así que una llave dentro de un valor
+# no altera el conteo.
+_STRING = r'"(?:[^"\\\x00-\x1f]|\\(?:["\\/bfnrt]|u[0-9a-fA-F]{4}))*"'
+_SCALAR = rf'(?:{_STRING}|-?(?:0|[1-9]\d*)(?:\.\d+)?(?:[eE][+-]?\d+)?|true|false|null)'
+_OBJECT = rf'\{{(?:{_STRING}:{_SCALAR}(?:,{_STRING}:{_SCALAR})*)?\}}'
+FLAT_LIST_PATTERN = rf'\[{_OBJECT}(?:,{_OBJECT})*\]'
+_FLAT_LIST_RE = re.compile(FLAT_LIST_PATTERN)
+_OBJECT_RE = re.compile(_OBJECT)
+
+
+def _count_cell(value):
+    """
+    Cantidad de eventos de una celda (misma regla que `count_column`, de a una celda).
+
+    >>> _count_cell('[{"a":1},{"a":2}]')
+    2
+    >>> _count_cell('[{"a":"},{"}]')
+    1
+    >>> _count_cell('[{"a":{"b":1}}]')
+    1
+    >>> _count_cell('no es json')
+    0
+    """
+    if not isinstance(value, str):
+        return 0 if value is None or value != value else _count_with_parser(value)
+    value = value.strip()
+    if value == "" or value == "[]":
+        return 0
+    if _FLAT_LIST_RE.fullmatch(value):
+        return len(_OBJECT_RE.findall(value))
+    return _count_with_parser(value)
+
+
+def count_column(values):
+    """
+    Cantidad de eventos de cada celda de una columna de listas JSON.
+
+    Se trabaja sobre la columna entera con los métodos `.str` de pandas: las
+    celdas con la forma habitual se cuentan con la gramática de arriba y sólo el
+    resto (objetos anidados, espacios, texto inválido) pasa por el parser.
+
+    >>> count_column(pd.Series(['[{"a":"},{"}]', '[{"a":1},{"b":"x"}]', None, '[]'])).tolist()
+    [1, 2, 0, 0]
+    """
+    text = values.astype("string").str.strip()
+    flat = text.str.fullmatch(FLAT_LIST_PATTERN).fillna(False).astype(bool)
+
+    counts = pd.Series(0, index=values.index, dtype="int64")
+    if flat.any():
+        counts[flat] = text[flat].str.count(_OBJECT).astype("int64")
+    rest = ~flat & text.notna() & (text != "") & (text != "[]")
+    if rest.any():
+        counts[rest] = [_count_with_parser(v) for v in values[rest].tolist()]
+    return counts
+
+
+def count_events(events_df, event_cols=EVENT_COLUMNS):
+    """Conteo por viaje (`user_id`, `transport_id`) de cada columna de eventos presente en `events_df`."""
+    if events_df is None:
+        return None
+    counts = events_df[['user_id', 'transport_id']].copy()
+    for col in event_cols:
+        counts[col] = count_column(events_df[col]) if col in events_df.columns else 0
+    return counts.reset_index(drop=True)
+
+
+def load_event_counts(path, event_cols=EVENT_COLUMNS):
+    """
+    Lee el CSV de eventos en `path` y devuelve `(events_df, counts_df)`, o `(None, None)` si no existe.
+
+    Se reutiliza el resultado previo mientras el archivo conserve su mtime y tamaño.
+    """
+    path = os.path.abspath(path)
+    try:
+        stat = os.stat(path)
+    except OSError:
+        _cache.pop(path, None)
+        return None, None
+
+    stamp = (stat.st_mtime_ns, stat.st_size)
+    cached = _cache.get(path)
+    if cached is not None and cached[0] == stamp:
+        return cached[1], cached[2]
+
+    events_df = pd.read_csv(path)
+    counts_df = count_events(events_df, event_cols)
+    _cache[path] = (stamp, events_df, counts_df)
+    return events_df, counts_df
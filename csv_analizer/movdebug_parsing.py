@@ -0,0 +1,115 @@
+"""
+Parseo y aplanado de los payloads JSON de `MovDebug_Eventos`.
+
+Las funciones viven en un módulo (y no dentro de una celda del notebook) para que los
+procesos del `ProcessPoolExecutor` de `movdebug_trips_extractor.py` puedan importarlas:
+los workers reciben tandas de filas crudas `(id, tipo, sentianceid, JSON)` y devuelven
+las instancias de viaje `IN_TRANSPORT` ya aplanadas, en el mismo orden de entrada.
+"""
+import os
+import sys
+
+# `sentiance_common` vive en la raíz del repositorio (un nivel arriba de csv_analizer/)
+_REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if _REPO_ROOT not in sys.path:
+    sys.path.insert(0, _REPO_ROOT)
+
+from sentiance_common import fastjson, polyline
+
+TIPOS_TARGET = (
+    "DrivingInsights",
+    "UserContextUpdate",
+    "requestUserContext",
+    "TimelineUpdateListener",
+    "TimelineEventById",
+)
+
+
+def _waypoints_polyline(waypoints, polyline_options):
+    # Con msgspec cada waypoint llega como `Raw` sin decodificar: se decodifica sólo al pedir la polyline
+    decoded = [wp if isinstance(wp, dict) else fastjson.loads(bytes(wp)) for wp in waypoints or []]
+    return polyline.encode_waypoints(decoded, **polyline_options)
+
+
+def _trip_row(db_record_id, tipo, user_id, criteria, event, polyline_options=None):
+    """
+    Arma la fila aplanada de una instancia de viaje a partir del evento de transporte.
+
+    Con `polyline_options` (argumentos de `polyline.encode_waypoints`, puede ser `{}`)
+    se agrega la columna `polyline` con el recorrido codificado, como `Recorridos.polyline`.
+    """
+    row = {
+        "db_record_id": db_record_id,
+        "source_tipo": tipo,
+        "source_criteria": ",".join(criteria) if isinstance(criteria, list) else "",
+        "user_id": user_id,
+        "trip_id": event.id,
+        "transportMode": event.transportMode,
+        "isProvisional": event.isProvisional,
+        "startTime": event.startTime,
+        "endTime": event.endTime,
+        "distance": event.distance,
+        "durationInSeconds": event.durationInSeconds,
+        # Los waypoints sólo se cuentan: el decodificador tipado no los materializa
+        "waypoints_count": len(event.waypoints or []),
+    }
+    if polyline_options is not None:
+        row["polyline"] = _waypoints_polyline(event.waypoints, polyline_options)
+    return row
+
+
+def extract_trip_instances(db_record_id, tipo, user_id, raw_json, polyline_options=None):
+    """
+    Devuelve la lista de instancias de viaje `IN_TRANSPORT` contenidas en un registro.
+
+    Cada payload se decodifica directamente a la estructura tipada de su `tipo`,
+    salteando los campos que no se usan. Registros vacíos o con JSON inválido
+    devuelven una lista vacía. `polyline_options` se pasa a cada fila (ver `_trip_row`).
+    """
+    if not isinstance(raw_json, (str, bytes)) or not raw_json:
+        return []
+
+    trips = []
+
+    try:
+        # Logic depending on type
+        if tipo == "DrivingInsights":
+            parsed = fastjson.decode(raw_json, fastjson.DrivingInsightsTrip)
+            transport_event = parsed.transportEvent if parsed else None
+            if transport_event and transport_event.type == "IN_TRANSPORT":
+                trips.append(_trip_row(db_record_id, tipo, user_id, parsed.criteria, transport_event, polyline_options))
+
+        elif tipo in ("UserContextUpdate", "requestUserContext"):
+            parsed = fastjson.decode(raw_json, fastjson.UserContextTrips)
+            if parsed is None:
+                return []
+            # Looking inside events array or userContext.events array
+            events = parsed.events
+            if events is None and parsed.userContext is not None:
+                events = parsed.userContext.events
+
+            for event in events or []:
+                if event is not None and event.type == "IN_TRANSPORT":
+                    trips.append(_trip_row(db_record_id, tipo, user_id, parsed.criteria, event, polyline_options))
+
+        elif tipo in ("TimelineUpdateListener", "TimelineEventById"):
+            parsed = fastjson.decode(raw_json, fastjson.TimelineTrip)
+            if parsed is not None and parsed.type == "IN_TRANSPORT":
+                trips.append(_trip_row(db_record_id, tipo, user_id, parsed.criteria, parsed, polyline_options))
+    except fastjson.JSONDecodeError:
+        return []
+
+    return trips
+
+def parse_records(records, polyline_options=None):
+    """
+    Parsea una tanda de filas `(id, tipo, sentianceid, JSON)` y devuelve sus instancias de viaje.
+
+    Es la unidad de trabajo que se envía a cada proceso del pool; el orden de salida
+    respeta el orden de `records` (y por lo tanto el de `db_record_id`). Con
+    `polyline_options` cada instancia lleva además su columna `polyline`.
+    """
+    trips = []
+    for db_record_id, tipo, user_id, raw_json in records:
+        trips.extend(extract_trip_instances(int(db_record_id), tipo, user_id, raw_json, polyline_options))
+    return trips
@@ -0,0 +1,116 @@
+"""
+Extracción de viajes con filtrado y proyección del JSON del lado de SQL Server.
+
+En lugar de traer por la red el `JSON` completo de cada fila candidata de
+`MovDebug_Eventos` para filtrar `IN_TRANSPORT` en Python, esta consulta usa
+`OPENJSON`/`JSON_QUERY` para:
+- filtrar `transportEvent.type` (DrivingInsights), `events[].type` /
+  `userContext.events[].type` (UserContextUpdate, requestUserContext) y el `type`
+  raíz (TimelineUpdateListener, TimelineEventById),
+- devolver sólo las columnas aplanadas que usa `movdebug_trips_extractor.py`,
+  incluida la cantidad de waypoints (sin transferir los waypoints).
+
+Si se pide la columna `polyline`, `PUSHDOWN_DATA_QUERY_WAYPOINTS` trae además el
+array `waypoints` de cada viaje (sólo ese fragmento del JSON) y
+`normalize_pushdown_chunk` lo codifica como en `movdebug_parsing`.
+
+Requiere SQL Server 2017+ (`STRING_AGG`) con nivel de compatibilidad >= 130 (`OPENJSON`).
+"""
+from movdebug_parsing import TIPOS_TARGET
+from sentiance_common import fastjson, polyline
+
+_TIPOS_SQL = ", ".join(f"'{t}'" for t in TIPOS_TARGET)
+
+# Esquema común con el que OPENJSON proyecta cada evento de transporte
+_EVENT_SCHEMA = """
+        WITH (
+            trip_id nvarchar(200) '$.id',
+            type nvarchar(50) '$.type',
+            transportMode nvarchar(50) '$.transportMode',
+            isProvisional bit '$.isProvisional',
+            startTime nvarchar(50) '$.startTime',
+            endTime nvarchar(50) '$.endTime',
+            distance float '$.distance',
+            durationInSeconds float '$.durationInSeconds',
+            waypoints nvarchar(max) '$.waypoints' AS JSON
+        )"""
+
+# Cantidad de filas candidatas y techo de `id` para esta corrida (la consulta de datos
+# se acota a ese techo para que la marca de agua no se saltee filas insertadas en el medio)
+PUSHDOWN_COUNT_QUERY = f"""
+SELECT COUNT(*) AS total, MAX(id) AS max_id
+FROM MovDebug_Eventos
+WHERE tipo IN ({_TIPOS_SQL}) AND id > :last_id
+"""
+
+_DATA_QUERY_TEMPLATE = f"""
+SELECT
+    e.id AS db_record_id,
+    e.tipo AS source_tipo,
+    ISNULL((
+        SELECT STRING_AGG(CAST(cr.value AS nvarchar(max)), ',') WITHIN GROUP (ORDER BY CAST(cr.[key] AS int))
+        FROM OPENJSON(JSON_QUERY(j.doc, '$.criteria')) cr
+    ), '') AS source_criteria,
+    e.sentianceid AS user_id,
+    ev.trip_id,
+    ev.transportMode,
+    ev.isProvisional,
+    ev.startTime,
+    ev.endTime,
+    ev.distance,
+    ev.durationInSeconds,
+    (SELECT COUNT(*) FROM OPENJSON(ev.waypoints)) AS waypoints_count{{extra_columns}}
+FROM MovDebug_Eventos e
+-- CASE garantiza que las funciones JSON nunca se evalúen sobre texto inválido
+CROSS APPLY (SELECT CASE WHEN ISJSON(e.JSON) = 1 THEN e.JSON END AS doc) j
+CROSS APPLY (
+    SELECT * FROM OPENJSON(JSON_QUERY(j.doc, '$.transportEvent')){_EVENT_SCHEMA}
+    WHERE e.tipo = 'DrivingInsights'
+    UNION ALL
+    SELECT * FROM OPENJSON(COALESCE(JSON_QUERY(j.doc, '$.events'), JSON_QUERY(j.doc, '$.userContext.events'))){_EVENT_SCHEMA}
+    WHERE e.tipo IN ('UserContextUpdate', 'requestUserContext')
+    UNION ALL
+    SELECT * FROM OPENJSON(j.doc){_EVENT_SCHEMA}
+    WHERE e.tipo IN ('TimelineUpdateListener', 'TimelineEventById')
+) ev
+WHERE e.tipo IN ({_TIPOS_SQL})
+    AND e.id > :last_id AND e.id <= :max_id
+    AND j.doc IS NOT NULL
+    AND ev.type = 'IN_TRANSPORT'
+ORDER BY e.id ASC
+"""
+
+PUSHDOWN_DATA_QUERY = _DATA_QUERY_TEMPLATE.format(extra_columns="")
+# Variante para la columna `polyline`: transfiere también los waypoints de cada viaje
+PUSHDOWN_DATA_QUERY_WAYPOINTS = _DATA_QUERY_TEMPLATE.format(extra_columns=",\n    ev.waypoints")
+
+
+def _as_json_number(value):
+    # OPENJSON proyecta los números como float: los enteros vuelven a int, como con json.loads
+    if value is None or value != value:
+        return None
+    return int(value) if float(value).is_integer() else float(value)
+
+
+def normalize_pushdown_chunk(chunk, polyline_options=None):
+    """
+    Convierte un chunk devuelto por `PUSHDOWN_DATA_QUERY` en filas con la misma forma
+    que produce `movdebug_parsing.extract_trip_instances`.
+
+    Con `polyline_options` el chunk tiene que venir de `PUSHDOWN_DATA_QUERY_WAYPOINTS`:
+    los waypoints se reemplazan por la columna `polyline`.
+    """
+    trips = chunk.to_dict("records")
+    for trip in trips:
+        waypoints = trip.pop("waypoints", None)
+        if polyline_options is not None:
+            decoded = fastjson.loads(waypoints) if isinstance(waypoints, (str, bytes)) and waypoints else []
+            trip["polyline"] = polyline.encode_waypoints(decoded, **polyline_options)
+        trip["db_record_id"] = int(trip["db_record_id"])
+        trip["waypoints_count"] = int(trip["waypoints_count"])
+        # `bit` llega como 0/1 (o bool según el driver): normalizar a bool como en el JSON
+        provisional = trip["isProvisional"]
+        trip["isProvisional"] = None if provisional is None or provisional != provisional else bool(provisional)
+        trip["distance"] = _as_json_number(trip["distance"])
+        trip["durationInSeconds"] = _as_json_number(trip["durationInSeconds"])
+    return trips
@@ -0,0 +1,187 @@
+"""
+Almacén incremental de instancias de viaje extraídas de `MovDebug_Eventos`.
+
+`MovDebug_Eventos` sólo crece por `id`, así que no hace falta volver a leer la tabla
+completa en cada corrida de `movdebug_trips_extractor.py`. Este módulo persiste, junto
+al dataset exportado, una marca de agua (`last_id`: el último `id` procesado) para que
+el extractor consulte únicamente `WHERE id > :last_id` y combine las filas nuevas con
+las instancias de viaje ya extraídas.
+
+Archivos que mantiene (dentro de `store_dir`, normalmente `../csv`):
+- `movdebug_all_trip_instances/`: dataset Parquet acumulado de instancias de viaje,
+  particionado por fecha de extracción (`extraction_date=YYYY-MM-DD/`). Cada corrida
+  agrega un archivo `part-<id_min>-<id_max>.parquet` sólo con sus filas nuevas, sin
+  reescribir lo ya almacenado; una re-extracción completa reemplaza el dataset entero.
+- `movdebug_watermark.json`: marca de agua con el último `id` procesado.
+
+Parquet conserva los dtypes `category`/`string` entre corridas y permite a los
+notebooks leer sólo las columnas que usan (`load_trip_instances(..., columns=[...])`).
+"""
+import json
+import os
+import shutil
+from datetime import date, datetime
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from columnar import dataset_exists, write_parquet_atomic
+
+TRIPS_DIRNAME = "movdebug_all_trip_instances"
+WATERMARK_FILENAME = "movdebug_watermark.json"
+PARTITION_COLUMN = "extraction_date"
+DEDUP_KEY = ["db_record_id", "source_tipo", "trip_id"]
+
+# Dtypes fijos del dataset: todas las particiones deben compartir el mismo esquema
+# aunque una tanda traiga columnas enteramente nulas
+TRIP_DTYPES = {
+    "db_record_id": "int64",
+    "source_tipo": "category",
+    "source_criteria": "string",
+    "user_id": "string",
+    "trip_id": "string",
+    "transportMode": "category",
+    "isProvisional": "boolean",
+    "startTime": "string",
+    "endTime": "string",
+    "distance": "float64",
+    "durationInSeconds": "float64",
+    "waypoints_count": "int64",
+    # Sólo presente si la extracción se hizo con `polyline_options`
+    "polyline": "string",
+}
+
+# Tipo Arrow con el que se lee cada dtype de `TRIP_DTYPES` (las categorías se leen como texto)
+_ARROW_TYPES = {
+    "int64": pa.int64(),
+    "float64": pa.float64(),
+    "boolean": pa.bool_(),
+    "string": pa.string(),
+    "category": pa.string(),
+}
+
+
+def trips_path(store_dir):
+    """Ruta absoluta del dataset acumulado de instancias de viaje."""
+    return os.path.abspath(os.path.join(store_dir, TRIPS_DIRNAME))
+
+
+def watermark_path(store_dir):
+    """Ruta absoluta del archivo con la marca de agua."""
+    return os.path.abspath(os.path.join(store_dir, WATERMARK_FILENAME))
+
+
+def load_watermark(store_dir):
+    """
+    Devuelve el último `id` procesado, o 0 si hay que hacer una extracción completa.
+
+    Si falta el dataset acumulado (o la marca de agua está corrupta) se vuelve a 0:
+    una marca de agua sin los datos que la respaldan haría perder viajes.
+    """
+    if not dataset_exists(trips_path(store_dir)):
+        return 0
+    try:
+        with open(watermark_path(store_dir), "r", encoding="utf-8") as f:
+            return int(json.load(f).get("last_id", 0))
+    except (OSError, ValueError, TypeError, AttributeError):
+        return 0
+
+
+def save_watermark(store_dir, last_id):
+    """Persiste la marca de agua de forma atómica (escritura a temporal + rename)."""
+    path = watermark_path(store_dir)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"last_id": int(last_id), "updated_at": datetime.now().isoformat(timespec="seconds")}, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def trips_schema():
+    """Esquema unificado del dataset: las columnas de `TRIP_DTYPES` más la de partición."""
+    fields = [pa.field(column, _ARROW_TYPES[dtype]) for column, dtype in TRIP_DTYPES.items()]
+    return pa.schema(fields + [pa.field(PARTITION_COLUMN, pa.string())])
+
+
+def load_trip_instances(store_dir, columns=None, filters=None):
+    """
+    Carga el dataset acumulado, o `None` si todavía no existe.
+
+    `columns` limita las columnas leídas y `filters` acepta filtros de pyarrow (por
+    ejemplo `[("extraction_date", ">=", "2024-01-01")]`). Si se leen las columnas de
+    la clave, se descartan los duplicados que pudiera dejar una corrida abortada.
+    La columna de partición sólo se devuelve si se pide explícitamente en `columns`.
+
+    Se lee con el esquema fijo de `trips_schema()` y no con el del primer archivo
+    encontrado: así las particiones escritas sin `polyline` y las escritas con ella
+    se combinan sin perder la columna (queda nula en las filas que no la tienen).
+    """
+    path = trips_path(store_dir)
+    if not dataset_exists(path):
+        return None
+    dataset = ds.dataset(path, format="parquet", schema=trips_schema(), partitioning="hive")
+    expression = pq.filters_to_expression(filters) if filters else None
+    df = coerce_trip_dtypes(dataset.to_table(columns=columns, filter=expression).to_pandas())
+    if columns is None:
+        df = df.drop(columns=PARTITION_COLUMN)
+    if all(c in df.columns for c in DEDUP_KEY):
+        df = df[~df[DEDUP_KEY].astype(str).duplicated(keep="last")].reset_index(drop=True)
+    return df
+
+
+def coerce_trip_dtypes(df):
+    """Devuelve una copia de `df` con los dtypes de `TRIP_DTYPES` (columnas extra quedan igual)."""
+    df = df.copy()
+    if "transportMode" in df.columns:
+        df["transportMode"] = df["transportMode"].fillna("UNAVAILABLE")
+    for column, dtype in TRIP_DTYPES.items():
+        if column in df.columns:
+            df[column] = df[column].astype(dtype)
+    return df
+
+
+def append_trip_instances(new_df, store_dir, replace=False):
+    """
+    Agrega `new_df` al dataset como una partición nueva y devuelve la ruta escrita.
+
+    Sólo se escriben las filas nuevas, en `extraction_date=<hoy>/part-<id_min>-<id_max>.parquet`,
+    pasando por un temporal para que una corrida interrumpida nunca deje un archivo
+    truncado junto a una marca de agua que ya lo da por completo. Con `replace=True`
+    (re-extracción completa) el dataset se arma en un directorio aparte y reemplaza
+    al anterior recién al final.
+    """
+    root = trips_path(store_dir)
+    target_root = f"{root}.rebuild" if replace else root
+    if replace and os.path.exists(target_root):
+        shutil.rmtree(target_root)
+
+    df = coerce_trip_dtypes(new_df)
+    ids = df["db_record_id"]
+    partition_dir = os.path.join(target_root, f"{PARTITION_COLUMN}={date.today().isoformat()}")
+    path = write_parquet_atomic(df, os.path.join(partition_dir, f"part-{ids.min()}-{ids.max()}.parquet"))
+
+    if replace:
+        if os.path.exists(root):
+            shutil.rmtree(root)
+        os.replace(target_root, root)
+        path = os.path.join(root, os.path.relpath(path, target_root))
+    return path
+
+
+def merge_trip_instances(stored_df, new_df):
+    """
+    Combina las instancias ya almacenadas con las recién extraídas.
+
+    Las filas nuevas siempre tienen `db_record_id` mayor a la marca de agua, pero se
+    deduplica igual por (`db_record_id`, `source_tipo`, `trip_id`) por si el almacén y
+    la marca de agua quedaron desfasados tras una corrida abortada.
+    """
+    frames = [f for f in (stored_df, new_df) if f is not None and len(f) > 0]
+    if not frames:
+        return None
+    merged = pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+    # Comparar como texto para que los ids leídos del CSV coincidan con los de la DB
+    key = merged[DEDUP_KEY].astype(str)
+    return merged[~key.duplicated(keep="last")].reset_index(drop=True)
@@ -8,14 +8,16 @@ Este notebook interactivo extrae, procesa y analiza eventos vinculados a viajes
 1. **Extracción unificada:** Filtra eventos relevantes (`DrivingInsights`, `UserContextUpdate`, etc.) y parsea su contenido JSON para desanidar y aplanar los detalles del viaje.
 2. **Seguimiento cronológico:** Agrupa múltiples registros de base de datos que referencian al mismo `trip_id`, permitiendo observar cómo la plataforma reporta y actualiza los metadatos de un viaje específico a lo largo del tiempo.
 3. **Análisis de Cobertura (Matriz):** Documenta y compara si los viajes reportados vía la API de `DrivingInsights` también ingresan correctamente bajo `UserContextUpdate` (con el trigger `CURRENT_EVENT`), facilitando la detección de brechas.
-4. **Exportación:** Exporta automáticamente el dataset resultante como un archivo procesado a `../csv/movdebug_all_trip_instances.csv`.
+4. **Exportación:** Exporta automáticamente el dataset resultante como un dataset Parquet particionado por fecha de extracción en `../csv/movdebug_all_trip_instances/` (conserva los tipos `category`/`string` y permite leer sólo las columnas necesarias).
+5. **Extracción incremental:** Guarda en `../csv/movdebug_watermark.json` el último `id` procesado; las corridas siguientes sólo leen las filas nuevas (`id > last_id`) y las agregan como una partición nueva del dataset existente.
+6. **Filtrado en el servidor (opcional):** El modo "Filtrado en SQL Server" usa `OPENJSON`/`JSON_QUERY` para filtrar `IN_TRANSPORT` y aplanar los campos en la base, transfiriendo sólo las columnas finales (requiere SQL Server 2017+).
 
 ## 🚀 ¿Cómo correrlo?
 Este reporte es un Marimo notebook (https://marimo.io/) escrito en Python puro.
 
 **Requisitos Previos:**
 - **Credenciales SQL:** El script intentará leer un archivo `.env` ubicado en la ruta relativa `../marimo_lab/.env` con las variables de conexión a SQL Server (`DB_SERVER`, `DB_NAME`, `DB_USER`, `DB_PASS`, `DB_PORT`).
-- **Dependencias:** Entorno de python con `marimo`, `pandas`, `sqlalchemy`, `pymssql`, y `python-dotenv`.
+- **Dependencias:** Entorno de python con `marimo`, `pandas`, `pyarrow`, `sqlalchemy`, `pymssql`, y `python-dotenv`.
 
 **Métodos de Ejecución:**
 - **Modo Interactivo (Recomendado para análisis visual):** Levanta el notebook como aplicación en tu navegador.
@@ -23,6 +25,7 @@ Este reporte es un Marimo notebook (https://marimo.io/) escrito en Python puro.
   `marimo run movdebug_trips_extractor.py` (Modo sólo-lectura)
 - **Modo Exportador Secuencial (Vía Terminal):** Ejecuta todo el flujo lógico por consola.
   `python movdebug_trips_extractor.py`
+  Con `--polyline` (y opcionalmente `--polyline-precision N` / `--polyline-tolerance GRADOS`) agrega la columna `polyline` con el recorrido codificado.
 """
 import marimo
 
@@ -34,14 +37,26 @@ def setup():
     import marimo as mo
     import pandas as pd
     import os
+    import sys
     import json
     import sqlalchemy
-    from sqlalchemy import create_engine
-    from dotenv import load_dotenv
+    from sqlalchemy import text
+    from collections import deque
+    from concurrent.futures import ProcessPoolExecutor
+    import movdebug_parsing
+    import movdebug_pushdown
+    import movdebug_store
+
+    # Motor de base de datos compartido (pool reutilizado entre re-ejecuciones de celdas),
+    # en tools/sentiance_common, un nivel arriba de este notebook
+    repo_root = os.path.abspath(os.path.join(os.getcwd(), ".."))
+    if repo_root not in sys.path:
+        sys.path.insert(0, repo_root)
+    from sentiance_common import db
 
     env_path = os.path.abspath(os.path.join(os.getcwd(), "../marimo_lab/.env"))
-    load_dotenv(env_path)
-    return create_engine, json, mo, os, pd
+    db.load_env(env_path)
+    return ProcessPoolExecutor, db, deque, json, mo, movdebug_parsing, movdebug_pushdown, movdebug_store, os, pd, text
 
 @app.cell
 def intro_ui(mo):
@@ -55,14 +70,16 @@ def intro_ui(mo):
     1. **Extracción unificada:** Filtra eventos relevantes (`DrivingInsights`, `UserContextUpdate`, etc.) y parsea su contenido JSON para desanidar y aplanar los detalles del viaje.
     2. **Seguimiento cronológico:** Agrupa múltiples registros de base de datos que referencian al mismo `trip_id`, permitiendo observar cómo la plataforma reporta y actualiza los metadatos de un viaje específico a lo largo del tiempo.
     3. **Análisis de Cobertura (Matriz):** Documenta y compara si los viajes reportados vía la API de `DrivingInsights` también ingresan correctamente bajo `UserContextUpdate` (con el trigger `CURRENT_EVENT`), facilitando la detección de brechas.
-    4. **Exportación:** Exporta automáticamente el dataset resultante como un archivo procesado a `../csv/movdebug_all_trip_instances.csv`.
+    4. **Exportación:** Exporta automáticamente el dataset resultante como un dataset Parquet particionado por fecha de extracción en `../csv/movdebug_all_trip_instances/` (conserva los tipos `category`/`string` y permite leer sólo las columnas necesarias).
+    5. **Extracción incremental:** Guarda en `../csv/movdebug_watermark.json` el último `id` procesado; las corridas siguientes sólo leen las filas nuevas (`id > last_id`) y las agregan como una partición nueva del dataset existente. Marcá "Re-extracción completa" para ignorar la marca de agua y releer toda la tabla.
+    6. **Filtrado en el servidor (opcional):** El modo "Filtrado en SQL Server" usa `OPENJSON`/`JSON_QUERY` para filtrar `IN_TRANSPORT` y aplanar los campos en la base, transfiriendo sólo las columnas finales en lugar del JSON completo (requiere SQL Server 2017+).
 
     ## 🚀 ¿Cómo correrlo?
     Este reporte es un [Marimo notebook](https://marimo.io/) escrito en Python puro.
 
     **Requisitos Previos:**
     - **Credenciales SQL:** El script intentará leer un archivo `.env` ubicado en la ruta relativa `../marimo_lab/.env` con las variables de conexión a SQL Server (`DB_SERVER`, `DB_NAME`, `DB_USER`, `DB_PASS`, `DB_PORT`).
-    - **Dependencias:** Entorno de python con `marimo`, `pandas`, `sqlalchemy`, `pymssql`, y `python-dotenv`.
+    - **Dependencias:** Entorno de python con `marimo`, `pandas`, `pyarrow`, `sqlalchemy`, `pymssql`, y `python-dotenv`.
 
     **Métodos de Ejecución:**
     - **Modo Interactivo (Recomendado para análisis visual):** Levanta el notebook como aplicación en tu navegador. Te permitirá revisar los hallazgos en formato tabla interactivo y ver reportes de errores si los hubiera.
@@ -73,140 +90,174 @@ def intro_ui(mo):
     - **Modo Exportador Secuencial (Vía Terminal):** Ejecuta todo el flujo lógico por consola (conexión a DB, lectura, parsing y guardado). Al finalizar depositará el CSV en el directorio, útil para trabajos desatendidos o crons.
       ```bash
       python movdebug_trips_extractor.py
+      python movdebug_trips_extractor.py --polyline --polyline-tolerance 0.00001  # con la columna `polyline`
       ```
     """)
     return
 
 @app.cell
-def db_conn(create_engine, mo, os):
-    server = os.getenv("DB_SERVER")
-    database = os.getenv("DB_NAME")
-    username = os.getenv("DB_USER")
-    password = os.getenv("DB_PASS")
-    port = os.getenv("DB_PORT", "9433")
-
-    if all([server, database, username, password]):
-        connection_string = f"mssql+pymssql://{username}:{password}@{server}:{port}/{database}"
-        engine = create_engine(connection_string)
+def db_conn(db, mo):
+    settings = db.settings_from_env()
+    server = settings["server"]
+    database = settings["database"]
+
+    # El motor se crea una sola vez por proceso: re-ejecutar la celda reutiliza el pool
+    engine = db.get_engine()
+    if engine is not None:
         db_status = mo.md(f"✅ Conectado a `{database}` en `{server}`")
     else:
         engine = None
         db_status = mo.callout("Faltan credenciales de base de datos en .env", kind="warn")
     return db_status, engine
 
+# =============================================================================
+# CELDA: OPCIONES DE EXTRACCIÓN
+# =============================================================================
+# Por defecto la extracción es incremental: sólo se leen las filas de
+# `MovDebug_Eventos` con `id` mayor a la marca de agua guardada en
+# `../csv/movdebug_watermark.json`. Este checkbox permite forzar una relectura
+# completa de la tabla (por ejemplo, si se cambió la lógica de parseo).
+# También define cuántos procesos parsean el JSON en paralelo (por defecto, uno
+# por núcleo disponible) y el modo de extracción:
+#   - "Parseo en Python": trae el JSON completo y lo parsea localmente.
+#   - "Filtrado en SQL Server": SQL Server filtra `IN_TRANSPORT` y aplana los campos
+#     con OPENJSON, así sólo viajan por la red las columnas finales (ideal sobre VPN).
+# Opcionalmente agrega la columna `polyline` (recorrido codificado, como
+# `Recorridos.polyline`) con la precisión y la tolerancia de simplificación elegidas.
+# Por consola se activa con flags:
+#   python movdebug_trips_extractor.py --polyline --polyline-precision 6 --polyline-tolerance 0.00001
+#
+# Depende de: `mo` (Marimo UI) y `os`.
 @app.cell
-def execute_extraction(engine, json, mo, pd):
+def extraction_options(mo, os):
+    cli_args = mo.cli_args()
+    full_rescan = mo.ui.checkbox(label="Re-extracción completa (ignorar marca de agua)", value=False)
+    # Cantidad de procesos que parsean el JSON en paralelo mientras el cursor sigue leyendo
+    parse_workers = mo.ui.number(start=1, stop=max(os.cpu_count() or 1, 1), value=os.cpu_count() or 1, label="Workers de parseo JSON")
+    extraction_mode = mo.ui.dropdown(
+        options={
+            "Parseo en Python (JSON completo)": "python",
+            "Filtrado en SQL Server (OPENJSON)": "pushdown",
+        },
+        value="Parseo en Python (JSON completo)",
+        label="Modo de extracción"
+    )
+    # Columna `polyline`: precisión del formato (5 = Google Maps, 6 = OSRM) y tolerancia
+    # de Douglas-Peucker en grados (0 = sin simplificar; 1e-5 es ~1 m)
+    with_polyline = mo.ui.checkbox(label="Agregar columna polyline", value="polyline" in cli_args)
+    polyline_precision = mo.ui.number(start=1, stop=7, value=int(cli_args.get("polyline-precision") or 5), label="Precisión")
+    polyline_tolerance = mo.ui.number(start=0, stop=1, step=0.00001, value=float(cli_args.get("polyline-tolerance") or 0), label="Tolerancia (grados)")
+    mo.vstack([
+        mo.hstack([full_rescan, parse_workers, extraction_mode], justify="start", gap=2),
+        mo.hstack([with_polyline, polyline_precision, polyline_tolerance], justify="start", gap=2),
+    ])
+    return extraction_mode, full_rescan, parse_workers, polyline_precision, polyline_tolerance, with_polyline
+
+@app.cell
+def execute_extraction(ProcessPoolExecutor, db, deque, engine, extraction_mode, full_rescan, mo, movdebug_parsing, movdebug_pushdown, movdebug_store, os, parse_workers, pd, polyline_precision, polyline_tolerance, text, with_polyline):
     tipos_target = "('DrivingInsights', 'UserContextUpdate', 'requestUserContext', 'TimelineUpdateListener', 'TimelineEventById')"
+
+    # Argumentos de `polyline.encode_waypoints`, o None si no se pidió la columna `polyline`
+    polyline_options = None
+    if with_polyline.value:
+        polyline_options = {"precision": int(polyline_precision.value), "tolerance": float(polyline_tolerance.value or 0) or None}
+
+    # Directorio donde viven el CSV acumulado y la marca de agua
+    store_dir = os.path.abspath(os.path.join(os.getcwd(), "../csv"))
+
+    # La tabla sólo crece por `id`: arrancar desde el último id ya procesado
+    last_id = 0 if full_rescan.value else movdebug_store.load_watermark(store_dir)
+    max_seen_id = last_id
     
     # Check count first to setup a precise progress bar
-    count_query = f"SELECT COUNT(*) AS total FROM MovDebug_Eventos WHERE tipo IN {tipos_target}"
+    count_query = text(f"SELECT COUNT(*) AS total FROM MovDebug_Eventos WHERE tipo IN {tipos_target} AND id > :last_id")
     
     extracted_trips = []
     extraction_complete = False
+    total_rows = 0
+    executor = None
     
-    if engine is not None:
+    if engine is not None and extraction_mode.value == "pushdown":
+        # SQL Server filtra y aplana el JSON: sólo se transfieren las columnas finales
+        try:
+            bounds_df = pd.read_sql(text(movdebug_pushdown.PUSHDOWN_COUNT_QUERY), engine, params={"last_id": last_id})
+            total_rows = int(bounds_df.iloc[0]['total'])
+            upper_id = bounds_df.iloc[0]['max_id']
+            if total_rows > 0 and pd.notna(upper_id):
+                max_seen_id = int(upper_id)
+                with mo.status.spinner(title="Filtrando MovDebug_Eventos en SQL Server (OPENJSON)...", subtitle=f"{total_rows} filas candidatas con id > {last_id}") as _spinner:
+                    # Con `polyline` también se traen los waypoints de cada viaje
+                    data_query = movdebug_pushdown.PUSHDOWN_DATA_QUERY if polyline_options is None else movdebug_pushdown.PUSHDOWN_DATA_QUERY_WAYPOINTS
+                    for chunk in db.stream_sql(engine, data_query, params={"last_id": last_id, "max_id": max_seen_id}, chunksize=5000):
+                        extracted_trips.extend(movdebug_pushdown.normalize_pushdown_chunk(chunk, polyline_options))
+                        _spinner.update(subtitle=f"{len(extracted_trips)} instancias de viaje recibidas...")
+            extraction_complete = True
+        except Exception as e:
+            mo.md(f"Error extracting data: {str(e)}")
+
+    elif engine is not None:
         try:
-            total_rows_df = pd.read_sql(count_query, engine)
+            total_rows_df = pd.read_sql(count_query, engine, params={"last_id": last_id})
             total_rows = int(total_rows_df.iloc[0]['total'])
             
             # Use chunks to not overwhelm memory and keep progress bar updating
             chunk_size = 1000
             
-            with mo.status.progress_bar(total=total_rows, title="Extrayendo y parseando JSON (MovDebug_Eventos)", subtitle="Iniciando...") as pbar:
-                data_query = f"SELECT id, tipo, sentianceid, JSON FROM MovDebug_Eventos WHERE tipo IN {tipos_target} ORDER BY id ASC"
+            # Pool de procesos para el parseo JSON (1 worker = parseo en el propio proceso)
+            workers = int(parse_workers.value or 1)
+            executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+            max_pending = workers * 2
+            pending = deque()
+
+            def drain_oldest():
+                future, n_rows = pending.popleft()
+                extracted_trips.extend(future.result())
+                pbar.update(increment=n_rows, subtitle=f"Procesando chunk de {chunk_size} filas ({workers} workers)...")
+
+            with mo.status.progress_bar(total=max(total_rows, 1), title="Extrayendo y parseando JSON (MovDebug_Eventos)", subtitle=f"Leyendo filas con id > {last_id}...") as pbar:
+                data_query = text(f"SELECT id, tipo, sentianceid, JSON FROM MovDebug_Eventos WHERE tipo IN {tipos_target} AND id > :last_id ORDER BY id ASC")
                 
                 # Using execution stream
-                for chunk in pd.read_sql(data_query, engine, chunksize=chunk_size):
-                    for idx, row in chunk.iterrows():
-                        db_record_id = row['id']
-                        tipo = row['tipo']
-                        user_id = row['sentianceid']
-                        raw_json = row['JSON']
-                        
-                        if not raw_json or pd.isna(raw_json):
-                            continue
-                            
-                        try:
-                            parsed = json.loads(raw_json)
-                        except:
-                            continue
-                            
-                        # Logic depending on type
-                        if tipo == 'DrivingInsights':
-                            transport_event = parsed.get("transportEvent")
-                            if transport_event and transport_event.get("type") == "IN_TRANSPORT":
-                                extracted_trips.append({
-                                    "db_record_id": db_record_id,
-                                    "source_tipo": tipo,
-                                    "source_criteria": ",".join(parsed.get("criteria", [])) if isinstance(parsed.get("criteria"), list) else "",
-                                    "user_id": user_id,
-                                    "trip_id": transport_event.get("id"),
-                                    "transportMode": transport_event.get("transportMode"),
-                                    "isProvisional": transport_event.get("isProvisional"),
-                                    "startTime": transport_event.get("startTime"),
-                                    "endTime": transport_event.get("endTime"),
-                                    "distance": transport_event.get("distance"),
-                                    "durationInSeconds": transport_event.get("durationInSeconds"),
-                                    "waypoints_count": len(transport_event.get("waypoints", []))
-                                })
-                                
-                        elif tipo in ("UserContextUpdate", "requestUserContext"):
-                            # Looking inside events array or userContext.events array
-                            events = parsed.get("events")
-                            if events is None and "userContext" in parsed:
-                                events = parsed.get("userContext", {}).get("events")
-                                
-                            if events and isinstance(events, list):
-                                for event in events:
-                                    if event.get("type") == "IN_TRANSPORT":
-                                        extracted_trips.append({
-                                            "db_record_id": db_record_id,
-                                            "source_tipo": tipo,
-                                            "source_criteria": ",".join(parsed.get("criteria", [])) if isinstance(parsed.get("criteria"), list) else "",
-                                            "user_id": user_id,
-                                            "trip_id": event.get("id"),
-                                            "transportMode": event.get("transportMode"),
-                                            "isProvisional": event.get("isProvisional"),
-                                            "startTime": event.get("startTime"),
-                                            "endTime": event.get("endTime"),
-                                            "distance": event.get("distance"),
-                                            "durationInSeconds": event.get("durationInSeconds"),
-                                            "waypoints_count": len(event.get("waypoints", []))
-                                        })
-                        
-                        elif tipo in ("TimelineUpdateListener", "TimelineEventById"):
-                            if parsed.get("type") == "IN_TRANSPORT":
-                                extracted_trips.append({
-                                    "db_record_id": db_record_id,
-                                    "source_tipo": tipo,
-                                    "source_criteria": ",".join(parsed.get("criteria", [])) if isinstance(parsed.get("criteria"), list) else "",
-                                    "user_id": user_id,
-                                    "trip_id": parsed.get("id"),
-                                    "transportMode": parsed.get("transportMode"),
-                                    "isProvisional": parsed.get("isProvisional"),
-                                    "startTime": parsed.get("startTime"),
-                                    "endTime": parsed.get("endTime"),
-                                    "distance": parsed.get("distance"),
-                                    "durationInSeconds": parsed.get("durationInSeconds"),
-                                    "waypoints_count": len(parsed.get("waypoints", []))
-                                })
-
-                    pbar.update(increment=len(chunk), subtitle=f"Procesando chunk de {chunk_size} filas...")
+                for chunk in db.stream_sql(engine, data_query, params={"last_id": last_id}, chunksize=chunk_size):
+                    if len(chunk) > 0:
+                        max_seen_id = max(max_seen_id, int(chunk['id'].max()))
+                    # Productor: el cursor sigue trayendo chunks mientras los workers parsean
+                    records = list(chunk[['id', 'tipo', 'sentianceid', 'JSON']].itertuples(index=False, name=None))
+                    if executor is None:
+                        extracted_trips.extend(movdebug_parsing.parse_records(records, polyline_options))
+                        pbar.update(increment=len(chunk), subtitle=f"Procesando chunk de {chunk_size} filas...")
+                        continue
+                    pending.append((executor.submit(movdebug_parsing.parse_records, records, polyline_options), len(chunk)))
+
+                    # Consumidor: se vacía por orden de envío para preservar el orden de `db_record_id`.
+                    # Limitar las tandas en vuelo evita acumular en memoria todo el resultado del cursor.
+                    while len(pending) >= max_pending:
+                        drain_oldest()
+
+                while pending:
+                    drain_oldest()
                     
             extraction_complete = True
             
         except Exception as e:
             mo.md(f"Error extracting data: {str(e)}")
+        finally:
+            if executor is not None:
+                executor.shutdown(cancel_futures=True)
             
-    return extraction_complete, extracted_trips, total_rows
+    return extraction_complete, extracted_trips, last_id, max_seen_id, store_dir, total_rows
 
 @app.cell
-def process_extracted_data(extracted_trips, extraction_complete, mo, os, pd):
+def process_extracted_data(extracted_trips, extraction_complete, last_id, max_seen_id, mo, movdebug_store, pd, store_dir):
     final_df = None
     csv_saved_status = None
+
+    # En modo incremental se parte de las instancias ya extraídas en corridas previas
+    stored_df = movdebug_store.load_trip_instances(store_dir) if extraction_complete and last_id > 0 else None
+    new_df = pd.DataFrame(extracted_trips) if len(extracted_trips) > 0 else None
     
-    if extraction_complete and len(extracted_trips) > 0:
-        final_df = pd.DataFrame(extracted_trips)
+    if extraction_complete and (new_df is not None or stored_df is not None):
+        final_df = movdebug_store.merge_trip_instances(stored_df, new_df)
         
         # Group duplicates logically by ordering
         # Sort by Trip ID, then chronologically by the Db Record ID to see changes over time
@@ -222,13 +273,20 @@ def process_extracted_data(extracted_trips, extraction_complete, mo, os, pd):
         final_df['user_id'] = final_df['user_id'].astype('string')
         final_df['source_criteria'] = final_df['source_criteria'].astype('string')
         
-        save_path = os.path.abspath(os.path.join(os.getcwd(), "../csv/movdebug_all_trip_instances.csv"))
         try:
-            os.makedirs(os.path.dirname(save_path), exist_ok=True)
-            final_df.to_csv(save_path, index=False)
-            csv_saved_status = mo.md(f"✅ CSV guardado exitosamente con **{len(final_df)}** viajes encontrados ({len(final_df['trip_id'].unique())} únicos) en: `{save_path}`")
+            # Sólo se escriben las filas nuevas como una partición más; una extracción
+            # completa (last_id == 0) reemplaza el dataset entero
+            if new_df is not None:
+                movdebug_store.append_trip_instances(new_df, store_dir, replace=last_id == 0)
+            save_path = movdebug_store.trips_path(store_dir)
+            # La marca de agua se guarda sólo después de que el dataset quedó escrito
+            movdebug_store.save_watermark(store_dir, max_seen_id)
+            csv_saved_status = mo.md(
+                f"✅ Dataset Parquet guardado exitosamente con **{len(final_df)}** viajes encontrados ({len(final_df['trip_id'].unique())} únicos) en: `{save_path}`  \n"
+                f"➕ {len(extracted_trips)} instancias nuevas (filas con id > {last_id}); marca de agua actualizada a `{max_seen_id}`."
+            )
         except Exception as e:
-            csv_saved_status = mo.callout(f"Error al guardar CSV: {str(e)}", kind="danger")
+            csv_saved_status = mo.callout(f"Error al guardar el dataset Parquet: {str(e)}", kind="danger")
             
     elif extraction_complete:
         csv_saved_status = mo.md("No se encontraron eventos `IN_TRANSPORT` en la tabla bajo los tipos especificados.")
@@ -51,16 +51,32 @@ def _():
     import pandas as pd
     import os
     import json
+    import sys
     import sqlalchemy
-    from sqlalchemy import create_engine
-    from dotenv import load_dotenv
+
+    # Capa JSON compartida (orjson/msgspec si están instalados) en tools/sentiance_common
+    repo_root = os.path.abspath(os.path.join(os.getcwd(), ".."))
+    if repo_root not in sys.path:
+        sys.path.insert(0, repo_root)
+    from sentiance_common import fastjson
+
+    # Motor de base de datos compartido (pool reutilizado entre re-ejecuciones de celdas)
+    from sentiance_common import db
 
     # Cargar .env desde el directorio marimo_lab
     # Notebook actual: tools/csv_analizer/primary_scores.py
     # .env: tools/marimo_lab/.env
     env_path = os.path.abspath(os.path.join(os.getcwd(), "../marimo_lab/.env"))
-    load_dotenv(env_path)
-    return create_engine, json, mo, os, pd
+    db.load_env(env_path)
+
+    # Lectura columnar: prefiere la versión Parquet de cada dataset de ../csv si existe
+    import columnar
+
+    # Consultas por lote contra una tabla temporal de claves (en lugar de una consulta por fila)
+    import batch_queries
+    import consistency
+    import event_counts
+    return batch_queries, columnar, consistency, db, event_counts, fastjson, mo, os, pd
 
 
 @app.cell
@@ -74,18 +90,16 @@ def _(mo):
 
 
 @app.cell
-def _(create_engine, mo, os):
+def _(db, mo):
     # Configuración de la conexión a la base de datos SQL Server
     # Credenciales de la base de datos de las variables de entorno
-    server = os.getenv("DB_SERVER")
-    database = os.getenv("DB_NAME")
-    username = os.getenv("DB_USER")
-    password = os.getenv("DB_PASS")
-    port = os.getenv("DB_PORT", "9433")
-
-    if all([server, database, username, password]):
-        connection_string = f"mssql+pymssql://{username}:{password}@{server}:{port}/{database}"
-        engine = create_engine(connection_string)
+    db_settings = db.settings_from_env()
+    server = db_settings["server"]
+    database = db_settings["database"]
+
+    # Motor compartido por proceso (sentiance_common/db.py): re-ejecutar la celda no reconecta
+    engine = db.get_engine()
+    if engine is not None:
         db_status = mo.md(f"✅ Connected to `{database}` on `{server}`")
     else:
         engine = None
@@ -151,16 +165,16 @@ def _(dir_input, mo, os, start_btn):
 
 
 @app.cell
-def _(base_dir, mo, os, pd):
+def _(base_dir, columnar, mo, os):
     # Carga del archivo CSV principal con puntajes de seguridad
     csv_path = os.path.join(base_dir, "primary_safety_scores_transports.csv")
 
-    df = None
     table = None
     stats_table = None
 
-    if os.path.exists(csv_path):
-        df = pd.read_csv(csv_path)
+    # Prefiere la versión Parquet si existe; la grilla y las estadísticas usan todas las columnas
+    df = columnar.read_table(base_dir, "primary_safety_scores_transports")
+    if df is not None:
         table = mo.ui.table(df, label="Grilla de Puntajes (CSV Primario)", selection=None, pagination=True, max_height=500)
 
         # Estadísticas resumidas
@@ -185,69 +199,85 @@ def _(db_status, mo, stats_table, table):
 
 
 @app.cell
-def _(df, engine, json, mo, pd):
+def _(batch_queries, df, engine, mo):
+    # Consulta por lote de las tablas de puntajes (SentianceEventos, PuntajesPrirmariosTr
+    # y PuntajesSecundariosTr). Depende de `df` (CSV primario) y `engine` (conexión).
+    # Las claves (user_id, transport_id) del CSV se cargan una única vez en la tabla
+    # temporal `#keys` y cada tabla se resuelve con un solo join contra ella, en la
+    # misma conexión: tres consultas en total en lugar de tres por fila del CSV.
+    # Exporta `score_batches` ({tabla: DataFrame}) o `score_batch_error` si falló.
+    score_batches = None
+    score_batch_error = None
+
+    if df is not None and engine is not None:
+        with mo.status.spinner(title=f"Consultando puntajes de {len(df)} viajes en la base de datos..."):
+            try:
+                score_batches = batch_queries.fetch_by_keys(engine, df, {
+                    "SentianceEventos": batch_queries.SENTIANCE_EVENTOS_QUERY,
+                    "PuntajesPrirmariosTr": batch_queries.PUNTAJES_PRIMARIOS_QUERY,
+                    "PuntajesSecundariosTr": batch_queries.PUNTAJES_SECUNDARIOS_QUERY,
+                })
+            except Exception as e:
+                score_batch_error = e
+    return score_batch_error, score_batches
+
+
+@app.cell
+def _(batch_queries, df, fastjson, mo, score_batch_error, score_batches):
     # Obtención de puntajes desde SentianceEventos (JSON en base de datos)
     db_df = None
     db_table = None
 
-    if df is not None and engine is not None:
-        se_scores = []
-
-        with mo.status.spinner(title="Consultando SentianceEventos...") as _spinner:
-            # Extraer puntajes para cada fila
-            se_total_rows = len(df)
-            for se_i, (se_index, se_row) in enumerate(df.iterrows()):
-                _spinner.update(title=f"Consultando SentianceEventos... ({se_i+1}/{se_total_rows})")
-                se_user_id = se_row['user_id']
-                se_transport_id = se_row['transport_id']
-
-                # Consulta SQL usando %like% para el transport_id en el campo JSON
-                se_query = f"""
-                SELECT TOP 1 JSON 
-                FROM SentianceEventos 
-                WHERE sentianceid = '{se_user_id}'
-                AND tipo = 'DrivingInsights'
-                AND JSON LIKE '%{se_transport_id}%'
-                """
-
-                try:
-                    se_res_df = mo.sql(se_query, engine=engine, output=False)
-
-                    if not se_res_df.empty:
-                        se_raw_json = se_res_df.iloc[0]['JSON']
-                        se_data = json.loads(se_raw_json)
-
-                        # Extraer puntajes de seguridad de la estructura JSON
-                        se_details = se_data.get("safetyScores", {})
-
-                        se_scores.append({
-                            "user_id": se_user_id,
-                            "transport_id": se_transport_id,
-                            "legal": se_details.get("legalScore", "N/A"),
-                            "smooth": se_details.get("smoothScore", "N/A"),
-                            "focus": se_details.get("focusScore", "N/A"),
-                            "overall": se_details.get("overallScore", "N/A"),
-                            "harsh_accel": se_details.get("harshAccelerationScore", "N/A"),
-                            "harsh_brake": se_details.get("harshBrakingScore", "N/A"),
-                            "harsh_turn": se_details.get("harshTurningScore", "N/A"),
-                            "harsh_events": "---",  # No presente en el JSON de SE proporcionado
-                            "call_moving": se_details.get("callWhileMovingScore", "N/A")
-                        })
-                    else:
-                        se_scores.append({
-                            "user_id": se_user_id,
-                            "transport_id": se_transport_id,
-                            "legal": "---", "smooth": "---", "focus": "---", "overall": "---",
-                            "harsh_accel": "---", "harsh_brake": "---", "harsh_turn": "---", "harsh_events": "---", "call_moving": "---"
-                        })
-                except Exception as e:
-                    se_scores.append({
-                        "user_id": se_user_id,
-                        "transport_id": se_transport_id,
-                        "error": str(e)
-                    })
-
-        db_df = pd.DataFrame(se_scores)
+    if score_batch_error is not None:
+        db_df = batch_queries.error_rows(df, score_batch_error)
+    elif score_batches is not None:
+        # Consulta SQL usando %like% para el transport_id en el campo JSON (ver batch_queries.SENTIANCE_EVENTOS_QUERY)
+        se_matches = batch_queries.rows_by_key(score_batches["SentianceEventos"], ["JSON"])
+
+        def _score(value):
+            return "N/A" if value is None else value
+
+        def _se_row(se_user_id, se_transport_id, se_match):
+            try:
+                se_raw_json = se_match["JSON"]
+                # Decodificación tipada: sólo se materializa el objeto safetyScores
+                se_data = fastjson.decode(se_raw_json, fastjson.DrivingInsightsScores)
+
+                # Extraer puntajes de seguridad de la estructura JSON
+                se_details = (se_data.safetyScores if se_data is not None else None) or fastjson.SafetyScores()
+
+                return {
+                    "user_id": se_user_id,
+                    "transport_id": se_transport_id,
+                    "legal": _score(se_details.legalScore),
+                    "smooth": _score(se_details.smoothScore),
+                    "focus": _score(se_details.focusScore),
+                    "overall": _score(se_details.overallScore),
+                    "harsh_accel": _score(se_details.harshAccelerationScore),
+                    "harsh_brake": _score(se_details.harshBrakingScore),
+                    "harsh_turn": _score(se_details.harshTurningScore),
+                    "harsh_events": "---",  # No presente en el JSON de SE proporcionado
+                    "call_moving": _score(se_details.callWhileMovingScore)
+                }
+            except Exception as e:
+                return {
+                    "user_id": se_user_id,
+                    "transport_id": se_transport_id,
+                    "error": str(e)
+                }
+
+        def _se_missing(se_user_id, se_transport_id):
+            return {
+                "user_id": se_user_id,
+                "transport_id": se_transport_id,
+                "legal": "---", "smooth": "---", "focus": "---", "overall": "---",
+                "harsh_accel": "---", "harsh_brake": "---", "harsh_turn": "---", "harsh_events": "---", "call_moving": "---"
+            }
+
+        # Extraer puntajes para cada fila
+        db_df = batch_queries.align_to_keys(df, se_matches, _se_row, _se_missing)
+
+    if db_df is not None:
         db_table = mo.ui.table(db_df, label="Puntajes de SentianceEventos", selection=None, pagination=True, max_height=500)
     return db_df, db_table
 
@@ -263,53 +293,35 @@ def _(db_table, mo):
 
 
 @app.cell
-def _(df, engine, mo, pd):
+def _(batch_queries, df, mo, score_batch_error, score_batches):
     # Obtención de puntajes desde la tabla PuntajesPrirmariosTr (Base de datos)
     pt_df = None
     pt_table = None
 
-    if df is not None and engine is not None:
-        pt_scores_list = []
-
-        with mo.status.spinner(title="Consultando PuntajesPrirmariosTr...") as _spinner:
-            pt_total_rows = len(df)
-            for pt_i, (pt_index, pt_row) in enumerate(df.iterrows()):
-                _spinner.update(title=f"Consultando PuntajesPrirmariosTr... ({pt_i+1}/{pt_total_rows})")
-                pt_user_id = pt_row['user_id']
-                pt_transport_id = pt_row['transport_id']
-
-                pt_query = f"""
-                SELECT legal, suavidad, atencion, promedio 
-                FROM PuntajesPrirmariosTr 
-                WHERE usuario = '{pt_user_id}' AND viaje = '{pt_transport_id}'
-                """
-
-                try:
-                    pt_res_df = mo.sql(pt_query, engine=engine, output=False)
-
-                    if not pt_res_df.empty:
-                        pt_data_row = pt_res_df.iloc[0]
-                        pt_scores_list.append({
-                            "user_id": pt_user_id,
-                            "transport_id": pt_transport_id,
-                            "legal": pt_data_row['legal'],
-                            "smooth": pt_data_row['suavidad'],
-                            "overall": pt_data_row['promedio']
-                        })
-                    else:
-                        pt_scores_list.append({
-                            "user_id": pt_user_id,
-                            "transport_id": pt_transport_id,
-                            "legal": "---", "smooth": "---", "overall": "---"
-                        })
-                except Exception as e:
-                    pt_scores_list.append({
-                        "user_id": pt_user_id,
-                        "transport_id": pt_transport_id,
-                        "error": str(e)
-                    })
-
-        pt_df = pd.DataFrame(pt_scores_list)
+    if score_batch_error is not None:
+        pt_df = batch_queries.error_rows(df, score_batch_error)
+    elif score_batches is not None:
+        pt_matches = batch_queries.rows_by_key(score_batches["PuntajesPrirmariosTr"], ["legal", "suavidad", "promedio"])
+
+        def _pt_row(pt_user_id, pt_transport_id, pt_data_row):
+            return {
+                "user_id": pt_user_id,
+                "transport_id": pt_transport_id,
+                "legal": pt_data_row['legal'],
+                "smooth": pt_data_row['suavidad'],
+                "overall": pt_data_row['promedio']
+            }
+
+        def _pt_missing(pt_user_id, pt_transport_id):
+            return {
+                "user_id": pt_user_id,
+                "transport_id": pt_transport_id,
+                "legal": "---", "smooth": "---", "overall": "---"
+            }
+
+        pt_df = batch_queries.align_to_keys(df, pt_matches, _pt_row, _pt_missing)
+
+    if pt_df is not None:
         pt_table = mo.ui.table(pt_df, label="Puntajes de PuntajesPrirmariosTr", selection=None, pagination=True, max_height=500)
     return pt_df, pt_table
 
@@ -401,58 +413,43 @@ def _(comparison_table, summary_ui, mo):
 
 
 @app.cell
-def _(df, engine, mo, pd):
+def _(batch_queries, df, mo, score_batch_error, score_batches):
     # Obtención de puntajes secundarios desde la tabla PuntajesSecundariosTr
     st_df = None
     st_table = None
 
-    if df is not None and engine is not None:
-        st_scores_list = []
-
-        with mo.status.spinner(title="Consultando PuntajesSecundariosTr...") as _spinner:
-            st_total_rows = len(df)
-            for st_i, (st_index, st_row) in enumerate(df.iterrows()):
-                _spinner.update(title=f"Consultando PuntajesSecundariosTr... ({st_i+1}/{st_total_rows})")
-                st_user_id = st_row['user_id']
-                st_transport_id = st_row['transport_id']
-
-                st_query = f"""
-                SELECT concentracion, aceleracion_fuerte, frenado_fuerte, curvas_fuertes, anticipacion, celular_fijo, eventos_fuertes 
-                FROM PuntajesSecundariosTr 
-                WHERE usuario = '{st_user_id}' AND viaje = '{st_transport_id}'
-                """
-
-                try:
-                    st_res_df = mo.sql(st_query, engine=engine, output=False)
-
-                    if not st_res_df.empty:
-                        st_data_row = st_res_df.iloc[0]
-                        st_scores_list.append({
-                            "user_id": st_user_id,
-                            "transport_id": st_transport_id,
-                            "concentration": st_data_row['concentracion'],
-                            "hard_accel": st_data_row['aceleracion_fuerte'],
-                            "hard_brake": st_data_row['frenado_fuerte'],
-                            "hard_turns": st_data_row['curvas_fuertes'],
-                            "anticipation": st_data_row['anticipacion'],
-                            "phone_fixed": st_data_row['celular_fijo'],
-                            "strong_events": st_data_row['eventos_fuertes']
-                        })
-                    else:
-                        st_scores_list.append({
-                            "user_id": st_user_id,
-                            "transport_id": st_transport_id,
-                            "concentration": "---", "hard_accel": "---", "hard_brake": "---", "hard_turns": "---",
-                            "anticipation": "---", "phone_fixed": "---", "strong_events": "---"
-                        })
-                except Exception as e:
-                    st_scores_list.append({
-                        "user_id": st_user_id,
-                        "transport_id": st_transport_id,
-                        "error": str(e)
-                    })
-
-        st_df = pd.DataFrame(st_scores_list)
+    if score_batch_error is not None:
+        st_df = batch_queries.error_rows(df, score_batch_error)
+    elif score_batches is not None:
+        st_matches = batch_queries.rows_by_key(
+            score_batches["PuntajesSecundariosTr"],
+            ["concentracion", "aceleracion_fuerte", "frenado_fuerte", "curvas_fuertes", "anticipacion", "celular_fijo", "eventos_fuertes"]
+        )
+
+        def _st_row(st_user_id, st_transport_id, st_data_row):
+            return {
+                "user_id": st_user_id,
+                "transport_id": st_transport_id,
+                "concentration": st_data_row['concentracion'],
+                "hard_accel": st_data_row['aceleracion_fuerte'],
+                "hard_brake": st_data_row['frenado_fuerte'],
+                "hard_turns": st_data_row['curvas_fuertes'],
+                "anticipation": st_data_row['anticipacion'],
+                "phone_fixed": st_data_row['celular_fijo'],
+                "strong_events": st_data_row['eventos_fuertes']
+            }
+
+        def _st_missing(st_user_id, st_transport_id):
+            return {
+                "user_id": st_user_id,
+                "transport_id": st_transport_id,
+                "concentration": "---", "hard_accel": "---", "hard_brake": "---", "hard_turns": "---",
+                "anticipation": "---", "phone_fixed": "---", "strong_events": "---"
+            }
+
+        st_df = batch_queries.align_to_keys(df, st_matches, _st_row, _st_missing)
+
+    if st_df is not None:
         st_table = mo.ui.table(st_df, label="Puntajes de PuntajesSecundariosTr", selection=None, pagination=True, max_height=500)
     return st_df, st_table
 
@@ -468,12 +465,10 @@ def _(mo, st_table):
 
 
 @app.cell(hide_code=True)
-def _(base_dir, os, pd):
+def _(base_dir, columnar):
     # Carga del archivo CSV secundario (secondary_safety_scores_transports.csv)
-    sec_csv_path = os.path.join(base_dir, "secondary_safety_scores_transports.csv")
-    sec_df = None
-    if os.path.exists(sec_csv_path):
-        sec_df = pd.read_csv(sec_csv_path)
+    # Prefiere la versión Parquet si existe; la grilla secundaria muestra todas las columnas
+    sec_df = columnar.read_table(base_dir, "secondary_safety_scores_transports")
     return (sec_df,)
 
 
@@ -607,41 +602,16 @@ def _(db_df, mo, pd, sec_df, st_df):
 
 
 @app.cell
-def _(base_dir, json, mo, os, pd):
+def _(base_dir, event_counts, os):
     # Carga de archivos de eventos de manejo (Driving Events)
     # Estos archivos contienen el detalle de los eventos en formato JSON por cada columna
     path_all = os.path.join(base_dir, "driving_events_all.csv")
     path_sig = os.path.join(base_dir, "driving_events_significant.csv")
     
-    ev_all_df = pd.read_csv(path_all) if os.path.exists(path_all) else None
-    ev_sig_df = pd.read_csv(path_sig) if os.path.exists(path_sig) else None
-    
-    def parse_counts(df_to_parse):
-        if df_to_parse is None:
-            return None
-        
-        event_cols = ['accelerating', 'phone_handling', 'turning', 'mounted', 'braking', 'speeding', 'calls', 'screens']
-        results = []
-        
-        for _, row in df_to_parse.iterrows():
-            entry = {'user_id': row['user_id'], 'transport_id': row['transport_id']}
-            for col in event_cols:
-                try:
-                    val = row[col]
-                    if pd.isna(val) or val == "" or val == "[]":
-                        entry[col] = 0
-                    else:
-                        # Marimo/Pandas a veces escapa las comillas de forma distinta
-                        # Reemplazar "" por " si es necesario, pero json.loads suele manejarlo si viene del CSV bien
-                        events = json.loads(val)
-                        entry[col] = len(events)
-                except Exception:
-                    entry[col] = 0
-            results.append(entry)
-        return pd.DataFrame(results)
-
-    sum_all_df = parse_counts(ev_all_df)
-    sum_sig_df = parse_counts(ev_sig_df)
+    # Conteo vectorizado por columna, cacheado por (ruta, mtime, tamaño): si los CSV
+    # no cambiaron, volver a ejecutar la celda no los relee (ver event_counts.py)
+    ev_all_df, sum_all_df = event_counts.load_event_counts(path_all)
+    ev_sig_df, sum_sig_df = event_counts.load_event_counts(path_sig)
     
     return ev_all_df, ev_sig_df, sum_all_df, sum_sig_df
 
@@ -699,7 +669,7 @@ def _(ev_all_df, mo):
 
 
 @app.cell
-def _(ev_all_df, ev_sig_df, json, mo, pd, transport_selector):
+def _(ev_all_df, ev_sig_df, fastjson, mo, pd, transport_selector):
     # Inspector detallado de eventos - construye el display basado en la selección
     detail_display = mo.md("Seleccione un Transport ID para ver el detalle de los eventos.")
     
@@ -714,8 +684,8 @@ def _(ev_all_df, ev_sig_df, json, mo, pd, transport_selector):
         
         for ev_col in event_cols:
             try:
-                data_all = json.loads(row_all[ev_col])
-                data_sig = json.loads(row_sig[ev_col]) if row_sig is not None and ev_col in row_sig else []
+                data_all = fastjson.loads(row_all[ev_col])
+                data_sig = fastjson.loads(row_sig[ev_col]) if row_sig is not None and ev_col in row_sig else []
                 
                 content = mo.vstack([
                     mo.md(f"### {ev_col.replace('_', ' ').title()}"),
@@ -749,59 +719,35 @@ def _(inspector_display):
 
 
 @app.cell
-def _(base_dir, engine, mo, os, pd):
+def _(base_dir, columnar, consistency, engine, mo):
     # Consistencia de Transportes (CSV vs DB)
-    transports_csv_path = os.path.join(base_dir, "transports.csv")
-    
     def get_consistency_table():
-        if not (os.path.exists(transports_csv_path) and engine is not None):
+        if not (columnar.table_exists(base_dir, "transports") and engine is not None):
             return None
 
-        trans_df = pd.read_csv(transports_csv_path)
-        tables_to_check = [
-            "Conduccion",
-            "Eventos",
-            "EventosSignificantes",
-            "PuntajesPrirmariosTr",
-            "PuntajesSecundariosTr",
-            "Recorridos",
-            "Transporte"
-        ]
-        
-        consistency_results = []
-        
-        with mo.status.spinner(title="Verificando consistencia en base de datos...") as _spinner:
-            total_trans = len(trans_df)
-            for i, (_, row) in enumerate(trans_df.iterrows()):
-                uid = row['user_id']
-                # Use local variable names safely inside function
-                c_tid = row['transport_id']
-                _spinner.update(title=f"Verificando {c_tid} ({i+1}/{total_trans})")
-                
-                res_entry = {
-                    "user_id": uid,
-                    "transport_id": c_tid,
-                    "mode": row['mode'],
-                    "duration": row['duration']
-                }
-                
-                for t_name in tables_to_check:
-                    try:
-                        query = f"SELECT COUNT(*) as cnt FROM {t_name} WHERE usuario = '{uid}' AND viaje = '{c_tid}'"
-                        check_df = mo.sql(query, engine=engine, output=False)
-                        exists = check_df.iloc[0]['cnt'] > 0
-                        res_entry[t_name] = "✓" if exists else "✗"
-                    except Exception:
-                        res_entry[t_name] = "Error"
-                
-                consistency_results.append(res_entry)
-        
-        return mo.ui.table(
-            pd.DataFrame(consistency_results), 
-            label="Consistencia: transports.csv vs Database",
-            pagination=True,
-            max_height=600
-        )
+        # Sólo se leen las columnas que usa la verificación (transports.csv o transports.parquet)
+        trans_df = columnar.read_table(base_dir, "transports", columns=["user_id", "transport_id", "mode", "duration"])
+
+        # Una consulta EXISTS por tabla contra la tabla temporal de claves (ver consistency.py)
+        with mo.status.spinner(title=f"Verificando consistencia de {len(trans_df)} viajes en base de datos..."):
+            consistency_df = consistency.check_consistency(engine, trans_df)
+
+        if "error" in consistency_df.columns:
+            return mo.callout(f"Error consultando la base de datos: {consistency_df['error'].iloc[0]}", kind="danger")
+
+        return mo.vstack([
+            mo.ui.table(
+                consistency.summarize(consistency_df),
+                label="Resumen por tabla",
+                selection=None
+            ),
+            mo.ui.table(
+                consistency_df, 
+                label="Consistencia: transports.csv vs Database",
+                pagination=True,
+                max_height=600
+            )
+        ])
 
     trans_consistency_table = get_consistency_table()
 
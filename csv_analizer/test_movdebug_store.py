@@ -0,0 +1,63 @@
+"""
+Pruebas del almacén incremental de instancias de viaje (`movdebug_store.py`).
+
+    python -m pytest csv_analizer/test_movdebug_store.py
+"""
+import pandas as pd
+
+import movdebug_store
+
+_TRIP = {
+    "source_tipo": "DrivingInsights",
+    "source_criteria": "",
+    "user_id": "u1",
+    "trip_id": "t1",
+    "transportMode": "CAR",
+    "isProvisional": False,
+    "startTime": "2024-01-01T10:00:00",
+    "endTime": "2024-01-01T10:30:00",
+    "distance": 1200.0,
+    "durationInSeconds": 1800.0,
+    "waypoints_count": 3,
+}
+
+
+def _trips(*rows):
+    return pd.DataFrame([dict(_TRIP, **row) for row in rows])
+
+
+def test_mixed_parts_keep_polyline(tmp_path):
+    # Una corrida sin `polyline_options` y otra con: la segunda no debe perder la columna
+    movdebug_store.append_trip_instances(_trips({"db_record_id": 1}), tmp_path)
+    movdebug_store.append_trip_instances(_trips({"db_record_id": 2, "polyline": "abc"}), tmp_path)
+
+    df = movdebug_store.load_trip_instances(tmp_path).sort_values("db_record_id")
+
+    assert "polyline" in df.columns
+    assert df["polyline"].isna().tolist() == [True, False]
+    assert df["polyline"].iloc[1] == "abc"
+    assert movdebug_store.PARTITION_COLUMN not in df.columns
+    assert str(df["transportMode"].dtype) == "category"
+    assert str(df["trip_id"].dtype) == "string"
+
+
+def test_polyline_first_then_without(tmp_path):
+    movdebug_store.append_trip_instances(_trips({"db_record_id": 1, "polyline": "abc"}), tmp_path)
+    movdebug_store.append_trip_instances(_trips({"db_record_id": 2}), tmp_path)
+
+    df = movdebug_store.load_trip_instances(tmp_path, columns=["db_record_id", "polyline"])
+
+    assert df.sort_values("db_record_id")["polyline"].isna().tolist() == [False, True]
+
+
+def test_columns_and_filters(tmp_path):
+    movdebug_store.append_trip_instances(_trips({"db_record_id": 1}, {"db_record_id": 2, "trip_id": "t2"}), tmp_path)
+
+    df = movdebug_store.load_trip_instances(tmp_path, columns=["trip_id"], filters=[("db_record_id", ">", 1)])
+
+    assert df.columns.tolist() == ["trip_id"]
+    assert df["trip_id"].tolist() == ["t2"]
+
+
+def test_missing_store(tmp_path):
+    assert movdebug_store.load_trip_instances(tmp_path) is None
@@ -0,0 +1,120 @@
+"""
+Benchmark de la limpieza de markdown: versión compilada (`markdown_cleaner.py`)
+contra la implementación original de `SentianceAnalyzer.clean_markdown_content`.
+
+Limpia todos los `*.md` del directorio con ambas versiones, mide el tiempo
+total (mejor de `--repeat` corridas) y verifica que las salidas sean idénticas
+archivo por archivo.
+
+Uso:
+    python bench_cleaner.py <docs_directory> [--repeat 5]
+"""
+import argparse
+import re
+import sys
+import time
+from pathlib import Path
+
+from markdown_cleaner import clean_markdown_content
+
+
+def clean_markdown_content_legacy(text: str) -> str:
+    """
+    Strips navigation noise, logos, and flattens links to save tokens.
+    Preserves the 'Source: <URL>' line.
+    """
+    lines = text.split('\n')
+    cleaned_lines = []
+
+    # 1. Patterns to skip entirely
+    skip_patterns = [
+        r'^bars\[!\[Logo\]', # GitBook logo/nav header
+        r'^search$',
+        r'^circle-xmark$',
+        r'^`Ctrl``k`$',
+        r'^Moreellipsischevron-down$',
+        r'^chevron-upchevron-down$',
+        r'^\[gitbookPowered by GitBook\]',
+        r'^xmark$',
+        r'^block-quoteOn this page',
+        r'^sun-brightdesktopmoon$',
+        r'^copyCopychevron-down$',
+        r'^\[hashtag\]',
+        r'^circle-exclamation$',
+        r'^circle-info$',
+        r'^\[Previous.*\]\(.*\)', # Nav links
+        r'^\[Next.*\]\(.*\)',
+        r'^Last updated .* ago$',
+    ]
+
+    # 2. Sidebar/Menu link pattern: '* [Text](https://docs.sentiance.com/...)'
+    menu_link_pattern = re.compile(r'^\s*\* \[.*\]\(https://docs\.sentiance\.com/.*\)$')
+
+    for line in lines:
+        line_trimmed = line.strip()
+
+        # Keep Source URL
+        if line_trimmed.startswith("Source:"):
+            cleaned_lines.append(line)
+            continue
+
+        # Skip noise patterns
+        if any(re.search(p, line_trimmed) for p in skip_patterns):
+            continue
+
+        # Skip menu/sidebar links
+        if menu_link_pattern.match(line_trimmed):
+            continue
+
+        # 3. Flatten links: [Text](URL) -> Text (except for things that look like actual info)
+        # But keep code blocks as is
+        if '```' not in line:
+            line = re.sub(r'\[([^\]]+)\]\([^\)]+\)', r'\1', line)
+
+        # 4. Remove image markers
+        line = re.sub(r'!\[[^\]]*\]\([^\)]+\)', '', line)
+
+        if line.strip() or (cleaned_lines and cleaned_lines[-1].strip()):
+            cleaned_lines.append(line)
+
+    return '\n'.join(cleaned_lines)
+
+
+def _best_time(cleaner, texts, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        outputs = [cleaner(text) for text in texts]
+        best = min(best, time.perf_counter() - start)
+    return best, outputs
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compara la limpieza compilada con la original.")
+    parser.add_argument("docs_dir", help="Directorio con los .md scrapeados")
+    parser.add_argument("--repeat", type=int, default=5, help="Corridas por versión (se toma la mejor)")
+    args = parser.parse_args()
+
+    paths = sorted(Path(args.docs_dir).glob("*.md"))
+    if not paths:
+        print(f"❌ No hay archivos .md en {args.docs_dir}")
+        sys.exit(1)
+    texts = [path.read_text(encoding="utf-8", errors="replace") for path in paths]
+    total_mb = sum(len(text) for text in texts) / 1e6
+    print(f"📚 {len(paths)} archivos, {total_mb:.1f} MB de texto")
+
+    legacy_time, legacy_out = _best_time(clean_markdown_content_legacy, texts, args.repeat)
+    compiled_time, compiled_out = _best_time(clean_markdown_content, texts, args.repeat)
+
+    print(f"  original:  {legacy_time * 1000:8.1f} ms")
+    print(f"  compilada: {compiled_time * 1000:8.1f} ms  ({legacy_time / compiled_time:.1f}x)")
+
+    different = [path.name for path, old, new in zip(paths, legacy_out, compiled_out) if old != new]
+    if different:
+        print(f"❌ {len(different)} archivos con salida distinta: {different[:10]}")
+        sys.exit(1)
+    print("✅ Salidas idénticas en todos los archivos")
+
+
+if __name__ == "__main__":
+    main()
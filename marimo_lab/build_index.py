@@ -4,20 +4,29 @@ One-time script: Build keyword index from all documentation files.
 Run: python build_index.py docs/ keywords.json
 """
 
+import asyncio
 import json
 import os
+import random
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
 from pathlib import Path
+import aiohttp
 import requests
 from typing import Dict, List
 import re
 from dotenv import load_dotenv
 
+# Caché en disco de respuestas del LLM, en este mismo directorio
+import llm_cache
+
 # Load environment variables from .env
 load_dotenv()
 
 # OpenRouter configuration
 OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")
-OPENROUTER_BASE_URL = "https://openrouter.ai/api/v1/chat/completions"
+# Se puede apuntar a otro servidor compatible (p. ej. uno local de pruebas)
+OPENROUTER_BASE_URL = os.getenv("OPENROUTER_BASE_URL", "https://openrouter.ai/api/v1/chat/completions")
 
 # Model selection - CHANGE THIS TO SAVE MONEY
 # MODEL = "google/gemini-2.0-flash-exp:free"  # FREE!
@@ -25,6 +34,14 @@ MODEL = "qwen/qwen-2.5-72b-instruct"      # $0.35/1M (best paid)
 # MODEL = "mistralai/mistral-small"         # $0.20/1M (cheapest)
 # MODEL = "meta-llama/llama-3.1-8b-instruct:free"  # FREE
 
+# Lotes en vuelo a la vez, reintentos ante 429/5xx y espera base del backoff
+CONCURRENCY = int(os.getenv("INDEX_CONCURRENCY", "8"))
+MAX_RETRIES = 5
+BACKOFF_SECONDS = 2.0
+# Tope de cada espera entre reintentos (incluido Retry-After): el lugar del semáforo sigue ocupado mientras tanto
+MAX_RETRY_DELAY = 60.0
+REQUEST_TIMEOUT = 120
+
 def call_openrouter(prompt: str, model: str = MODEL) -> str:
     """Call OpenRouter API."""
     headers = {
@@ -38,10 +55,14 @@ def call_openrouter(prompt: str, model: str = MODEL) -> str:
         "temperature": 0
     }
     
-    response = requests.post(OPENROUTER_BASE_URL, headers=headers, json=payload)
-    response.raise_for_status()
-    
-    return response.json()["choices"][0]["message"]["content"]
+    def fetch():
+        response = requests.post(OPENROUTER_BASE_URL, headers=headers, json=payload)
+        response.raise_for_status()
+        
+        return response.json()["choices"][0]["message"]["content"]
+
+    # Relanzar el script tras un corte reutiliza las respuestas ya obtenidas
+    return llm_cache.default_cache().cached_call(payload, fetch)
 
 def extract_json_from_response(text: str) -> dict:
     """Extract JSON from LLM response."""
@@ -51,32 +72,9 @@ def extract_json_from_response(text: str) -> dict:
         return json.loads(json_match.group())
     return {}
 
-def build_keyword_index(docs_dir: str, output_path: str = "keywords.json"):
-    """
-    Build keyword index for all documentation files.
-    LLM reads each file and extracts relevant keywords.
-    """
-    
-    all_files = list(Path(docs_dir).glob("*.md"))
-    print(f"📚 Found {len(all_files)} documentation files")
-    
-    keyword_index = {}
-    
-    # Process in batches of 5 files
-    batch_size = 5
-    for i in range(0, len(all_files), batch_size):
-        batch = all_files[i:i+batch_size]
-        
-        # Read file contents
-        files_content = {}
-        for filepath in batch:
-            with open(filepath, 'r', encoding='utf-8') as f:
-                # Read first 2000 chars (enough for keyword extraction)
-                content = f.read()[:2000]
-                files_content[filepath.name] = content
-        
-        # Ask LLM to extract keywords
-        prompt = f"""
+def _batch_prompt(files_content: Dict[str, str]) -> str:
+    """Prompt que pide la URL de origen y las palabras clave de un lote de archivos."""
+    return f"""
 Extract the Source URL and TOP 10 KEYWORDS for each documentation file below.
 Each file starts with "Source: <URL>".
 
@@ -95,21 +93,150 @@ Return ONLY valid JSON (no markdown, no explanations):
 
 Focus on technical terms, API names, and domain concepts.
 """
+
+def _backoff_delay(attempt: int) -> float:
+    """Backoff exponencial con jitter, con tope MAX_RETRY_DELAY."""
+    return min(MAX_RETRY_DELAY, BACKOFF_SECONDS * 2 ** attempt + random.uniform(0, BACKOFF_SECONDS))
+
+def _retry_delay(response, attempt: int) -> float:
+    """Segundos a esperar antes de reintentar: Retry-After si viene (con tope MAX_RETRY_DELAY), si no backoff."""
+    retry_after = response.headers.get("Retry-After")
+    if retry_after:
+        try:
+            return min(MAX_RETRY_DELAY, max(0.0, float(retry_after)))
+        except ValueError:
+            try:
+                seconds = (parsedate_to_datetime(retry_after) - datetime.now(timezone.utc)).total_seconds()
+                return min(MAX_RETRY_DELAY, max(0.0, seconds))
+            except (TypeError, ValueError):
+                pass
+    return _backoff_delay(attempt)
+
+async def call_openrouter_async(session, semaphore, payload: dict) -> str:
+    """
+    Llamada asíncrona a OpenRouter: a lo sumo `CONCURRENCY` a la vez (semáforo) y
+    con reintentos ante 429 (límite de tasa), errores 5xx del proveedor y fallas
+    transitorias de red (conexión cortada, timeout).
+    """
+    headers = {
+        "Authorization": f"Bearer {OPENROUTER_API_KEY}",
+        "Content-Type": "application/json"
+    }
+    async with semaphore:
+        for attempt in range(MAX_RETRIES + 1):
+            try:
+                async with session.post(OPENROUTER_BASE_URL, headers=headers, json=payload) as response:
+                    retryable = response.status == 429 or response.status >= 500
+                    if retryable and attempt < MAX_RETRIES:
+                        delay = _retry_delay(response, attempt)
+                        reason = f"HTTP {response.status}"
+                    else:
+                        response.raise_for_status()
+                        data = await response.json(content_type=None)
+                        return data["choices"][0]["message"]["content"]
+            except aiohttp.ClientResponseError:
+                # Respuesta HTTP definitiva (4xx): reintentar no cambia nada
+                raise
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if attempt >= MAX_RETRIES:
+                    raise
+                delay = _backoff_delay(attempt)
+                reason = type(e).__name__
+            print(f"   ⏳ {reason}, retrying in {delay:.1f}s ({attempt + 1}/{MAX_RETRIES})")
+            await asyncio.sleep(delay)
+
+def _save_checkpoint(keyword_index: dict, output_path: str):
+    """Escribe el índice de forma atómica: un corte nunca deja un keywords.json a medias."""
+    tmp_path = f"{output_path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(keyword_index, f, indent=2)
+    os.replace(tmp_path, output_path)
+
+def _load_checkpoint(output_path: str) -> dict:
+    """Índice ya guardado por una corrida anterior (vacío si no existe o está dañado)."""
+    try:
+        with open(output_path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+    return data if isinstance(data, dict) else {}
+
+async def build_keyword_index_async(docs_dir: str, output_path: str = "keywords.json",
+                                    concurrency: int = CONCURRENCY) -> dict:
+    """
+    Build keyword index for all documentation files.
+    LLM reads each file and extracts relevant keywords.
+
+    Los lotes se envían en paralelo (hasta `concurrency` a la vez) por una única
+    sesión HTTP con conexiones keep-alive. Cada lote terminado se guarda en
+    `output_path`, y una nueva corrida sólo procesa los archivos que faltan.
+    """
+    
+    all_files = sorted(Path(docs_dir).glob("*.md"))
+    print(f"📚 Found {len(all_files)} documentation files")
+    
+    # Reanudar: los archivos que ya están en el índice no se vuelven a procesar
+    keyword_index = _load_checkpoint(output_path)
+    pending = [filepath for filepath in all_files if filepath.name not in keyword_index]
+    if keyword_index:
+        print(f"♻️  Resuming: {len(keyword_index)} files already indexed, {len(pending)} pending")
+    
+    # Process in batches of 5 files
+    batch_size = 5
+    batches = [pending[i:i+batch_size] for i in range(0, len(pending), batch_size)]
+    cache = llm_cache.default_cache()
+    done = 0
+    
+    async def process_batch(number: int, batch: List[Path]):
+        nonlocal done
+        # Read file contents
+        files_content = {}
+        for filepath in batch:
+            with open(filepath, 'r', encoding='utf-8') as f:
+                # Read first 2000 chars (enough for keyword extraction)
+                content = f.read()[:2000]
+                files_content[filepath.name] = content
         
-        print(f"🤖 Processing batch {i//batch_size + 1}/{(len(all_files)-1)//batch_size + 1}...")
+        # Ask LLM to extract keywords
+        payload = {
+            "model": MODEL,
+            "messages": [{"role": "user", "content": _batch_prompt(files_content)}],
+            "temperature": 0
+        }
         
         try:
-            response = call_openrouter(prompt)
+            # Misma clave que call_openrouter: una corrida interrumpida reutiliza lo ya pagado
+            key = llm_cache.cache_key(payload)
+            # SQLite es bloqueante: fuera del event loop para no frenar los otros lotes
+            response = await asyncio.to_thread(cache.get, key) if cache.enabled else None
+            if response is None:
+                response = await call_openrouter_async(session, semaphore, payload)
             batch_keywords = extract_json_from_response(response)
-            keyword_index.update(batch_keywords)
-            print(f"   ✅ Indexed {len(batch_keywords)} files")
+            if cache.enabled and batch_keywords:
+                await asyncio.to_thread(cache.put, key, response, MODEL)
         except Exception as e:
-            print(f"   ❌ Error: {e}")
-            continue
+            done += 1
+            print(f"   ❌ Batch {number}/{len(batches)} error: {e}")
+            return
+        
+        keyword_index.update(batch_keywords)
+        # Checkpoint después de cada lote terminado
+        _save_checkpoint(keyword_index, output_path)
+        done += 1
+        print(f"🤖 Batch {number}/{len(batches)} done ({done}/{len(batches)}): ✅ Indexed {len(batch_keywords)} files")
+        # Los archivos que el modelo omitió quedan pendientes para la próxima corrida
+        missing = [filepath.name for filepath in batch if filepath.name not in batch_keywords]
+        if missing:
+            print(f"   ⚠️  Batch {number}/{len(batches)} missing {len(missing)} files: {', '.join(missing)}")
+    
+    semaphore = asyncio.Semaphore(concurrency)
+    timeout = aiohttp.ClientTimeout(total=REQUEST_TIMEOUT)
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(timeout=timeout, connector=connector) as session:
+        await asyncio.gather(*(process_batch(n, batch) for n, batch in enumerate(batches, 1)))
     
     # Save to file
-    with open(output_path, 'w', encoding='utf-8') as f:
-        json.dump(keyword_index, f, indent=2)
+    _save_checkpoint(keyword_index, output_path)
     
     print(f"\n✅ Keyword index saved to {output_path}")
     print(f"📊 Total files indexed: {len(keyword_index)}")
@@ -121,6 +248,13 @@ Focus on technical terms, API names, and domain concepts.
     
     return keyword_index
 
+def build_keyword_index(docs_dir: str, output_path: str = "keywords.json"):
+    """
+    Build keyword index for all documentation files.
+    LLM reads each file and extracts relevant keywords.
+    """
+    return asyncio.run(build_keyword_index_async(docs_dir, output_path))
+
 if __name__ == "__main__":
     import sys
     
@@ -11,12 +11,16 @@ import requests
 import re
 from dotenv import load_dotenv
 
+# Caché en disco de respuestas del LLM, en este mismo directorio
+import llm_cache
+
 # Load environment variables from .env
 load_dotenv()
 
 # OpenRouter configuration
 OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")
-OPENROUTER_BASE_URL = "https://openrouter.ai/api/v1/chat/completions"
+# Se puede apuntar a otro servidor compatible (p. ej. uno local de pruebas)
+OPENROUTER_BASE_URL = os.getenv("OPENROUTER_BASE_URL", "https://openrouter.ai/api/v1/chat/completions")
 
 # Model selection
 MODEL = "google/gemini-2.0-flash-001"
@@ -34,10 +38,14 @@ def call_openrouter(prompt: str, model: str = MODEL) -> str:
         "temperature": 0
     }
     
-    response = requests.post(OPENROUTER_BASE_URL, headers=headers, json=payload)
-    response.raise_for_status()
-    
-    return response.json()["choices"][0]["message"]["content"]
+    def fetch():
+        response = requests.post(OPENROUTER_BASE_URL, headers=headers, json=payload)
+        response.raise_for_status()
+        
+        return response.json()["choices"][0]["message"]["content"]
+
+    # Relanzar el script tras un corte reutiliza las respuestas ya obtenidas
+    return llm_cache.default_cache().cached_call(payload, fetch)
 
 def extract_json_from_response(text: str) -> dict:
     """Extract JSON from LLM response."""
@@ -0,0 +1,116 @@
+"""
+Caché persistente (SQLite) de la documentación ya limpia para `sentiance_analyzer.py`.
+
+Limpiar los markdown scrapeados (`clean_markdown_content`) en cada arranque del
+notebook obliga a leer y pasar expresiones regulares por todo el directorio de
+documentación. Esta caché guarda el texto limpio en disco, así el arranque y las
+primeras consultas sólo leen filas de SQLite, y varias sesiones de notebook
+comparten la misma caché caliente (modo WAL: lectores y un escritor a la vez).
+
+Cada fila se identifica por (ruta, versión del limpiador, largo máximo leído) y
+guarda el `mtime` y el tamaño del archivo: si el archivo cambió, o si cambió la
+versión del limpiador, la fila no sirve y se vuelve a limpiar (y se reemplaza).
+
+Configuración (entorno):
+    DOC_CACHE_PATH  archivo de la base (por defecto ~/.cache/marimo_lab/docs.sqlite)
+"""
+import os
+import sqlite3
+import threading
+from pathlib import Path
+
+DEFAULT_PATH = Path.home() / ".cache" / "marimo_lab" / "docs.sqlite"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS cleaned_docs (
+    path TEXT NOT NULL,
+    cleaner_version TEXT NOT NULL,
+    max_chars INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    content TEXT NOT NULL,
+    CONSTRAINT pk_cleaned_docs PRIMARY KEY (path, cleaner_version, max_chars)
+);
+"""
+
+
+class DocCache:
+    """Textos limpios por archivo, en SQLite, seguros entre hilos y entre procesos."""
+
+    def __init__(self, path=None):
+        self.path = Path(path or os.getenv("DOC_CACHE_PATH") or DEFAULT_PATH)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.hits = 0
+        self.misses = 0
+
+        self._lock = threading.Lock()
+        # Otro notebook puede estar escribiendo: se espera en lugar de fallar con "database is locked"
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        with self._conn:
+            self._conn.executescript(_SCHEMA)
+
+    def get(self, filepath, cleaner, cleaner_version, max_chars=None):
+        """
+        Texto limpio de `filepath`: los primeros `max_chars` caracteres del archivo
+        (todo si es None) pasados por `cleaner`. Se lee de la caché si el archivo
+        no cambió desde que se guardó con la misma `cleaner_version`.
+        """
+        filepath = Path(filepath).resolve()
+        stat = filepath.stat()
+        key = (str(filepath), str(cleaner_version), -1 if max_chars is None else max_chars)
+
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT mtime_ns, size, content FROM cleaned_docs"
+                " WHERE path=? AND cleaner_version=? AND max_chars=?", key).fetchone()
+        if row is not None and row[0] == stat.st_mtime_ns and row[1] == stat.st_size:
+            self.hits += 1
+            return row[2]
+
+        self.misses += 1
+        with open(filepath, 'r', encoding='utf-8') as f:
+            raw_text = f.read() if max_chars is None else f.read(max_chars)
+        content = cleaner(raw_text)
+        with self._lock:
+            with self._conn:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO cleaned_docs"
+                    " (path, cleaner_version, max_chars, mtime_ns, size, content)"
+                    " VALUES (?, ?, ?, ?, ?, ?)",
+                    key + (stat.st_mtime_ns, stat.st_size, content))
+        return content
+
+    def prune(self, cleaner_version):
+        """Borra las filas de otras versiones del limpiador; devuelve cuántas borró."""
+        with self._lock:
+            with self._conn:
+                cursor = self._conn.execute(
+                    "DELETE FROM cleaned_docs WHERE cleaner_version <> ?", (str(cleaner_version),))
+            return cursor.rowcount
+
+    def stats(self):
+        """Cantidad de filas y bytes de texto guardados."""
+        with self._lock:
+            count, nbytes = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(length(CAST(content AS BLOB))), 0) FROM cleaned_docs").fetchone()
+        return {"path": str(self.path), "entries": count, "bytes": nbytes,
+                "hits": self.hits, "misses": self.misses}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_default = None
+_default_lock = threading.Lock()
+
+
+def default_cache():
+    """Caché compartida por todo el proceso (las celdas del notebook se re-ejecutan)."""
+    global _default
+    with _default_lock:
+        if _default is None:
+            _default = DocCache()
+        return _default
@@ -0,0 +1,201 @@
+"""
+Índice invertido local (BM25F) sobre la documentación scrapeada del SDK.
+
+Reemplaza al "router" por LLM de `sentiance_analyzer.py`: en lugar de mandar el
+JSON y un volcado truncado de `SALIDA.json` a un modelo para que elija archivos,
+se buscan las claves y valores del JSON en un índice armado en memoria. La
+consulta tarda milisegundos y ve todos los archivos (no sólo los primeros
+10.000 caracteres del índice de palabras clave).
+
+Cada documento tiene varios campos, con distinto peso (`FIELD_BOOSTS`):
+- `keywords`: la lista del índice de palabras clave, sin la URL de origen.
+- `symbols`: identificadores que aparecen en el texto: `código`, nombres
+  CamelCase, constantes EN_MAYÚSCULAS y llamadas `metodo(`.
+- `title`: nombre del archivo y encabezados markdown.
+- `body`: el texto completo.
+
+Los términos se separan en CamelCase y snake_case y además se conserva la
+palabra entera sin guiones bajos: "transportMode" y "transport_mode" generan
+"transportmode", "transport" y "mode", así una clave del JSON encuentra tanto
+el nombre exacto como las palabras sueltas de la documentación.
+
+Uso desde la línea de comandos (para probar qué archivos elige):
+    python doc_index.py <docs_dir> [SALIDA.json] transportMode CAR distance
+"""
+import heapq
+import math
+import re
+from collections import Counter, defaultdict
+from functools import lru_cache
+from pathlib import Path
+
+# Peso de cada campo en la frecuencia combinada de BM25F
+FIELD_BOOSTS = {"keywords": 3.0, "symbols": 2.5, "title": 2.0, "body": 1.0}
+# Parámetros habituales de BM25: saturación de la frecuencia y normalización por largo
+K1 = 1.2
+B = 0.75
+
+_WORD_RE = re.compile(r"[A-Za-z][A-Za-z0-9_]*")
+# Partes de un identificador: "getUserContext" -> get, User, Context; "HTTPClient" -> HTTP, Client
+_CAMEL_RE = re.compile(r"[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|[0-9]+")
+_CODE_RE = re.compile(r"`([^`\n]+)`")
+_IDENTIFIER_RE = re.compile(
+    r"\b(?:[a-z]+[A-Z]\w*"              # camelCase
+    r"|[A-Z][a-z0-9]+[A-Z]\w*"          # PascalCase compuesto
+    r"|[A-Z]{2,}(?:_[A-Z0-9]+)+"        # CONSTANTES_DE_ENUM
+    r"|\w+(?=\())"                      # llamadas: metodo(
+)
+_HEADING_RE = re.compile(r"^#{1,6}\s+(.+)$", re.MULTILINE)
+
+# Palabras vacías del inglés que no ayudan a distinguir documentos
+STOPWORDS = frozenset(
+    "a an and are as at be by can for from has have if in is it its of on or "
+    "that the this to was will with you your".split()
+)
+
+
+@lru_cache(maxsize=65536)
+def _word_terms(word):
+    # Las mismas palabras se repiten en toda la documentación: se parten una sola vez
+    terms = [word.replace("_", "").lower()]
+    parts = _CAMEL_RE.findall(word)
+    if len(parts) > 1:
+        terms.extend(part.lower() for part in parts)
+    return tuple(term for term in terms if len(term) > 1 and term not in STOPWORDS)
+
+
+def tokenize(text):
+    """Términos de búsqueda de `text`, en minúsculas, partiendo CamelCase y snake_case."""
+    return [term for word in _WORD_RE.findall(text) for term in _word_terms(word)]
+
+
+def _term_counts(text):
+    # Cuenta primero las palabras y recién después las parte en términos
+    counts = Counter()
+    for word, n in Counter(_WORD_RE.findall(text)).items():
+        for term in _word_terms(word):
+            counts[term] += n
+    return counts
+
+
+def document_fields(name, text="", keywords=()):
+    """Campos de un documento a partir de su nombre, su texto y sus palabras clave."""
+    symbols = _CODE_RE.findall(text) + _IDENTIFIER_RE.findall(text)
+    return {
+        # El primer elemento de cada lista del índice es la URL de origen
+        "keywords": " ".join(str(k) for k in keywords if not str(k).startswith("http")),
+        "symbols": " ".join(symbols),
+        "title": " ".join([Path(name).stem.replace("-", " ")] + _HEADING_RE.findall(text)),
+        "body": text,
+    }
+
+
+class DocIndex:
+    """
+    Índice BM25F en memoria. `documents` es `{nombre_de_archivo: {campo: texto}}`
+    (ver `document_fields`); el índice se calcula completo al construirlo.
+    """
+
+    def __init__(self, documents, boosts=None, k1=K1, b=B):
+        self.boosts = dict(FIELD_BOOSTS if boosts is None else boosts)
+        self.k1 = k1
+        self.b = b
+        self.docs = list(documents)
+        # término -> {id de documento: puntaje BM25F del término en ese documento}
+        self._postings = {}
+        self._build([documents[name] for name in self.docs])
+
+    @classmethod
+    def from_directory(cls, docs_dir, keyword_index=None, reader=None, **kwargs):
+        """
+        Índice de los `*.md` de `docs_dir` más las palabras clave de `keyword_index`
+        (`{archivo: [url, palabra, ...]}`). `reader(path)` devuelve el texto a
+        indexar de cada archivo (por ejemplo ya limpio); por defecto se lee entero.
+        Los archivos que sólo figuran en `keyword_index` se indexan por sus palabras clave.
+        """
+        keyword_index = keyword_index or {}
+        if reader is None:
+            def reader(path):
+                return path.read_text(encoding="utf-8", errors="replace")
+
+        docs_path = Path(docs_dir)
+        paths = {path.name: path for path in docs_path.glob("*.md")} if docs_path.is_dir() else {}
+        documents = {}
+        for name in sorted(set(paths) | set(keyword_index)):
+            text = reader(paths[name]) if name in paths else ""
+            documents[name] = document_fields(name, text, keyword_index.get(name) or ())
+        return cls(documents, **kwargs)
+
+    def __len__(self):
+        return len(self.docs)
+
+    def _build(self, documents):
+        # Frecuencia de cada término por campo y largo de cada campo
+        field_counts = [{field: _term_counts(fields.get(field, "")) for field in self.boosts}
+                        for fields in documents]
+        avg_length = {}
+        for field in self.boosts:
+            total = sum(sum(counts[field].values()) for counts in field_counts)
+            avg_length[field] = total / len(documents) if documents else 0.0
+
+        # BM25F: frecuencias normalizadas por el largo de cada campo y ponderadas por su peso
+        weighted = defaultdict(dict)
+        for doc_id, counts in enumerate(field_counts):
+            for field, boost in self.boosts.items():
+                field_terms = counts[field]
+                if not field_terms or not avg_length[field]:
+                    continue
+                norm = 1 - self.b + self.b * sum(field_terms.values()) / avg_length[field]
+                for term, tf in field_terms.items():
+                    postings = weighted[term]
+                    postings[doc_id] = postings.get(doc_id, 0.0) + boost * tf / norm
+
+        # La saturación y el IDF no dependen de la consulta: se guardan ya aplicados
+        n_docs = len(documents)
+        for term, postings in weighted.items():
+            idf = math.log(1 + (n_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+            self._postings[term] = {doc_id: idf * tf / (self.k1 + tf) for doc_id, tf in postings.items()}
+
+    def search(self, terms, limit=4):
+        """
+        Los `limit` documentos que mejor responden a `terms` (textos sueltos, por
+        ejemplo claves y valores de un JSON), como lista de `(archivo, puntaje)`.
+        Cada término cuenta una sola vez aunque se repita en la consulta.
+        """
+        query = set()
+        for term in terms:
+            query.update(tokenize(str(term)))
+
+        scores = defaultdict(float)
+        for term in query:
+            for doc_id, score in self._postings.get(term, {}).items():
+                scores[doc_id] += score
+        best = heapq.nlargest(limit, scores.items(), key=lambda item: item[1])
+        return [(self.docs[doc_id], score) for doc_id, score in best]
+
+
+if __name__ == "__main__":
+    import json
+    import sys
+    import time
+
+    if len(sys.argv) < 3:
+        print("Usage: python doc_index.py <docs_directory> [keywords_json] <term> [term ...]")
+        sys.exit(1)
+
+    docs_dir, rest = sys.argv[1], sys.argv[2:]
+    keyword_index = {}
+    if rest[0].endswith(".json"):
+        with open(rest[0], "r", encoding="utf-8") as f:
+            keyword_index = json.load(f)
+        rest = rest[1:]
+
+    start = time.perf_counter()
+    index = DocIndex.from_directory(docs_dir, keyword_index)
+    built = time.perf_counter()
+    results = index.search(rest, limit=10)
+    searched = time.perf_counter()
+
+    print(f"📚 {len(index)} documentos indexados en {built - start:.2f} s; búsqueda en {(searched - built) * 1000:.1f} ms")
+    for name, score in results:
+        print(f"  {score:7.2f}  {name}")
@@ -0,0 +1,123 @@
+"""
+Visor de JSON en árbol, perezoso y plegable, para los notebooks de marimo.
+
+Mostrar un payload completo con `json.dumps(indent=...)` en un `text_area` obliga
+a decodificarlo, formatearlo y enviarlo entero al navegador, aunque tenga miles
+de waypoints. Este visor:
+- decodifica el texto recién cuando se abre el nodo raíz,
+- arma cada nivel como un `mo.accordion` cuyos hijos son `mo.lazy(...)`, así
+  sólo se construyen los nodos que el usuario expande,
+- resume los arreglos grandes (cantidad, primeros y últimos elementos) y los
+  parte en tramos que también se cargan al abrirlos.
+"""
+import os
+import sys
+
+import marimo as mo
+
+# `sentiance_common` vive en la raíz del repositorio (un nivel arriba de marimo_lab/)
+_REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+if _REPO_ROOT not in sys.path:
+    sys.path.insert(0, _REPO_ROOT)
+
+from sentiance_common import fastjson
+
+# Arreglos con más elementos que esto se muestran resumidos y partidos en tramos
+LARGE_ARRAY = 20
+ARRAY_CHUNK = 100
+# Cantidad de elementos que se muestran al principio y al final del resumen
+PREVIEW_ITEMS = 2
+# Largo máximo de la vista en una línea de un elemento
+PREVIEW_CHARS = 160
+
+
+def looks_like_json(value):
+    """Indica si `value` es texto que parece un objeto o arreglo JSON (sin decodificarlo)."""
+    return isinstance(value, str) and value.lstrip().startswith(("{", "["))
+
+
+def _preview(value):
+    text = fastjson.dumps(value)
+    text = text if len(text) <= PREVIEW_CHARS else text[:PREVIEW_CHARS] + "…"
+    # `|` rompería las tablas markdown y "`" el formato de código
+    return text.replace("|", "\\|").replace("`", "'")
+
+
+def _title(key, value):
+    if isinstance(value, dict):
+        return f"{key}: {{{len(value)} claves}}"
+    if isinstance(value, list):
+        return f"{key}: [{len(value)} elementos]"
+    return str(key)
+
+
+def _scalars_table(pairs):
+    rows = "\n".join(f"| `{key}` | `{_preview(value)}` |" for key, value in pairs)
+    return mo.md(f"| Clave | Valor |\n|---|---|\n{rows}")
+
+
+def _children(items):
+    """Escalares en una tabla; objetos y arreglos como secciones plegables perezosas."""
+    scalars = [(key, value) for key, value in items if not isinstance(value, (dict, list))]
+    containers = [(key, value) for key, value in items if isinstance(value, (dict, list))]
+
+    parts = []
+    if scalars:
+        parts.append(_scalars_table(scalars))
+    if containers:
+        parts.append(mo.accordion(
+            {_title(key, value): mo.lazy(lambda value=value: render(value)) for key, value in containers},
+            multiple=True
+        ))
+    if not parts:
+        return mo.md("_vacío_")
+    return mo.vstack(parts, gap=0.5)
+
+
+def _large_array(values):
+    head = [(i, values[i]) for i in range(PREVIEW_ITEMS)]
+    tail = [(i, values[i]) for i in range(len(values) - PREVIEW_ITEMS, len(values))]
+    summary = "\n".join(f"- `[{i}]` `{_preview(v)}`" for i, v in head)
+    summary += "\n- …\n"
+    summary += "\n".join(f"- `[{i}]` `{_preview(v)}`" for i, v in tail)
+
+    chunks = {}
+    for start in range(0, len(values), ARRAY_CHUNK):
+        stop = min(start + ARRAY_CHUNK, len(values))
+        chunks[f"[{start} … {stop - 1}]"] = mo.lazy(
+            lambda start=start, stop=stop: _children([(i, values[i]) for i in range(start, stop)])
+        )
+
+    return mo.vstack([
+        mo.md(f"**{len(values)} elementos**\n\n{summary}"),
+        mo.accordion(chunks, multiple=True)
+    ], gap=0.5)
+
+
+def render(value):
+    """Vista de un valor ya decodificado: sólo su primer nivel, el resto se arma al expandir."""
+    if isinstance(value, dict):
+        return _children(list(value.items()))
+    if isinstance(value, list):
+        if len(value) > LARGE_ARRAY:
+            return _large_array(value)
+        return _children(list(enumerate(value)))
+    return mo.md(f"`{_preview(value)}`")
+
+
+def json_tree(raw, label="JSON", expanded=False):
+    """
+    Árbol plegable para el texto JSON `raw` (o un `dict`/`list` ya decodificado).
+
+    El texto se decodifica recién al abrir la sección `label`; si no es JSON
+    válido se muestra el texto tal cual.
+    """
+    def _load():
+        try:
+            value = fastjson.loads(raw) if isinstance(raw, (str, bytes)) else raw
+        except fastjson.JSONDecodeError:
+            return mo.ui.text_area(value=str(raw), disabled=True, rows=10)
+        return render(value)
+
+    size = f" ({len(raw):,} caracteres)" if isinstance(raw, (str, bytes)) else ""
+    return mo.accordion({f"{label}{size}": mo.lazy(_load, show_loading_indicator=True)}, expanded=expanded)
@@ -0,0 +1,136 @@
+"""
+Paginación por clave (keyset) para el explorador de `SentianceEventos` / `MovDebug_Eventos`.
+
+En lugar de `SELECT TOP 300 * ... ORDER BY fechahora DESC`, cada página se pide
+a partir de la última fila de la página anterior:
+
+    WHERE ... AND (fechahora < :cursor_fecha OR (fechahora = :cursor_fecha AND id < :cursor_id))
+    ORDER BY fechahora DESC, id DESC
+
+así el costo de cada página no depende de cuántas páginas se hayan recorrido
+(a diferencia de OFFSET), y `id` desempata filas con la misma `fechahora`.
+
+SQL Server ordena `NULL` como el valor más chico: con `DESC` las filas sin
+`fechahora` quedan al final, ordenadas por `id`. Como `fechahora < :cursor_fecha`
+nunca es verdadero para `NULL`, el cursor las agrega explícitamente
+(`OR fechahora IS NULL`), y una vez dentro de ese tramo el cursor es `(None, id)`
+y sólo avanza por `id`. Los filtros de fecha (`fechahora >= :start`, ...) sí las
+excluyen, igual que la consulta original.
+
+Las páginas traen una proyección liviana: las columnas de texto grande (como
+`JSON`) se reemplazan por su tamaño en bytes (`DATALENGTH`), y la fila completa
+se pide por `id` recién cuando el usuario la selecciona (`fetch_row`).
+"""
+import pandas as pd
+from sqlalchemy import text
+
+DATABASE = "VictaTMTK"
+SCHEMA = "dbo"
+
+# Tipos que nunca se traen en la página (sólo su tamaño)
+_HEAVY_TYPES = {"text", "ntext", "image", "xml", "varbinary"}
+
+_COLUMNS_QUERY = f"""
+SELECT COLUMN_NAME, DATA_TYPE, CHARACTER_MAXIMUM_LENGTH
+FROM {DATABASE}.INFORMATION_SCHEMA.COLUMNS
+WHERE TABLE_SCHEMA = :schema AND TABLE_NAME = :table
+ORDER BY ORDINAL_POSITION
+"""
+
+# (url del motor, tabla) -> (columnas livianas, columnas pesadas)
+_columns_cache = {}
+
+
+def qualified_name(table):
+    """Nombre completo `VictaTMTK.dbo.<tabla>`, igual que en la consulta original."""
+    return f"{DATABASE}.{SCHEMA}.{table}"
+
+
+def split_columns(engine, table):
+    """
+    Devuelve `(livianas, pesadas)`: las columnas de `table` que se muestran en la
+    página y las de texto grande (`nvarchar(max)`, `text`, ...) que se difieren.
+
+    El esquema se consulta una sola vez por motor y tabla.
+    """
+    key = (engine.url.render_as_string(hide_password=False), table)
+    cached = _columns_cache.get(key)
+    if cached is not None:
+        return cached
+
+    columns = pd.read_sql(text(_COLUMNS_QUERY), engine, params={"schema": SCHEMA, "table": table})
+    light, heavy = [], []
+    for name, data_type, max_length in columns.itertuples(index=False, name=None):
+        # CHARACTER_MAXIMUM_LENGTH = -1 indica (n)varchar(max)
+        if str(data_type).lower() in _HEAVY_TYPES or max_length == -1:
+            heavy.append(name)
+        else:
+            light.append(name)
+    _columns_cache[key] = (light, heavy)
+    return light, heavy
+
+
+def _filters(sid, start, end):
+    where, params = [], {}
+    if sid:
+        where.append("sentianceid = :sid")
+        params["sid"] = sid
+    if start:
+        where.append("fechahora >= :start")
+        params["start"] = start
+    if end:
+        where.append("fechahora <= :end")
+        params["end"] = end
+    return where, params
+
+
+def page_query(table, light, heavy, sid=None, start=None, end=None, cursor=None, page_size=300):
+    """
+    Arma `(sql, params)` para una página de `table`.
+
+    `cursor` es `(fechahora, id)` de la última fila de la página anterior, o `None`
+    para la primera página. `fechahora` es `None` si esa fila no tenía fecha.
+    """
+    columns = [f"[{c}]" for c in light] + [f"DATALENGTH([{c}]) AS [{c}_bytes]" for c in heavy]
+    where, params = _filters(sid, start, end)
+    if cursor is not None:
+        cursor_fecha, params["cursor_id"] = cursor
+        if cursor_fecha is None:
+            # Ya se está en el tramo final de filas sin fecha
+            where.append("(fechahora IS NULL AND id < :cursor_id)")
+        else:
+            where.append("(fechahora < :cursor_fecha OR (fechahora = :cursor_fecha AND id < :cursor_id)"
+                         " OR fechahora IS NULL)")
+            params["cursor_fecha"] = cursor_fecha
+
+    sql = f"SELECT TOP {int(page_size)} {', '.join(columns)} FROM {qualified_name(table)}"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY fechahora DESC, id DESC"
+    return sql, params
+
+
+def fetch_page(engine, table, sid=None, start=None, end=None, cursor=None, page_size=300):
+    """Trae una página liviana de `table` (ver `page_query`)."""
+    light, heavy = split_columns(engine, table)
+    sql, params = page_query(table, light, heavy, sid, start, end, cursor, page_size)
+    return pd.read_sql(text(sql), engine, params=params)
+
+
+def next_cursor(page_df):
+    """Cursor `(fechahora, id)` de la última fila de `page_df`, o `None` si está vacía."""
+    if page_df is None or len(page_df) == 0:
+        return None
+    last = page_df.iloc[-1]
+    fecha = last["fechahora"]
+    if pd.isna(fecha):
+        fecha = None
+    elif isinstance(fecha, pd.Timestamp):
+        fecha = fecha.to_pydatetime()
+    return fecha, int(last["id"])
+
+
+def fetch_row(engine, table, row_id):
+    """Fila completa (con las columnas pesadas) de `table` por `id`, como DataFrame de 0 o 1 filas."""
+    sql = f"SELECT * FROM {qualified_name(table)} WHERE id = :row_id"
+    return pd.read_sql(text(sql), engine, params={"row_id": int(row_id)})
@@ -0,0 +1,183 @@
+"""
+Caché de respuestas del LLM (OpenRouter) en disco, direccionada por contenido.
+
+Todas las llamadas usan `temperature: 0`: el mismo modelo con el mismo prompt y
+los mismos parámetros da la misma respuesta, así que no hace falta pagarla ni
+esperarla dos veces. La clave de cada respuesta es el SHA-256 del JSON canónico
+del cuerpo de la petición (modelo, mensajes y parámetros, claves ordenadas).
+
+- Las respuestas se guardan en SQLite (modo WAL, compartido entre procesos):
+  volver a analizar el mismo JSON o relanzar el indexador tras un corte es casi
+  instantáneo.
+- Si la base supera `max_bytes` se borran las respuestas usadas hace más tiempo.
+- Si varias llamadas idénticas llegan a la vez (hilos de un mismo proceso), sólo
+  la primera va a la red y las demás esperan su resultado.
+- Los errores no se guardan: la próxima llamada vuelve a intentar.
+
+Configuración (entorno):
+    LLM_CACHE_PATH     archivo de la base (por defecto ~/.cache/marimo_lab/llm_responses.sqlite)
+    LLM_CACHE_MAX_MB   tamaño máximo antes de descartar (por defecto 200)
+    LLM_CACHE_DISABLE  "1" para ir siempre a la red
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from pathlib import Path
+
+DEFAULT_PATH = Path.home() / ".cache" / "marimo_lab" / "llm_responses.sqlite"
+DEFAULT_MAX_MB = 200
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    model TEXT,
+    response TEXT NOT NULL,
+    nbytes INTEGER NOT NULL,
+    created REAL NOT NULL,
+    last_access REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_responses_last_access ON responses (last_access);
+"""
+
+
+def cache_key(payload):
+    """SHA-256 del JSON canónico de `payload` (el cuerpo de la petición al LLM)."""
+    canonical = json.dumps(payload, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class LLMCache:
+    """Respuestas del LLM en SQLite, con límite de tamaño (LRU) y sin llamadas duplicadas en vuelo."""
+
+    def __init__(self, path=None, max_bytes=None):
+        self.path = Path(path or os.getenv("LLM_CACHE_PATH") or DEFAULT_PATH)
+        self.max_bytes = max_bytes if max_bytes is not None else \
+            int(float(os.getenv("LLM_CACHE_MAX_MB", DEFAULT_MAX_MB)) * 1024 * 1024)
+        self.enabled = os.getenv("LLM_CACHE_DISABLE", "") != "1"
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.hits = 0
+        self.misses = 0
+
+        self._lock = threading.Lock()
+        # clave -> Future de la llamada en curso
+        self._inflight = {}
+        self._inflight_lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        with self._conn:
+            self._conn.executescript(_SCHEMA)
+        self._total = self._conn.execute("SELECT COALESCE(SUM(nbytes), 0) FROM responses").fetchone()[0]
+
+    def get(self, key):
+        """Respuesta guardada para `key`, o None. Un acierto la marca como usada recientemente."""
+        with self._lock:
+            row = self._conn.execute("SELECT response FROM responses WHERE key=?", (key,)).fetchone()
+            if row is None:
+                return None
+            with self._conn:
+                self._conn.execute("UPDATE responses SET last_access=? WHERE key=?", (time.time(), key))
+            return row[0]
+
+    def put(self, key, response, model=None):
+        """Guarda una respuesta y descarta las menos usadas si se supera el tamaño máximo."""
+        nbytes = len(response.encode("utf-8"))
+        now = time.time()
+        with self._lock:
+            with self._conn:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO responses (key, model, response, nbytes, created, last_access)"
+                    " VALUES (?, ?, ?, ?, ?, ?)", (key, model, response, nbytes, now, now))
+                # Otros procesos escriben en la misma base: el total se lee de la base
+                # (dentro de la transacción), no se acumula en memoria
+                self._total = self._conn.execute("SELECT COALESCE(SUM(nbytes), 0) FROM responses").fetchone()[0]
+                if self._total > self.max_bytes:
+                    self._evict()
+
+    def _evict(self):
+        # `self._total` se acaba de leer de la base en put(), en la misma transacción
+        # Se baja al 90% del límite para no descartar en cada escritura
+        target = self.max_bytes * 0.9
+        rows = self._conn.execute("SELECT key, nbytes FROM responses ORDER BY last_access").fetchall()
+        doomed = []
+        for key, nbytes in rows:
+            if self._total <= target:
+                break
+            doomed.append((key,))
+            self._total -= nbytes
+        self._conn.executemany("DELETE FROM responses WHERE key=?", doomed)
+
+    def cached_call(self, payload, fetch):
+        """
+        Respuesta para la petición `payload`: la guardada si existe; si no, la de
+        `fetch()` (que hace la llamada real), que se guarda para la próxima vez.
+        Las llamadas idénticas simultáneas comparten una sola `fetch()`.
+        """
+        if not self.enabled:
+            return fetch()
+
+        key = cache_key(payload)
+        cached = self.get(key)
+        if cached is not None:
+            self.hits += 1
+            return cached
+
+        with self._inflight_lock:
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._inflight[key] = future
+        if not owner:
+            self.hits += 1
+            return future.result()
+
+        try:
+            # Otro hilo pudo guardar la respuesta y soltar la llamada entre el get() de
+            # arriba y este punto: se vuelve a mirar la caché antes de ir a la red
+            cached = self.get(key)
+            if cached is not None:
+                self.hits += 1
+                future.set_result(cached)
+                return cached
+            self.misses += 1
+            response = fetch()
+            # Las respuestas vacías no se guardan: suelen ser fallas del proveedor
+            if response:
+                self.put(key, response, payload.get("model"))
+            future.set_result(response)
+            return response
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._inflight_lock:
+                self._inflight.pop(key, None)
+
+    def stats(self):
+        with self._lock:
+            count, self._total = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(nbytes), 0) FROM responses").fetchone()
+        return {"path": str(self.path), "entries": count, "bytes": self._total,
+                "max_bytes": self.max_bytes, "hits": self.hits, "misses": self.misses}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_default = None
+_default_lock = threading.Lock()
+
+
+def default_cache():
+    """Caché compartida por todo el proceso."""
+    global _default
+    with _default_lock:
+        if _default is None:
+            _default = LLMCache()
+        return _default
@@ -0,0 +1,114 @@
+"""
+Caché de resultados de consultas para los notebooks reactivos (LRU + TTL).
+
+Cada cambio de un widget de marimo vuelve a ejecutar la celda de consulta. Con
+esta caché, volver a una combinación de filtros ya vista (misma tabla, mismo
+Sentiance ID, misma ventana de tiempo) devuelve el DataFrame al instante.
+
+Ciclo de vida de cada entrada:
+- edad < `refresh_after`: se devuelve tal cual ("hit").
+- `refresh_after` <= edad < `ttl`: se devuelve el resultado guardado y se
+  relanza la consulta en segundo plano, así la próxima lectura ya está fresca
+  ("stale").
+- edad >= `ttl`, o clave ausente: se consulta en el momento ("miss").
+
+Si se superan `maxsize` entradas se descarta la menos usada recientemente.
+"""
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+
+
+def normalize_key(*parts):
+    """
+    Clave canónica para una consulta: textos sin espacios sobrantes, vacíos como
+    `None` y fechas en ISO al segundo, para que filtros equivalentes compartan entrada.
+    """
+    normalized = []
+    for part in parts:
+        if isinstance(part, str):
+            part = part.strip() or None
+        elif isinstance(part, datetime):
+            part = part.replace(microsecond=0).isoformat()
+        elif isinstance(part, date):
+            part = part.isoformat()
+        normalized.append(part)
+    return tuple(normalized)
+
+
+class QueryCache:
+    """Caché LRU con vencimiento y refresco en segundo plano, segura entre hilos."""
+
+    def __init__(self, maxsize=64, ttl=600, refresh_after=60, refresh_workers=2):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.refresh_after = refresh_after
+        # clave -> (momento de carga, resultado)
+        self._entries = OrderedDict()
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=refresh_workers, thread_name_prefix="query-cache")
+
+    def get(self, key, loader, force=False):
+        """
+        Devuelve `(resultado, estado)` para `key`, usando `loader()` si hace falta consultar.
+
+        `estado` es "hit", "stale" (se está refrescando en segundo plano) o "miss".
+        Con `force=True` se ignora lo guardado y se consulta en el momento.
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and not force:
+                loaded_at, result = entry
+                age = now - loaded_at
+                if age < self.ttl:
+                    self._entries.move_to_end(key)
+                    if age < self.refresh_after:
+                        return result, "hit"
+                    if key not in self._refreshing:
+                        self._refreshing.add(key)
+                        self._executor.submit(self._refresh, key, loader)
+                    return result, "stale"
+
+        result = loader()
+        self._store(key, result)
+        return result, "miss"
+
+    def age(self, key):
+        """Segundos desde que se cargó `key`, o `None` si no está en la caché."""
+        with self._lock:
+            entry = self._entries.get(key)
+        return None if entry is None else time.monotonic() - entry[0]
+
+    def invalidate(self, key=None):
+        """Descarta `key`, o toda la caché si no se indica clave."""
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def _store(self, key, result):
+        with self._lock:
+            self._entries[key] = (time.monotonic(), result)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def _refresh(self, key, loader):
+        try:
+            result = loader()
+        except Exception:
+            # Si el refresco falla se conserva el resultado anterior hasta que venza el TTL
+            return
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+        self._store(key, result)
@@ -31,7 +31,8 @@ def __():
     
     # OpenRouter config
     OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")
-    OPENROUTER_BASE_URL = "https://openrouter.ai/api/v1/chat/completions"
+    # Se puede apuntar a otro servidor compatible (p. ej. uno local de pruebas)
+    OPENROUTER_BASE_URL = os.getenv("OPENROUTER_BASE_URL", "https://openrouter.ai/api/v1/chat/completions")
     
     # Configure logging
     logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -70,6 +71,9 @@ def __():
 def __(OPENROUTER_API_KEY, OPENROUTER_BASE_URL, requests):
     """LLM API caller."""
 
+    # Caché en disco de respuestas del LLM (ver llm_cache.py, en este mismo directorio)
+    import llm_cache
+
     # Model selection - CHANGE THIS TO SAVE MONEY
     # MODEL = "google/gemini-2.0-flash-exp:free"  # FREE!
     MODEL = "qwen/qwen-2.5-72b-instruct"      # $0.35/1M (best paid)
@@ -93,15 +97,20 @@ def __(OPENROUTER_API_KEY, OPENROUTER_BASE_URL, requests):
             "temperature": 0
         }
         
-        response = requests.post(OPENROUTER_BASE_URL, headers=headers, json=payload)
-        
-        try:
-            response.raise_for_status()
-        except requests.exceptions.HTTPError as e:
-            logger.error(f"LLM API Error: {response.text}")
-            raise e
-        
-        return response.json()["choices"][0]["message"]["content"]
+        def fetch():
+            response = requests.post(OPENROUTER_BASE_URL, headers=headers, json=payload)
+            
+            try:
+                response.raise_for_status()
+            except requests.exceptions.HTTPError as e:
+                logger.error(f"LLM API Error: {response.text}")
+                raise e
+            
+            return response.json()["choices"][0]["message"]["content"]
+
+        # Con temperature 0 la misma petición da la misma respuesta: se reutiliza la
+        # guardada y las peticiones idénticas simultáneas se hacen una sola vez
+        return llm_cache.default_cache().cached_call(payload, fetch)
     
     return call_llm,
 
@@ -129,78 +138,52 @@ def __(KEYWORDS_INDEX, json):
 @app.cell
 def __(DOCS_DIR, Path, call_llm, global_concepts, json, keyword_index, re):
     """Main analyzer class."""
+
+    # Índice BM25 local de la documentación (ver doc_index.py, en este mismo directorio)
+    import doc_index
+    # Caché en disco (SQLite) de la documentación ya limpia, compartida entre sesiones
+    import doc_cache
+    # Limpieza de los markdown scrapeados, con las regex precompiladas
+    import markdown_cleaner
     
     class SentianceAnalyzer:
+        # Versión de la limpieza (se sube en markdown_cleaner.py cuando cambia): invalida
+        # los textos limpios guardados en la caché en disco
+        CLEANER_VERSION = markdown_cleaner.CLEANER_VERSION
+
         def __init__(self, keyword_index: dict, global_concepts: list, docs_dir: str):
             self.keyword_index = keyword_index
             self.global_concepts = global_concepts
             self.docs_dir = docs_dir
             self._file_cache = {}
+            self.doc_cache = doc_cache.default_cache()
             self._conceptual_content = ""
             
             # Pre-load conceptual content
             self._load_global_context()
+
+            # Índice invertido de toda la documentación (texto ya limpio + palabras clave):
+            # elige los archivos para cada JSON sin llamar al LLM
+            self.doc_index = doc_index.DocIndex.from_directory(
+                docs_dir, self.keyword_index, reader=self._read_for_index
+            )
+            logger.info(f"Documentation index built: {len(self.doc_index)} files ({self.doc_cache.stats()})")
         
         def clean_markdown_content(self, text: str) -> str:
             """
             Strips navigation noise, logos, and flattens links to save tokens.
             Preserves the 'Source: <URL>' line.
             """
-            lines = text.split('\n')
-            cleaned_lines = []
-            
-            # 1. Patterns to skip entirely
-            skip_patterns = [
-                r'^bars\[!\[Logo\]', # GitBook logo/nav header
-                r'^search$',
-                r'^circle-xmark$',
-                r'^`Ctrl``k`$',
-                r'^Moreellipsischevron-down$',
-                r'^chevron-upchevron-down$',
-                r'^\[gitbookPowered by GitBook\]',
-                r'^xmark$',
-                r'^block-quoteOn this page',
-                r'^sun-brightdesktopmoon$',
-                r'^copyCopychevron-down$',
-                r'^\[hashtag\]',
-                r'^circle-exclamation$',
-                r'^circle-info$',
-                r'^\[Previous.*\]\(.*\)', # Nav links
-                r'^\[Next.*\]\(.*\)',
-                r'^Last updated .* ago$',
-            ]
-            
-            # 2. Sidebar/Menu link pattern: '* [Text](https://docs.sentiance.com/...)'
-            menu_link_pattern = re.compile(r'^\s*\* \[.*\]\(https://docs\.sentiance\.com/.*\)$')
-            
-            for line in lines:
-                line_trimmed = line.strip()
-                
-                # Keep Source URL
-                if line_trimmed.startswith("Source:"):
-                    cleaned_lines.append(line)
-                    continue
-                
-                # Skip noise patterns
-                if any(re.search(p, line_trimmed) for p in skip_patterns):
-                    continue
-                
-                # Skip menu/sidebar links
-                if menu_link_pattern.match(line_trimmed):
-                    continue
-                
-                # 3. Flatten links: [Text](URL) -> Text (except for things that look like actual info)
-                # But keep code blocks as is
-                if '```' not in line:
-                    line = re.sub(r'\[([^\]]+)\]\([^\)]+\)', r'\1', line)
-                
-                # 4. Remove image markers
-                line = re.sub(r'!\[[^\]]*\]\([^\)]+\)', '', line)
-                
-                if line.strip() or (cleaned_lines and cleaned_lines[-1].strip()):
-                    cleaned_lines.append(line)
-            
-            return '\n'.join(cleaned_lines)
+            # Versión compilada, de una pasada (ver markdown_cleaner.py y bench_cleaner.py)
+            return markdown_cleaner.clean_markdown_content(text)
+
+        def _read_for_index(self, filepath: Path) -> str:
+            """Texto completo y limpio de un archivo, para el índice de búsqueda."""
+            return self._cleaned(filepath)
+
+        def _cleaned(self, filepath: Path, max_chars: int = None) -> str:
+            """Primeros `max_chars` caracteres limpios de un archivo, desde la caché en disco si no cambió."""
+            return self.doc_cache.get(filepath, self.clean_markdown_content, self.CLEANER_VERSION, max_chars)
 
         def _load_global_context(self):
             """Load a subset of conceptual files to avoid token bloat (max 10)."""
@@ -209,11 +192,9 @@ def __(DOCS_DIR, Path, call_llm, global_concepts, json, keyword_index, re):
             for filename in sorted(self.global_concepts)[:10]:
                 filepath = Path(self.docs_dir) / filename
                 if filepath.exists():
-                    with open(filepath, 'r', encoding='utf-8') as f:
-                        # Clean and truncate
-                        raw_text = f.read()[:2000]
-                        cleaned_text = self.clean_markdown_content(raw_text)
-                        contents.append(f"### CONCEPT: {filename}\n{cleaned_text}")
+                    # Clean and truncate
+                    cleaned_text = self._cleaned(filepath, max_chars=2000)
+                    contents.append(f"### CONCEPT: {filename}\n{cleaned_text}")
             self._conceptual_content = "\n\n".join(contents)
             logger.info(f"Global context loaded: {len(contents)} conceptual files (~{len(self._conceptual_content)} chars)")
         
@@ -227,7 +208,8 @@ def __(DOCS_DIR, Path, call_llm, global_concepts, json, keyword_index, re):
             logger.debug(f"🔑 JSON keywords: {json_keywords}")
             
             # Step 2: LLM picks best files from keyword index
-            selected_files = self._llm_select_files(json_obj, json_keywords)
+            # (ahora los elige el índice BM25 local; el LLM queda como respaldo)
+            selected_files = self._select_files(json_obj, json_keywords)
             logger.info(f"📄 Selected files: {selected_files}")
             
             # Step 3: Read selected files
@@ -262,6 +244,20 @@ def __(DOCS_DIR, Path, call_llm, global_concepts, json, keyword_index, re):
             extract_recursive(json_obj)
             return list(set(keywords))
         
+        def _select_files(self, json_obj: dict, json_keywords: list, limit: int = 4) -> list:
+            """
+            Elige los archivos de documentación buscando las claves y valores del JSON
+            en el índice BM25 local (milisegundos, sin red). Sólo si ninguna palabra
+            aparece en el índice se recurre al router por LLM.
+            """
+            hits = self.doc_index.search(json_keywords, limit=limit)
+            logger.debug(f"Index hits: {hits}")
+            if hits:
+                return [filename for filename, _score in hits]
+
+            logger.warning("No index matches for the JSON keywords, falling back to the LLM router")
+            return self._llm_select_files(json_obj, json_keywords)
+
         def _llm_select_files(self, json_obj: dict, json_keywords: list) -> list:
             """LLM picks best files using keyword index."""
             
@@ -318,11 +314,9 @@ No explanations, just the JSON array.
                     continue
                 
                 if filename not in self._file_cache:
-                    with open(filepath, 'r', encoding='utf-8') as f:
-                        # Read and clean content
-                        raw_text = f.read()[:4000]
-                        self._file_cache[filename] = self.clean_markdown_content(raw_text)
-                        logger.debug(f"Cached cleaner version of {filename}")
+                    # Read and clean content
+                    self._file_cache[filename] = self._cleaned(filepath, max_chars=4000)
+                    logger.debug(f"Cached cleaner version of {filename}")
                 
                 docs_content[filename] = self._file_cache[filename]
             
@@ -105,9 +105,27 @@ def _():
     import sqlalchemy
     import leafmap
     import os
-    from dotenv import load_dotenv
+    import sys
 
-    load_dotenv()
+    # Capa JSON compartida (usa orjson/msgspec si están instalados) ubicada en
+    # tools/sentiance_common, un nivel arriba de este notebook
+    repo_root = os.path.abspath(os.path.join(os.getcwd(), ".."))
+    if repo_root not in sys.path:
+        sys.path.insert(0, repo_root)
+    from sentiance_common import fastjson
+
+    # Motor de base de datos compartido: el pool de conexiones sobrevive a las
+    # re-ejecuciones reactivas de las celdas (ver sentiance_common/db.py)
+    from sentiance_common import db
+
+    # Credenciales de marimo_lab/.env (las mismas que usan las herramientas de csv_analizer)
+    db.load_env()
+
+    # Paginación por clave (fechahora, id) de las tablas de eventos, en este mismo directorio
+    import keyset_pager
+
+    # Visor de JSON en árbol, perezoso (decodifica y dibuja sólo lo que se expande)
+    import json_tree
     
     # ==========================================================================
     # SENTENCIA RETURN - EL CORAZÓN DE LA REACTIVIDAD DE MARIMO
@@ -120,7 +138,7 @@ def _():
     #   return                     - No exporta nada (la celda es un "sumidero")
     #
     # Las variables devueltas se vuelven disponibles como PARÁMETROS para otras celdas.
-    return json, leafmap, mo, os, pd, sqlalchemy
+    return db, fastjson, json, json_tree, keyset_pager, leafmap, mo, os, pd, sqlalchemy
 
 
 # =============================================================================
@@ -161,23 +179,15 @@ def _(mo):
 # CELDA 4: CREACIÓN DEL MOTOR DE BASE DE DATOS
 # =============================================================================
 @app.cell(hide_code=True)
-def _(mo, os, sqlalchemy):
+def _(db, mo):
     # Credenciales de base de datos desde variables de entorno
-    server = os.getenv("DB_SERVER")
-    database = os.getenv("DB_NAME")
-    username = os.getenv("DB_USER")
-    password = os.getenv("DB_PASS")
+    # (DB_SERVER, DB_NAME, DB_USER, DB_PASS y DB_PORT, leídas por sentiance_common/db.py)
+    settings = db.settings_from_env()
     # El puerto por defecto para SQL Server suele ser 1433, pero aquí se usa 9433
-    port = os.getenv("DB_PORT", "9433")
+    # (db.DEFAULT_PORT, salvo que DB_PORT indique otro)
 
     # Validar que todas las variables requeridas existan
-    required_vars = {
-        "DB_SERVER": server,
-        "DB_NAME": database,
-        "DB_USER": username,
-        "DB_PASS": password
-    }
-    missing = [v for v, val in required_vars.items() if not val]
+    missing = db.missing_settings(settings)
 
     if missing:
         msg = mo.md(f"""
@@ -199,8 +209,10 @@ def _(mo, os, sqlalchemy):
 
     try:
         with mo.status.spinner(title="Estableciendo conexión con la base de datos..."):
-            connection_string = f"mssql+pymssql://{username}:{password}@{server}:{port}/{database}"
-            engine = sqlalchemy.create_engine(connection_string)
+            connection_string = db.connection_url(settings)
+            # Un único motor por cadena de conexión: al re-ejecutar la celda se reutiliza
+            # el pool ya conectado en lugar de abrir conexiones nuevas
+            engine = db.get_engine(connection_string)
             # Validar la conexión inmediatamente
             with engine.connect() as _conn:
                 pass
@@ -306,6 +318,82 @@ def _(mo):
     return end_dt, sid_input, start_dt
 
 
+# =============================================================================
+# CELDA 6B: CACHÉ DE RESULTADOS DE CONSULTAS
+# =============================================================================
+# Crea la caché LRU/TTL (ver query_cache.py) donde se guardan los resultados de
+# la consulta de la celda 7, indexados por tabla, Sentiance ID y ventana de tiempo.
+#
+# Esta celda NO recibe parámetros: no depende de ninguna otra celda, así que
+# marimo la ejecuta una única vez al abrir el notebook. Por eso el objeto
+# `explorer_cache` sobrevive a todos los cambios de filtros y de tabla; si se
+# creara dentro de la celda 7, se perdería en cada re-ejecución.
+#
+# Parámetros de la caché:
+#   maxsize=64        - cantidad de combinaciones de filtros que se recuerdan
+#   refresh_after=60  - pasados 60 s se devuelve lo guardado y se refresca en segundo plano
+#   ttl=600           - pasados 10 min el resultado se descarta y se consulta de nuevo
+@app.cell(hide_code=True)
+def _():
+    from query_cache import QueryCache, normalize_key as normalize_query_key
+
+    explorer_cache = QueryCache(maxsize=64, ttl=600, refresh_after=60)
+    return explorer_cache, normalize_query_key
+
+
+# =============================================================================
+# CELDA 6C: BOTÓN DE REFRESCO MANUAL
+# =============================================================================
+# Botón para saltear la caché y volver a consultar la base de datos con los
+# filtros actuales (por ejemplo, cuando se sabe que acaban de llegar eventos).
+# Depende sólo de `mo`. mo.ui.run_button() vale True únicamente en la ejecución
+# disparada por el clic, así que la celda 7 fuerza la consulta sólo esa vez.
+@app.cell(hide_code=True)
+def _(mo):
+    refresh_query = mo.ui.run_button(label="🔄 Refrescar consulta", kind="neutral")
+    refresh_query
+    return (refresh_query,)
+
+
+# =============================================================================
+# CELDA 6D: TAMAÑO DE PÁGINA
+# =============================================================================
+# Desplegable con la cantidad de filas por página de resultados. Depende sólo de
+# `mo`; vive en su propia celda para que su valor no se reinicie cuando cambian
+# los filtros o la tabla.
+@app.cell(hide_code=True)
+def _(mo):
+    page_size_selector = mo.ui.dropdown(
+        options=["50", "100", "300", "1000"],
+        value="300",
+        label="Filas por página"
+    )
+    return (page_size_selector,)
+
+
+# =============================================================================
+# CELDA 6E: ESTADO DE LA PAGINACIÓN
+# =============================================================================
+# Guarda la pila de cursores de la paginación por clave (keyset, ver keyset_pager.py).
+# Cada cursor es (fechahora, id) de la última fila de una página; la página actual
+# es la que empieza después del último cursor de la pila (pila vacía = primera página).
+# Las filas sin fechahora aparecen al final, en las últimas páginas (cursor (None, id)).
+#   - "Siguiente" apila el cursor de la página actual.
+#   - "Anterior" desapila el último cursor.
+#
+# mo.state() devuelve un par (getter, setter): las celdas que LEEN el getter se
+# vuelven a ejecutar cuando alguien llama al setter.
+#
+# Depende de la tabla, los filtros y el tamaño de página: al cambiar cualquiera de
+# ellos esta celda se re-ejecuta, crea un estado nuevo y la navegación vuelve a la
+# primera página.
+@app.cell(hide_code=True)
+def _(end_dt, mo, page_size_selector, sid_input, start_dt, table_selector):
+    _ = (table_selector.value, sid_input.value, start_dt.value, end_dt.value, page_size_selector.value)
+    get_page_cursors, set_page_cursors = mo.state([])
+    return get_page_cursors, set_page_cursors
+
+
 # =============================================================================
 # CELDA 7: EJECUCIÓN DE CONSULTA SQL
 # =============================================================================
@@ -314,28 +402,42 @@ def _(mo):
 #   - end_dt, start_dt, sid_input (cuando el usuario cambia los filtros)
 #   - table_selector (cuando el usuario elige una tabla diferente)
 #   - engine, mo (desde la inicialización)
+#   - refresh_query (cuando el usuario pide refrescar) y explorer_cache (una sola vez)
+#   - get_page_cursors (cuando el usuario avanza o retrocede de página)
+#   - page_size_selector (cuando cambia la cantidad de filas por página)
 @app.cell(hide_code=True)
-def _(end_dt, engine, mo, sid_input, start_dt, table_selector):
+def _(
+    end_dt,
+    engine,
+    explorer_cache,
+    get_page_cursors,
+    keyset_pager,
+    mo,
+    normalize_query_key,
+    page_size_selector,
+    refresh_query,
+    sid_input,
+    start_dt,
+    table_selector,
+):
     # Construir consulta SQL dinámica
-    base_query = f"SELECT TOP 300 * FROM VictaTMTK.dbo.{table_selector.value}"
-    where_clauses = []
+    # La consulta es paginada por clave: sólo trae la página visible, y las columnas
+    # pesadas (JSON) se reemplazan por su tamaño en bytes hasta que se selecciona una fila.
+    page_cursors = get_page_cursors()
+    page_cursor = page_cursors[-1] if page_cursors else None
+    page_size = int(page_size_selector.value)
 
     # .value es cómo accedes al valor actual de CUALQUIER widget mo.ui
     sid = sid_input.value.strip() if sid_input.value else None
     start = start_dt.value if start_dt.value else None
     end = end_dt.value if end_dt.value else None
 
-    if sid:
-        where_clauses.append(f"sentianceid = '{sid}'")
-    if start:
-        where_clauses.append(f"fechahora >= '{start}'")
-    if end:
-        where_clauses.append(f"fechahora <= '{end}'")
-
-    query = base_query
-    if where_clauses:
-        query += " WHERE " + " AND ".join(where_clauses)
-    query += " ORDER BY fechahora DESC"
+    # Los valores de los filtros viajan como parámetros, no interpolados en el SQL
+    light_cols, heavy_cols = keyset_pager.split_columns(engine, table_selector.value)
+    query, query_params = keyset_pager.page_query(
+        table_selector.value, light_cols, heavy_cols,
+        sid=sid, start=start, end=end, cursor=page_cursor, page_size=page_size
+    )
 
     # ==========================================================================
     # mo.accordion() - SECCIONES DESPLEGABLES
@@ -343,7 +445,7 @@ def _(end_dt, engine, mo, sid_input, start_dt, table_selector):
     # Crea secciones que se pueden expandir o contraer.
     # Toma un dict: {título: contenido}
     query_log = mo.accordion({
-        "📝 Log de Consulta SQL": mo.md(f"```sql\n{query}\n```")
+        "📝 Log de Consulta SQL": mo.md(f"```sql\n{query}\n```\n\nParámetros: `{query_params}`")
     })
 
     # ==========================================================================
@@ -357,14 +459,66 @@ def _(end_dt, engine, mo, sid_input, start_dt, table_selector):
     #   engine: motor SQLAlchemy para la conexión a la base de datos
     #
     # Devuelve un pandas DataFrame con los resultados de la consulta.
-    df = mo.sql(
-        query,
-        output=False,  # We'll display in our own table widget
-        engine=engine
+    #
+    # La consulta pasa por `explorer_cache`: si esta misma combinación de tabla,
+    # Sentiance ID y ventana de tiempo ya se consultó, el resultado se devuelve al
+    # instante. Se usa pd.read_sql en lugar de mo.sql porque el refresco en segundo
+    # plano corre en otro hilo, fuera del contexto de ejecución de marimo.
+    cache_key = normalize_query_key(table_selector.value, sid, start, end, page_cursor and page_cursor[0], page_cursor and page_cursor[1], page_size)
+    df, cache_status = explorer_cache.get(
+        cache_key,
+        lambda: keyset_pager.fetch_page(
+            engine, table_selector.value,
+            sid=sid, start=start, end=end, cursor=page_cursor, page_size=page_size
+        ),
+        force=refresh_query.value
     )
 
+    cache_labels = {
+        "hit": "⚡ Resultado desde caché",
+        "stale": "⚡ Resultado desde caché (actualizándose en segundo plano)",
+        "miss": "🗄️ Resultado consultado a la base de datos",
+    }
+    query_log = mo.vstack([mo.md(f"_{cache_labels[cache_status]}_"), query_log])
+
     query_log  # Mostrar el acordeón
-    return (df,)  # Exportar el DataFrame para otras celdas
+    return df, page_cursors, page_size  # Exportar el DataFrame para otras celdas
+
+
+# =============================================================================
+# CELDA 7B: NAVEGACIÓN ENTRE PÁGINAS
+# =============================================================================
+# Botones "Anterior" / "Siguiente" de la paginación por clave.
+# Depende de la página actual (`df`, `page_cursors`, `page_size`) y del setter del
+# estado de paginación (`set_page_cursors`, celda 6E).
+#
+# mo.ui.button(on_click=...) ejecuta la función al hacer clic; aquí cada clic
+# modifica la pila de cursores y eso re-ejecuta la consulta de la celda 7.
+#   - "Siguiente" se deshabilita si la página vino incompleta (no hay más filas).
+#   - "Anterior" se deshabilita en la primera página.
+@app.cell(hide_code=True)
+def _(df, keyset_pager, mo, page_cursors, page_size, page_size_selector, set_page_cursors):
+    cursor_after_page = keyset_pager.next_cursor(df)
+
+    prev_page_btn = mo.ui.button(
+        label="⬅️ Anterior",
+        disabled=len(page_cursors) == 0,
+        on_click=lambda _: set_page_cursors(lambda cursors: cursors[:-1])
+    )
+    next_page_btn = mo.ui.button(
+        label="Siguiente ➡️",
+        disabled=cursor_after_page is None or len(df) < page_size,
+        on_click=lambda _: set_page_cursors(lambda cursors: cursors + [cursor_after_page])
+    )
+
+    page_nav = mo.hstack([
+        prev_page_btn,
+        mo.md(f"Página **{len(page_cursors) + 1}** · {len(df)} filas"),
+        next_page_btn,
+        page_size_selector
+    ], gap=1, justify="start", align="center")
+    page_nav
+    return
 
 
 # =============================================================================
@@ -395,14 +549,33 @@ def _(df, mo):
     return (table,)
 
 
+# =============================================================================
+# CELDA 8B: CARGA DE LA FILA COMPLETA SELECCIONADA
+# =============================================================================
+# La tabla sólo tiene la proyección liviana de la página (sin la columna JSON).
+# Cuando el usuario selecciona una fila, esta celda trae esa fila completa por su
+# `id` (una única fila, con el JSON) para los visores de detalle y de mapa.
+# Depende de `table` (selección), `table_selector` (tabla de origen) y `engine`.
+# Exporta `selected_full_row`: DataFrame con 0 filas (sin selección) o 1 fila.
+@app.cell(hide_code=True)
+def _(engine, keyset_pager, mo, pd, table, table_selector):
+    if len(table.value) > 0:
+        with mo.status.spinner(title="Cargando fila completa..."):
+            selected_full_row = keyset_pager.fetch_row(engine, table_selector.value, table.value.iloc[0]["id"])
+    else:
+        selected_full_row = pd.DataFrame()
+    return (selected_full_row,)
+
+
 # =============================================================================
 # CELDA 9: VISOR DE DETALLE DE FILA
 # =============================================================================
 # ¡Esta celda reacciona a la selección de la tabla!
 @app.cell(hide_code=True)
-def _(json, mo, table):
+def _(fastjson, json_tree, mo, selected_full_row):
     # table.value es un DataFrame con las filas seleccionadas (vacío si no hay selección)
-    selected_row = table.value
+    # La tabla sólo tiene la proyección liviana: se usa la fila completa traída por id (celda 8B)
+    selected_row = selected_full_row
 
     if len(selected_row) > 0:
         row_data = selected_row.iloc[0]
@@ -415,12 +588,11 @@ def _(json, mo, table):
             is_json = False
 
             try:
-                if isinstance(val, str) and val.strip().startswith(("{", "[")):
-                    parsed = json.loads(val)
-                    formatted_val = json.dumps(parsed, indent=4)
+                # El JSON no se decodifica acá: el visor en árbol lo hace recién al abrirlo
+                if json_tree.looks_like_json(val):
                     is_json = True
                 elif isinstance(val, (dict, list)):
-                    formatted_val = json.dumps(val, indent=4)
+                    formatted_val = fastjson.dumps(val, indent=2)
                     is_json = True
             except:
                 pass
@@ -433,10 +605,21 @@ def _(json, mo, table):
             # Como text() pero para contenido de varias líneas. 
             #   disabled=True lo hace de solo lectura (solo visualización)
             #   rows: número de filas de texto visibles
-            field_ui = mo.vstack([
-                mo.md(f"**{col}**"),
-                mo.ui.text_area(value=formatted_val, disabled=True, rows=box_height)
-            ], gap=0.5)
+            #
+            # Los campos JSON usan en cambio un árbol plegable perezoso (json_tree.py):
+            # sólo se decodifica y se dibuja lo que el usuario va expandiendo, y los
+            # arreglos grandes (ej. waypoints) se muestran resumidos hasta abrirlos.
+            # La sección arranca cerrada: seleccionar una fila no decodifica nada.
+            if is_json:
+                field_ui = mo.vstack([
+                    mo.md(f"**{col}**"),
+                    json_tree.json_tree(val, label="Ver árbol JSON")
+                ], gap=0.5)
+            else:
+                field_ui = mo.vstack([
+                    mo.md(f"**{col}**"),
+                    mo.ui.text_area(value=formatted_val, disabled=True, rows=box_height)
+                ], gap=0.5)
 
             if is_json or "json" in col.lower():
                 right_items.append(field_ui)
@@ -462,8 +645,8 @@ def _(json, mo, table):
 # CELDA 10: EXTRACCIÓN DE DATOS GEOGRÁFICOS
 # =============================================================================
 @app.cell(hide_code=True)
-def _(json, mo, pd, table):
-    geo_selected_row = table.value
+def _(fastjson, mo, pd, selected_full_row):
+    geo_selected_row = selected_full_row
 
     if len(geo_selected_row) > 0:
         geo_row_data = geo_selected_row.iloc[0]
@@ -520,7 +703,7 @@ def _(json, mo, pd, table):
             geo_val = geo_row_data[geo_col]
             if isinstance(geo_val, str) and geo_val.strip().startswith(("{", "[")):
                 try:
-                    geo_parsed = json.loads(geo_val)
+                    geo_parsed = fastjson.loads(geo_val)
                     find_geo_structures(geo_parsed, geo_col)
                 except:
                     pass
@@ -551,7 +734,7 @@ def _(json, mo, pd, table):
 # 2. Cuando el usuario selecciona una fila en geo_table_ui, esta celda se vuelve a ejecutar.
 # 3. El mapa se actualiza para mostrar solo el elemento seleccionado.
 @app.cell(hide_code=True)
-def _(geo_data_found, geo_df, geo_table_ui, json, leafmap, mo):
+def _(fastjson, geo_data_found, geo_df, geo_table_ui, leafmap, mo):
     if geo_table_ui is not None and geo_df is not None:
         if len(geo_table_ui.value) > 0:
             selected_item = geo_table_ui.value.iloc[0]
@@ -609,7 +792,7 @@ def _(geo_data_found, geo_df, geo_table_ui, json, leafmap, mo):
                 mo.vstack([
                     mo.md(f"#### {item['Kind']} (desde `{item['Source']}`)"),
                     mo.md(f"**Descripción:** {item['Summary']}"),
-                    mo.accordion({"Datos Raw": mo.ui.text_area(value=json.dumps(item['Data'], indent=2), disabled=True, rows=10)})
+                    mo.accordion({"Datos Raw": mo.ui.text_area(value=fastjson.dumps(item['Data'], indent=2), disabled=True, rows=10)})
                 ], gap=0.5) for item in geo_data_found
             ], gap=2)
         ])
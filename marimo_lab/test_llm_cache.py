@@ -0,0 +1,155 @@
+"""
+Pruebas de la caché de respuestas del LLM (`llm_cache.py`) contra un servidor
+OpenRouter de mentira (`http.server` local, vía `OPENROUTER_BASE_URL`).
+
+    python -m pytest marimo_lab/test_llm_cache.py
+"""
+import importlib
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import pytest
+import requests
+
+import llm_cache
+
+HERE = Path(__file__).resolve().parent
+# Demora de cada respuesta del servidor, para que las llamadas concurrentes se superpongan
+STUB_DELAY = 0.3
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    """Responde como OpenRouter: "fail" en el prompt da 500, "empty" una respuesta vacía."""
+
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        prompt = payload["messages"][0]["content"]
+        self.server.requests[prompt] += 1
+        time.sleep(STUB_DELAY)
+        if "fail" in prompt:
+            self.send_response(500)
+            self.end_headers()
+            return
+        content = "" if "empty" in prompt else f"respuesta a {prompt}"
+        body = json.dumps({"choices": [{"message": {"content": content}}]}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _StubHandler)
+    server.requests = Counter()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def env(stub_server, tmp_path, monkeypatch):
+    """Variables de entorno de un proceso que usa el servidor local y una caché nueva."""
+    monkeypatch.setenv("OPENROUTER_BASE_URL", f"http://127.0.0.1:{stub_server.server_port}/chat/completions")
+    monkeypatch.setenv("OPENROUTER_API_KEY", "test")
+    monkeypatch.setenv("LLM_CACHE_PATH", str(tmp_path / "llm.sqlite"))
+    monkeypatch.delenv("LLM_CACHE_DISABLE", raising=False)
+    # La caché por defecto del proceso se vuelve a crear con el LLM_CACHE_PATH de la prueba
+    monkeypatch.setattr(llm_cache, "_default", None)
+    yield dict(os.environ)
+    if llm_cache._default is not None:
+        llm_cache._default.close()
+
+
+@pytest.fixture
+def build_index(env):
+    # OPENROUTER_BASE_URL se lee al importar el módulo
+    import build_index
+    return importlib.reload(build_index)
+
+
+def test_concurrent_identical_calls_share_one_request(build_index, stub_server):
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        answers = list(pool.map(lambda _: build_index.call_openrouter("mismo prompt"), range(8)))
+
+    assert answers == ["respuesta a mismo prompt"] * 8
+    assert stub_server.requests["mismo prompt"] == 1
+    cache = llm_cache.default_cache()
+    assert cache.misses == 1 and cache.hits == 7
+
+
+def test_second_process_hits_the_cache(build_index, stub_server, env):
+    assert build_index.call_openrouter("compartido") == "respuesta a compartido"
+
+    script = "import build_index; print(build_index.call_openrouter('compartido'), end='')"
+    result = subprocess.run([sys.executable, "-c", script], cwd=HERE, env=env,
+                            capture_output=True, text=True, timeout=60)
+
+    assert result.returncode == 0, result.stderr
+    assert result.stdout == "respuesta a compartido"
+    assert stub_server.requests["compartido"] == 1
+
+
+def test_second_instance_hits_the_cache(env):
+    payload = {"model": "m", "messages": [{"role": "user", "content": "x"}], "temperature": 0}
+    first = llm_cache.LLMCache()
+    first.cached_call(payload, lambda: "guardada")
+
+    second = llm_cache.LLMCache()
+    try:
+        assert second.cached_call(payload, lambda: pytest.fail("no debería ir a la red")) == "guardada"
+        assert second.hits == 1
+    finally:
+        first.close()
+        second.close()
+
+
+def test_eviction_keeps_db_under_max_bytes(env, tmp_path):
+    max_bytes = 1000
+    writer = llm_cache.LLMCache(max_bytes=max_bytes)
+    # Otro proceso/instancia escribiendo en la misma base también cuenta para el límite
+    other = llm_cache.LLMCache(max_bytes=max_bytes)
+    try:
+        for i in range(30):
+            cache = writer if i % 2 else other
+            cache.cached_call({"prompt": i}, lambda: "x" * 100)
+            assert writer.stats()["bytes"] <= max_bytes
+
+        # Se descartan las menos usadas: las primeras ya no están, la última sí
+        assert writer.get(llm_cache.cache_key({"prompt": 0})) is None
+        assert writer.get(llm_cache.cache_key({"prompt": 29})) is not None
+    finally:
+        writer.close()
+        other.close()
+
+
+def test_failed_fetch_is_not_cached(build_index, stub_server):
+    for _ in range(2):
+        with pytest.raises(requests.HTTPError):
+            build_index.call_openrouter("fail")
+
+    # Cada llamada volvió a intentar: el error no quedó guardado
+    assert stub_server.requests["fail"] == 2
+    assert llm_cache.default_cache().stats()["entries"] == 0
+
+
+def test_empty_response_is_not_cached(build_index, stub_server):
+    assert build_index.call_openrouter("empty") == ""
+    assert build_index.call_openrouter("empty") == ""
+
+    assert stub_server.requests["empty"] == 2
+    assert llm_cache.default_cache().stats()["entries"] == 0
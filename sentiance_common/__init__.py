@@ -0,0 +1,7 @@
+"""
+Shared helpers for the Sentiance tools (notebooks, extractors and the route viewer).
+
+Scripts in the sibling directories (`csv_analizer/`, `marimo_lab/`,
+`visualizador_rutas/`) add the repository root to `sys.path` before importing
+from this package.
+"""
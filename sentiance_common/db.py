@@ -0,0 +1,125 @@
+"""
+Shared SQL Server engine factory for the notebooks and CLI tools.
+
+Every tool used to build its own `create_engine(...)` from `marimo_lab/.env`
+with default pool settings, and reactive cell re-executions rebuilt it, paying
+the connection handshake again on every widget change. `get_engine()` keeps one
+tuned engine per connection URL for the life of the process, so re-running a
+cell reuses warm pooled connections.
+
+Pool settings:
+- `pool_pre_ping`: stale connections (server restarts, idle timeouts) are
+  replaced transparently instead of failing the first query.
+- `pool_size` / `max_overflow` / `pool_recycle`: overridable through
+  `DB_POOL_SIZE`, `DB_MAX_OVERFLOW` and `DB_POOL_RECYCLE`.
+
+`stream_sql` reads large results in chunks with DB-API `fetchmany`, so at most
+one chunk is held in memory on the client.
+"""
+import os
+import threading
+
+import pandas as pd
+import sqlalchemy
+from sqlalchemy import text
+
+# marimo_lab/.env, next to this package in the repository root
+DEFAULT_ENV_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "marimo_lab", ".env"))
+DEFAULT_PORT = "9433"
+
+ENV_VARS = {
+    "server": "DB_SERVER",
+    "database": "DB_NAME",
+    "username": "DB_USER",
+    "password": "DB_PASS",
+}
+
+_engines = {}
+_engines_lock = threading.Lock()
+
+
+def load_env(env_path=DEFAULT_ENV_PATH):
+    """Load the database credentials from `env_path` (variables already set are kept)."""
+    from dotenv import load_dotenv
+
+    load_dotenv(env_path)
+
+
+def settings_from_env():
+    """Connection settings read from the environment (`None` for missing values)."""
+    settings = {key: os.getenv(var) for key, var in ENV_VARS.items()}
+    settings["port"] = os.getenv("DB_PORT", DEFAULT_PORT)
+    return settings
+
+
+def missing_settings(settings=None):
+    """Names of the required environment variables that are not set."""
+    settings = settings_from_env() if settings is None else settings
+    return [var for key, var in ENV_VARS.items() if not settings.get(key)]
+
+
+def connection_url(settings=None):
+    """`mssql+pymssql://...` URL for `settings`, or `None` if credentials are missing."""
+    settings = settings_from_env() if settings is None else settings
+    if missing_settings(settings):
+        return None
+    return "mssql+pymssql://{username}:{password}@{server}:{port}/{database}".format(**settings)
+
+
+def _pool_settings():
+    return {
+        "pool_pre_ping": True,
+        "pool_size": int(os.getenv("DB_POOL_SIZE", "5")),
+        "max_overflow": int(os.getenv("DB_MAX_OVERFLOW", "10")),
+        # Recycle before typical firewall/load balancer idle timeouts
+        "pool_recycle": int(os.getenv("DB_POOL_RECYCLE", "1800")),
+    }
+
+
+def get_engine(url=None, **engine_kwargs):
+    """
+    Return the shared engine for `url` (by default the one built from the environment).
+
+    Engines are created once per URL and extra keyword arguments, and reused by
+    every caller in the process. Returns `None` when no URL is given and the
+    credentials are missing from the environment.
+    """
+    url = url or connection_url()
+    if url is None:
+        return None
+    url = sqlalchemy.engine.make_url(url)
+    key = (url.render_as_string(hide_password=False), tuple(sorted(engine_kwargs.items())))
+    with _engines_lock:
+        engine = _engines.get(key)
+        if engine is None:
+            options = _pool_settings()
+            options.update(engine_kwargs)
+            engine = _engines[key] = sqlalchemy.create_engine(url, **options)
+    return engine
+
+
+def stream_sql(engine, sql, params=None, chunksize=1000):
+    """
+    Yield the result of `sql` as DataFrames of up to `chunksize` rows.
+
+    Each chunk is read with the driver cursor's `fetchmany` when it is consumed.
+    pymssql has no server-side cursors (SQLAlchemy's `stream_results` is a no-op
+    for it), but it reads the TDS result stream row by row on `fetchmany`, so at
+    most one chunk is held in memory on the client. While the generator is open
+    its connection is busy with this result and stays checked out of the pool.
+    """
+    statement = text(sql) if isinstance(sql, str) else sql
+    with engine.connect() as conn:
+        result = conn.execute(statement, params or {})
+        columns = list(result.keys())
+        empty = True
+        while True:
+            rows = result.fetchmany(chunksize)
+            if not rows:
+                break
+            empty = False
+            yield pd.DataFrame.from_records(rows, columns=columns, coerce_float=True)
+        if empty:
+            # Like pd.read_sql(chunksize=...): an empty result still yields its columns
+            yield pd.DataFrame(columns=columns)
+
@@ -0,0 +1,246 @@
+"""
+Pluggable JSON backend for Sentiance SDK payloads.
+
+Generic decoding/encoding uses the fastest library installed (orjson, then
+msgspec) and falls back to the stdlib `json` module, so every tool keeps working
+without extra dependencies. Decode errors are always raised as
+`json.JSONDecodeError`, whatever the backend.
+
+`decode(data, cls)` decodes straight into the typed dataclasses below. With
+msgspec installed the payload is decoded directly into them and every field that
+is not declared is skipped without being materialized; otherwise the payload is
+parsed generically and projected onto the same dataclasses, so callers get the
+same attribute-based objects either way.
+"""
+import dataclasses
+import json
+import types
+from decimal import Decimal
+from dataclasses import dataclass, field
+from typing import Any, Optional, Union, get_args, get_origin, get_type_hints
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - depends on the environment
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:  # pragma: no cover - depends on the environment
+    msgspec = None
+
+if orjson is not None:
+    BACKEND = "orjson"
+elif msgspec is not None:
+    BACKEND = "msgspec"
+else:
+    BACKEND = "json"
+
+JSONDecodeError = json.JSONDecodeError
+
+# Sub-documents we only need to count are kept as raw, undecoded slices when msgspec is available
+RawJSON = msgspec.Raw if msgspec is not None else Any
+
+if msgspec is not None:
+    _msgspec_decoder = msgspec.json.Decoder()
+    _typed_decoders = {}
+
+
+def loads(data):
+    """Decode a JSON document from `str` or `bytes`."""
+    if orjson is not None:
+        return orjson.loads(data)
+    if msgspec is not None:
+        try:
+            return _msgspec_decoder.decode(data)
+        except msgspec.DecodeError as e:
+            raise JSONDecodeError(str(e), data if isinstance(data, str) else "", 0) from e
+    return json.loads(data)
+
+
+def dumps(obj, *, indent=None, sort_keys=False, ensure_ascii=False):
+    """
+    Encode `obj` as a JSON string.
+
+    orjson is used for compact or 2-space indented output without ASCII escaping;
+    any other combination of options goes through the stdlib encoder.
+    """
+    if orjson is not None and indent in (None, 2) and not ensure_ascii:
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+        if indent == 2:
+            option |= orjson.OPT_INDENT_2
+        if sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        try:
+            return orjson.dumps(obj, option=option).decode("utf-8")
+        except TypeError:
+            # Types orjson does not know (e.g. Decimal) go through the stdlib encoder
+            pass
+    separators = (",", ":") if indent is None else None
+    return json.dumps(obj, indent=indent, sort_keys=sort_keys, ensure_ascii=ensure_ascii, separators=separators, default=_default)
+
+
+def _default(obj):
+    # Incremental parsers (e.g. ijson) yield Decimal numbers
+    if isinstance(obj, Decimal):
+        return float(obj)
+    raise TypeError(f"Object of type {obj.__class__.__name__} is not JSON serializable")
+
+
+# ---------------------------------------------------------------------------
+# Typed Sentiance payloads (only the fields the tools actually read)
+# ---------------------------------------------------------------------------
+
+@dataclass(slots=True)
+class Waypoint:
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
+    lat: Optional[float] = None
+    lon: Optional[float] = None
+    timestamp: Union[int, float, None] = None
+    accuracy: Optional[float] = None
+    speed: Optional[float] = None
+
+
+@dataclass(slots=True)
+class SafetyScores:
+    legalScore: Optional[float] = None
+    smoothScore: Optional[float] = None
+    focusScore: Optional[float] = None
+    overallScore: Optional[float] = None
+    harshAccelerationScore: Optional[float] = None
+    harshBrakingScore: Optional[float] = None
+    harshTurningScore: Optional[float] = None
+    callWhileMovingScore: Optional[float] = None
+    anticipationScore: Optional[float] = None
+    mountedScore: Optional[float] = None
+
+
+@dataclass(slots=True)
+class TransportEvent:
+    """A `transportEvent` / `userContext.events[]` item with its full waypoint list."""
+    id: Optional[str] = None
+    type: Optional[str] = None
+    transportMode: Optional[str] = None
+    isProvisional: Optional[bool] = None
+    startTime: Optional[str] = None
+    endTime: Optional[str] = None
+    startTimeEpoch: Optional[int] = None
+    endTimeEpoch: Optional[int] = None
+    distance: Union[int, float, None] = None
+    durationInSeconds: Union[int, float, None] = None
+    topSpeed: Union[int, float, None] = None
+    transportTags: Any = None
+    waypoints: list[Waypoint] = field(default_factory=list)
+
+
+@dataclass(slots=True)
+class TripSummary:
+    """Same scalar fields as `TransportEvent`, but waypoints are only counted, never decoded."""
+    id: Optional[str] = None
+    type: Optional[str] = None
+    transportMode: Optional[str] = None
+    isProvisional: Optional[bool] = None
+    startTime: Optional[str] = None
+    endTime: Optional[str] = None
+    distance: Union[int, float, None] = None
+    durationInSeconds: Union[int, float, None] = None
+    waypoints: list[RawJSON] = field(default_factory=list)
+
+
+@dataclass(slots=True)
+class UserContext:
+    events: Optional[list[TransportEvent]] = None
+
+
+@dataclass(slots=True)
+class UserContextPayload:
+    """`UserContextUpdate` / `requestUserContext` payload (events at the root or under `userContext`)."""
+    events: Optional[list[TransportEvent]] = None
+    userContext: Optional[UserContext] = None
+
+
+@dataclass(slots=True)
+class DrivingInsightsPayload:
+    transportEvent: Optional[TransportEvent] = None
+    safetyScores: Optional[SafetyScores] = None
+
+
+@dataclass(slots=True)
+class DrivingInsightsScores:
+    """Only the `safetyScores` object of a `DrivingInsights` payload."""
+    safetyScores: Optional[SafetyScores] = None
+
+
+@dataclass(slots=True)
+class DrivingInsightsTrip:
+    criteria: Any = None
+    transportEvent: Optional[TripSummary] = None
+
+
+@dataclass(slots=True)
+class UserContextTripsContext:
+    events: Optional[list[TripSummary]] = None
+
+
+@dataclass(slots=True)
+class UserContextTrips:
+    criteria: Any = None
+    events: Optional[list[TripSummary]] = None
+    userContext: Optional[UserContextTripsContext] = None
+
+
+@dataclass(slots=True)
+class TimelineTrip(TripSummary):
+    """`TimelineUpdateListener` / `TimelineEventById` payload: the event itself plus `criteria`."""
+    criteria: Any = None
+
+
+def decode(data, cls):
+    """
+    Decode `data` (`str` or `bytes`) into one of the typed payload dataclasses.
+
+    Documents whose values do not match the declared field types are still
+    accepted: they are parsed generically and projected onto `cls`.
+    """
+    if msgspec is not None:
+        decoder = _typed_decoders.get(cls)
+        if decoder is None:
+            decoder = _typed_decoders[cls] = msgspec.json.Decoder(cls)
+        try:
+            return decoder.decode(data)
+        except msgspec.ValidationError:
+            pass
+        except msgspec.DecodeError as e:
+            raise JSONDecodeError(str(e), data if isinstance(data, str) else "", 0) from e
+    return project(loads(data), cls)
+
+
+_hints_cache = {}
+
+
+def _convert(tp, value):
+    if value is None:
+        return None
+    origin = get_origin(tp)
+    if origin in (Union, types.UnionType):
+        nested = [arg for arg in get_args(tp) if arg is not type(None) and (dataclasses.is_dataclass(arg) or get_origin(arg) is list)]
+        return _convert(nested[0], value) if nested else value
+    if origin is list:
+        if not isinstance(value, list):
+            return None
+        (item_type,) = get_args(tp)
+        return [_convert(item_type, item) for item in value]
+    if dataclasses.is_dataclass(tp):
+        return project(value, tp)
+    return value
+
+
+def project(obj, cls):
+    """Project an already-decoded `dict` onto a payload dataclass (missing keys keep their defaults)."""
+    if not isinstance(obj, dict):
+        return None
+    hints = _hints_cache.get(cls)
+    if hints is None:
+        hints = _hints_cache[cls] = get_type_hints(cls)
+    return cls(**{name: _convert(tp, obj[name]) for name, tp in hints.items() if name in obj})
@@ -0,0 +1,230 @@
+"""
+Encoded polylines for Sentiance waypoint arrays (`Recorridos.polyline`).
+
+Sentiance delivers routes as raw `waypoints` lists, while the target schema
+stores them as a compressed polyline string. This module produces that string:
+
+- `encode` / `decode`: Google encoded polyline algorithm with configurable
+  precision (5 decimals is the Google Maps default, 6 is used by OSRM/Valhalla).
+  Both directions are vectorized with NumPy: deltas, zig-zag and the 5-bit
+  chunking are computed on whole arrays instead of point by point.
+- `simplify_dp` (Douglas-Peucker) and `simplify_vw` (Visvalingam-Whyatt): drop
+  redundant vertices before encoding. Both return a boolean mask of the points
+  to keep; first and last points are always kept.
+  `dp_significance` runs Douglas-Peucker once for every tolerance at the same
+  time (useful for zoom-dependent level of detail).
+- `waypoints_to_coords` / `encode_waypoints`: helpers for the waypoint dicts of
+  the Sentiance payloads (`latitude`/`longitude` or `lat`/`lon`), or for the
+  structured arrays of `sentiance_common.waypoints`.
+
+Coordinates are `(lat, lon)` pairs, the order the polyline format uses.
+Simplification tolerances are in degrees (1e-5 is roughly 1 m of latitude).
+"""
+import heapq
+
+import numpy as np
+
+from . import waypoints as waypoint_arrays
+
+DEFAULT_PRECISION = 5
+
+# 5-bit chunks needed for the largest zig-zagged delta at precision 10 (< 2**36)
+_MAX_CHUNKS = 8
+
+
+def _as_points(coords):
+    points = np.asarray(coords, dtype=np.float64)
+    if points.size == 0:
+        return points.reshape(0, 2)
+    if points.ndim != 2 or points.shape[1] != 2:
+        raise ValueError("coords must be a sequence of (lat, lon) pairs")
+    return points
+
+
+def encode(coords, precision=DEFAULT_PRECISION):
+    """Encode `(lat, lon)` pairs as a Google encoded polyline string."""
+    points = _as_points(coords)
+    if len(points) == 0:
+        return ""
+
+    scaled = np.round(points * 10 ** precision).astype(np.int64)
+    deltas = np.diff(scaled, axis=0, prepend=np.zeros((1, 2), dtype=np.int64)).ravel()
+    # Zig-zag: negative values map to odd numbers, so every value is non-negative
+    values = ((deltas << 1) ^ (deltas >> 63)).astype(np.uint64)
+
+    shifts = np.arange(_MAX_CHUNKS, dtype=np.uint64) * np.uint64(5)
+    chunks = (values[:, None] >> shifts) & np.uint64(0x1F)
+    # Number of chunks per value: at least one, plus one per remaining non-zero 5-bit group
+    nonzero = (values[:, None] >> shifts) > 0
+    n_chunks = np.maximum(1, nonzero.sum(axis=1))
+    used = np.arange(_MAX_CHUNKS) < n_chunks[:, None]
+    # Every chunk except the last one of each value carries the continuation bit
+    more = np.arange(_MAX_CHUNKS) < (n_chunks[:, None] - 1)
+    chars = (chunks | np.where(more, np.uint64(0x20), np.uint64(0))) + np.uint64(63)
+    return chars[used].astype(np.uint8).tobytes().decode("ascii")
+
+
+def decode(encoded, precision=DEFAULT_PRECISION):
+    """Decode a Google encoded polyline string into an `(N, 2)` array of `(lat, lon)`."""
+    if not encoded:
+        return np.empty((0, 2), dtype=np.float64)
+
+    data = np.frombuffer(encoded.encode("ascii"), dtype=np.uint8).astype(np.int64) - 63
+    if data.min() < 0 or data[-1] & 0x20:
+        raise ValueError("invalid encoded polyline")
+    last = (data & 0x20) == 0
+    # Index of the value each chunk belongs to, and the chunk's position inside it
+    value_ids = np.concatenate(([0], np.cumsum(last)[:-1]))
+    starts = np.flatnonzero(np.concatenate(([True], last[:-1])))
+    positions = np.arange(len(data)) - starts[value_ids]
+    values = np.zeros(len(starts), dtype=np.int64)
+    np.add.at(values, value_ids, (data & 0x1F) << (5 * positions))
+
+    if len(values) % 2:
+        raise ValueError("invalid encoded polyline: odd number of values")
+    deltas = (values >> 1) ^ -(values & 1)
+    return np.cumsum(deltas.reshape(-1, 2), axis=0) / 10 ** precision
+
+
+def _segment_distances(points, start, end):
+    """Distance of `points` to the segment `start`-`end` (planar, in coordinate units)."""
+    segment = end - start
+    length_sq = segment @ segment
+    if length_sq == 0:
+        return np.hypot(*(points - start).T)
+    t = np.clip((points - start) @ segment / length_sq, 0.0, 1.0)
+    projection = start + t[:, None] * segment
+    return np.hypot(*(points - projection).T)
+
+
+def simplify_dp(coords, tolerance):
+    """
+    Douglas-Peucker simplification: mask of the points to keep so that no
+    dropped point is farther than `tolerance` from the simplified line.
+    """
+    points = _as_points(coords)
+    n = len(points)
+    keep = np.zeros(n, dtype=bool)
+    if n == 0:
+        return keep
+    keep[[0, n - 1]] = True
+
+    # Explicit stack instead of recursion: long trips have tens of thousands of points
+    stack = [(0, n - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        distances = _segment_distances(points[first + 1:last], points[first], points[last])
+        farthest = int(np.argmax(distances))
+        if distances[farthest] > tolerance:
+            split = first + 1 + farthest
+            keep[split] = True
+            stack.append((first, split))
+            stack.append((split, last))
+    return keep
+
+
+def dp_significance(coords, min_tolerance=0.0):
+    """
+    Douglas-Peucker significance of every point: `simplify_dp(coords, t)` keeps
+    exactly the points whose significance is greater than `t` (endpoints are
+    `inf`). Computing it once makes every later tolerance a vectorized threshold,
+    which suits zoom-dependent rendering. Points below `min_tolerance` get 0.
+    """
+    points = _as_points(coords)
+    n = len(points)
+    significance = np.zeros(n)
+    if n == 0:
+        return significance
+    significance[[0, n - 1]] = np.inf
+
+    stack = [(0, n - 1, np.inf)]
+    while stack:
+        first, last, parent = stack.pop()
+        if last - first < 2:
+            continue
+        distances = _segment_distances(points[first + 1:last], points[first], points[last])
+        farthest = int(np.argmax(distances))
+        if distances[farthest] > min_tolerance:
+            split = first + 1 + farthest
+            # A point is only reached if its ancestors were kept too
+            value = min(float(distances[farthest]), parent)
+            significance[split] = value
+            stack.append((first, split, value))
+            stack.append((split, last, value))
+    return significance
+
+
+def _triangle_areas(a, b, c):
+    return 0.5 * np.abs((b[..., 0] - a[..., 0]) * (c[..., 1] - a[..., 1])
+                        - (c[..., 0] - a[..., 0]) * (b[..., 1] - a[..., 1]))
+
+
+def simplify_vw(coords, min_area):
+    """
+    Visvalingam-Whyatt simplification: mask of the points to keep after
+    repeatedly removing the point whose triangle with its neighbours has the
+    smallest area, until every remaining triangle is at least `min_area`.
+    """
+    points = _as_points(coords)
+    n = len(points)
+    keep = np.ones(n, dtype=bool)
+    if n < 3:
+        return keep
+
+    # Initial areas for every interior point in one vectorized pass
+    areas = np.full(n, np.inf)
+    areas[1:-1] = _triangle_areas(points[:-2], points[1:-1], points[2:])
+    prev = np.arange(n) - 1
+    nxt = np.arange(n) + 1
+
+    heap = [(areas[i], i) for i in range(1, n - 1) if areas[i] < min_area]
+    heapq.heapify(heap)
+    while heap:
+        area, i = heapq.heappop(heap)
+        if not keep[i] or area != areas[i]:
+            # Stale entry: the point was removed or its area changed since it was pushed
+            continue
+        keep[i] = False
+        p, q = prev[i], nxt[i]
+        nxt[p], prev[q] = q, p
+        for j in (p, q):
+            if 0 < j < n - 1:
+                # A neighbour's area never drops below the removed one (keeps the order monotonic)
+                new_area = max(area, float(_triangle_areas(points[prev[j]], points[j], points[nxt[j]])))
+                areas[j] = new_area
+                if new_area < min_area:
+                    heapq.heappush(heap, (new_area, j))
+    return keep
+
+
+def simplify(coords, tolerance, method="dp"):
+    """
+    Simplified copy of `coords`. `method` is "dp" (Douglas-Peucker, `tolerance`
+    is a distance) or "vw" (Visvalingam-Whyatt, `tolerance` is an area).
+    """
+    points = _as_points(coords)
+    if method == "dp":
+        return points[simplify_dp(points, tolerance)]
+    if method == "vw":
+        return points[simplify_vw(points, tolerance)]
+    raise ValueError(f"unknown simplification method: {method!r}")
+
+
+def waypoints_to_coords(waypoints):
+    """
+    `(N, 2)` array of `(lat, lon)` from Sentiance waypoint dicts (incomplete points
+    are skipped) or from a `waypoints.WAYPOINT_DTYPE` array.
+    """
+    if not isinstance(waypoints, np.ndarray):
+        waypoints = waypoint_arrays.to_array(waypoints)
+    return np.column_stack((waypoints["lat"], waypoints["lon"]))
+
+
+def encode_waypoints(waypoints, precision=DEFAULT_PRECISION, tolerance=None, method="dp"):
+    """Encoded polyline for a Sentiance waypoint list, optionally simplified first."""
+    coords = waypoints_to_coords(waypoints)
+    if tolerance:
+        coords = simplify(coords, tolerance, method)
+    return encode(coords, precision)
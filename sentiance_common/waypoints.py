@@ -0,0 +1,186 @@
+"""
+Array-backed waypoints and vectorized trip metrics.
+
+Sentiance events carry their route as a list of waypoint dicts whose keys vary
+between payloads (`latitude`/`lat`, `longitude`/`lon`). `to_array` reads such a
+list in a single pass into a structured NumPy array (`WAYPOINT_DTYPE`), with NaN
+for missing optional fields; every metric below then works on whole columns:
+
+- `segment_lengths` / `total_distance`: haversine distances in meters.
+- `segment_speeds` / `max_speed`: speeds in m/s derived from the timestamps.
+- `trip_metrics` / `validate_trips`: the same metrics for many trips at once
+  (`validate_trips` returns a pandas DataFrame).
+  All waypoints are concatenated into one array and reduced per trip with
+  `np.add.reduceat` / `np.fmax.reduceat`, so checking the reported `distance`
+  and `topSpeed` of thousands of trips involves no per-point Python loop.
+"""
+import numpy as np
+
+WAYPOINT_DTYPE = np.dtype([
+    ("lat", "f8"),
+    ("lon", "f8"),
+    # Epoch in milliseconds, as delivered by the SDK
+    ("timestamp", "f8"),
+    ("accuracy", "f8"),
+    ("speed", "f8"),
+])
+
+EARTH_RADIUS_M = 6_371_008.8
+
+# `topSpeed` is reported in km/h, waypoint speeds in m/s
+TOP_SPEED_TO_MS = 1 / 3.6
+
+_NAN = float("nan")
+
+
+def _value(value):
+    return _NAN if value is None else value
+
+
+def to_array(waypoints):
+    """
+    Structured array (`WAYPOINT_DTYPE`) for a list of Sentiance waypoint dicts.
+
+    Points without latitude or longitude are skipped, like in the GeoJSON
+    conversion; missing `timestamp`, `accuracy` or `speed` become NaN.
+    """
+    rows = []
+    for wp in waypoints or []:
+        if not isinstance(wp, dict):
+            continue
+        lat = wp.get("latitude") or wp.get("lat")
+        lon = wp.get("longitude") or wp.get("lon")
+        if lat is None or lon is None:
+            continue
+        rows.append((lat, lon, _value(wp.get("timestamp")), _value(wp.get("accuracy")), _value(wp.get("speed"))))
+    return np.array(rows, dtype=WAYPOINT_DTYPE)
+
+
+def lonlat(points):
+    """`(N, 2)` array of `[lon, lat]`, the GeoJSON coordinate order."""
+    return np.column_stack((points["lon"], points["lat"]))
+
+
+def haversine(lat1, lon1, lat2, lon2):
+    """Great-circle distance in meters between arrays of points (degrees)."""
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def segment_lengths(points):
+    """Length in meters of each of the `N - 1` segments between consecutive points."""
+    return haversine(points["lat"][:-1], points["lon"][:-1], points["lat"][1:], points["lon"][1:])
+
+
+def segment_speeds(points):
+    """Speed in m/s over each segment; NaN where the timestamps do not advance."""
+    seconds = np.diff(points["timestamp"]) / 1000.0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(seconds > 0, segment_lengths(points) / seconds, np.nan)
+
+
+def total_distance(points):
+    """Route length in meters."""
+    return float(segment_lengths(points).sum()) if len(points) > 1 else 0.0
+
+
+def max_speed(points):
+    """Highest segment speed in m/s, or NaN if no segment has usable timestamps."""
+    speeds = segment_speeds(points)
+    return float(np.nanmax(speeds)) if np.isfinite(speeds).any() else _NAN
+
+
+def concat(events):
+    """
+    All waypoints of `events` in one structured array, plus the offsets of each
+    event: the points of event `i` are `points[offsets[i]:offsets[i + 1]]`.
+    """
+    arrays = [to_array(ev.get("waypoints") if isinstance(ev, dict) else None) for ev in events]
+    offsets = np.zeros(len(arrays) + 1, dtype=np.int64)
+    np.cumsum([len(a) for a in arrays], out=offsets[1:])
+    points = np.concatenate(arrays) if arrays else np.empty(0, dtype=WAYPOINT_DTYPE)
+    return points, offsets
+
+
+def _reduce_segments(ufunc, values, offsets, empty):
+    # `values` has one entry per point (the segment that starts there); the last
+    # point of every trip starts no segment and must already hold the identity value
+    counts = np.diff(offsets)
+    result = np.full(len(counts), empty)
+    nonempty = counts > 0
+    if nonempty.any():
+        result[nonempty] = ufunc.reduceat(values, offsets[:-1][nonempty])
+    return result
+
+
+def trip_metrics(points, offsets):
+    """
+    Per-trip metrics for the concatenated `points` / `offsets` of `concat`, as a
+    dict of arrays with one entry per trip: `points`, `distance_m`, `duration_s`,
+    `max_speed_ms` (from positions and timestamps) and `max_reported_speed_ms`
+    (from the waypoints' own `speed`).
+    """
+    counts = np.diff(offsets)
+    # Segments that would join the last point of one trip with the first of the next
+    crossing = np.zeros(len(points), dtype=bool)
+    crossing[offsets[1:][counts > 0] - 1] = True
+
+    lengths = np.zeros(len(points))
+    speeds = np.full(len(points), np.nan)
+    if len(points) > 1:
+        lengths[:-1] = segment_lengths(points)
+        speeds[:-1] = segment_speeds(points)
+    lengths[crossing] = 0.0
+    speeds[crossing] = np.nan
+
+    with np.errstate(invalid="ignore"):
+        first = _reduce_segments(np.fmin, points["timestamp"], offsets, np.nan)
+        last = _reduce_segments(np.fmax, points["timestamp"], offsets, np.nan)
+        return {
+            "points": counts,
+            "distance_m": _reduce_segments(np.add, lengths, offsets, 0.0),
+            "duration_s": (last - first) / 1000.0,
+            "max_speed_ms": _reduce_segments(np.fmax, speeds, offsets, np.nan),
+            "max_reported_speed_ms": _reduce_segments(np.fmax, points["speed"], offsets, np.nan),
+        }
+
+
+def validate_trips(events, distance_tolerance=0.2, speed_tolerance=0.25):
+    """
+    Compare the reported `distance` (m) and `topSpeed` (km/h) of every event with
+    the values derived from its waypoints.
+
+    Returns one row per event with the reported and computed values, their
+    relative differences and `distance_ok` / `top_speed_ok` flags (`<NA>` when
+    either side is missing). The top speed is checked against the highest
+    waypoint `speed`, falling back to the speed derived from positions.
+    """
+    import pandas as pd
+
+    events = list(events)
+    points, offsets = concat(events)
+    metrics = trip_metrics(points, offsets)
+
+    def reported(key):
+        return pd.to_numeric(pd.Series([ev.get(key) if isinstance(ev, dict) else None for ev in events],
+                                       dtype="object"), errors="coerce").astype("float64")
+
+    result = pd.DataFrame({
+        "event_index": np.arange(len(events)),
+        "id": [ev.get("id") if isinstance(ev, dict) else None for ev in events],
+        "distance": reported("distance"),
+        "topSpeed": reported("topSpeed"),
+    })
+    result = pd.concat([result, pd.DataFrame(metrics)], axis=1)
+
+    computed_top = result["max_reported_speed_ms"].fillna(result["max_speed_ms"]) / TOP_SPEED_TO_MS
+    result["computed_top_speed_kmh"] = computed_top
+    with np.errstate(divide="ignore", invalid="ignore"):
+        result["distance_diff"] = (result["distance_m"] - result["distance"]) / result["distance"]
+        result["top_speed_diff"] = (computed_top - result["topSpeed"]) / result["topSpeed"]
+    for diff, flag, tolerance in (("distance_diff", "distance_ok", distance_tolerance),
+                                  ("top_speed_diff", "top_speed_ok", speed_tolerance)):
+        values = result[diff].replace([np.inf, -np.inf], np.nan)
+        result[flag] = (values.abs() <= tolerance).astype("boolean").mask(values.isna())
+    return result
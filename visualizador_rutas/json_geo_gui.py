@@ -1,9 +1,97 @@
 #!/usr/bin/env python3
 import json
+import queue
+import re
+import threading
 import tkinter as tk
-from tkinter import messagebox, scrolledtext
-import tkintermapview
+from pathlib import Path
+from tkinter import filedialog, messagebox, scrolledtext, ttk
+import numpy as np
 from waypoints_to_geojson import convert_to_geojson_data
+from spatial_index import GridIndex
+from tile_cache import CachedMapView
+# waypoints_to_geojson already put the repository root (sentiance_common/) on sys.path
+from sentiance_common import fastjson, polyline
+
+# Level of detail on the map: route vertices closer than this many screen pixels to
+# the simplified line are not drawn (recomputed per zoom level), and a window never
+# draws more than MAX_RENDERED_VERTICES in total so panning stays smooth.
+LOD_TOLERANCE_PX = 1.0
+MAX_RENDERED_VERTICES = 10000
+LOD_POLL_MS = 250
+
+
+# Syntax highlighting is applied lazily, in blocks of this many lines, only to the
+# blocks around the visible part of each text widget
+HIGHLIGHT_BLOCK_LINES = 200
+# How often the UI checks the background worker for results
+WORKER_POLL_MS = 50
+
+# Basic JSON highlighting regex
+_KEY_RE = re.compile(r'"([^"]+)"\s*:')
+_STRING_RE = re.compile(r':\s*"([^"]*)"')
+_NUMBER_RE = re.compile(r'-?\d+(?:\.\d+)?')
+
+
+# Route color per Sentiance transportMode (anything else is drawn in bright green)
+MODE_COLORS = {
+    "CAR": "#00FF00",
+    "BUS": "#FF9800",
+    "COACH": "#FF9800",
+    "TRAIN": "#9C27B0",
+    "TRAM": "#E91E63",
+    "METRO": "#3F51B5",
+    "MOTORCYCLE": "#F44336",
+    "BICYCLE": "#00BCD4",
+    "ON_FOOT": "#795548",
+    "WALKING": "#795548",
+    "RUNNING": "#FF5722",
+    "PLANE": "#607D8B",
+    "BOAT": "#2196F3",
+}
+# A left click identifies the trip passing within this many screen pixels
+CLICK_TOLERANCE_PX = 8
+# Files picked up when a folder of trips is opened
+TRIP_SUFFIXES = {".json", ".geojson", ".geojsonl"}
+
+
+def _load_trip_file(path):
+    """Features of one trip file: GeoJSON (FeatureCollection, single Feature or GeoJSONSeq) or a Sentiance register."""
+    suffix = path.suffix.lower()
+    with open(path, "rb") as f:
+        content = f.read()
+    if suffix == ".geojsonl":
+        return [fastjson.loads(line) for line in content.splitlines() if line.strip()]
+    data = fastjson.loads(content)
+    # A .json file may also hold GeoJSON already converted by waypoints_to_geojson
+    geojson_type = data.get("type") if isinstance(data, dict) else None
+    if geojson_type == "Feature":
+        return [data]
+    if geojson_type == "FeatureCollection":
+        return data.get("features") or []
+    if suffix == ".json":
+        return convert_to_geojson_data(data)["features"]
+    return data.get("features", [])
+
+
+def _route_label(props):
+    """Short name of a trip for the layers panel: source file, event index and start time."""
+    parts = [props.get("source_file")]
+    if props.get("event_index") is not None:
+        parts.append(f"#{props['event_index']}")
+    parts.append(props.get("startTime"))
+    return " ".join(str(part) for part in parts if part) or "trip"
+
+
+def _lod_tolerance(zoom):
+    """LOD_TOLERANCE_PX in degrees at `zoom` (256 px tiles): smaller deviations are invisible."""
+    return LOD_TOLERANCE_PX * 360.0 / (256 * 2 ** zoom)
+
+
+def _even_indices(length, count):
+    """`count` evenly spaced indices over `range(length)`, always including both ends."""
+    return np.unique(np.linspace(0, length - 1, count).round().astype(int))
+
 
 class JsonGeoTool:
     def __init__(self, root):
@@ -12,6 +100,13 @@ class JsonGeoTool:
         self.root.geometry("1000x800")
 
         self.last_data = None
+        # Background processing: results come back through a queue polled with after()
+        self._results = queue.Queue()
+        self._job_id = 0
+        # A single _poll_worker loop runs while a job is in progress
+        self._polling = False
+        # text widget -> highlighted block numbers
+        self._highlighted = {}
         
         # Main PanedWindow (Vertical)
         self.paned = tk.PanedWindow(root, orient=tk.VERTICAL, sashwidth=4, bg="#cccccc")
@@ -33,6 +128,12 @@ class JsonGeoTool:
         self.clear_btn = tk.Button(self.btn_frame, text="🗑 Clear All", command=self.clear_all, 
                                    bg="#f44336", fg="black", font=("Arial", 10), padx=15)
         self.clear_btn.pack(side=tk.RIGHT, padx=5)
+
+        # Progress indicator while a register is processed in the background
+        self.progress = ttk.Progressbar(self.btn_frame, mode="indeterminate", length=160)
+        self.progress.pack(side=tk.LEFT, padx=5)
+        self.status_label = tk.Label(self.btn_frame, text="", fg="gray")
+        self.status_label.pack(side=tk.LEFT, padx=5)
         
         self.paned.add(self.input_frame)
 
@@ -56,6 +157,8 @@ class JsonGeoTool:
         self.geo_header.pack(fill=tk.X)
         tk.Button(self.geo_header, text="Copy GeoJSON", command=lambda: self.copy_to_clipboard(self.geo_text)).pack(side=tk.RIGHT, padx=2)
         tk.Button(self.geo_header, text="Show on Map", command=self.show_map, bg="#2196F3", fg="black").pack(side=tk.RIGHT, padx=2)
+        self.folder_btn = tk.Button(self.geo_header, text="Open Trips Folder…", command=self.open_trips_folder)
+        self.folder_btn.pack(side=tk.RIGHT, padx=2)
         
         self.geo_text = scrolledtext.ScrolledText(self.geo_frame, height=10)
         self.geo_text.pack(fill=tk.BOTH, expand=True)
@@ -73,19 +176,51 @@ class JsonGeoTool:
         text_widget.tag_configure("boolean", foreground="#9334e6")
         text_widget.tag_configure("null", foreground="#70757a")
 
+        # Highlight newly visible blocks whenever the widget scrolls
+        scrollbar_set = text_widget.vbar.set
+
+        def on_scroll(first, last):
+            scrollbar_set(first, last)
+            self._highlight_visible(text_widget)
+
+        text_widget.configure(yscrollcommand=on_scroll)
+
     def highlight_json(self, text_widget, json_str):
         """Apply syntax highlighting to the JSON string in the widget"""
-        import re
         text_widget.delete("1.0", tk.END)
         text_widget.insert("1.0", json_str)
-        # Basic JSON highlighting regex
-        for match in re.finditer(r'"([^"]+)"\s*:', json_str):
-            text_widget.tag_add("key", f"1.0 + {match.start()} chars", f"1.0 + {match.end()-1} chars")
-        for match in re.finditer(r':\s*"([^"]*)"', json_str):
-            text_widget.tag_add("string", f"1.0 + {match.start()+1} chars", f"1.0 + {match.end()} chars")
-        for match in re.finditer(r'-?\d+(?:\.\d+)?', json_str):
-            if not text_widget.tag_names(f"1.0 + {match.start()} chars"):
-                text_widget.tag_add("number", f"1.0 + {match.start()} chars", f"1.0 + {match.end()} chars")
+        # Only the visible region is tagged now; the rest as it scrolls into view
+        self._highlighted[text_widget] = set()
+        self._highlight_visible(text_widget)
+
+    def _highlight_visible(self, text_widget):
+        done = self._highlighted.get(text_widget)
+        if done is None:
+            return
+        first_line = int(text_widget.index("@0,0").split(".")[0])
+        last_line = int(text_widget.index(f"@0,{text_widget.winfo_height()}").split(".")[0])
+        # One block of margin on each side so short scrolls are already colored
+        first_block = max(0, (first_line - 1) // HIGHLIGHT_BLOCK_LINES - 1)
+        last_block = (last_line - 1) // HIGHLIGHT_BLOCK_LINES + 1
+        for block in range(first_block, last_block + 1):
+            if block not in done:
+                done.add(block)
+                self._highlight_block(text_widget, block)
+
+    def _highlight_block(self, text_widget, block):
+        # Pretty-printed JSON never splits a token across lines, so blocks are independent
+        start = f"{block * HIGHLIGHT_BLOCK_LINES + 1}.0"
+        end = f"{(block + 1) * HIGHLIGHT_BLOCK_LINES + 1}.0"
+        chunk = text_widget.get(start, end)
+        if not chunk:
+            return
+        for match in _KEY_RE.finditer(chunk):
+            text_widget.tag_add("key", f"{start} + {match.start()} chars", f"{start} + {match.end()-1} chars")
+        for match in _STRING_RE.finditer(chunk):
+            text_widget.tag_add("string", f"{start} + {match.start()+1} chars", f"{start} + {match.end()} chars")
+        for match in _NUMBER_RE.finditer(chunk):
+            if not text_widget.tag_names(f"{start} + {match.start()} chars"):
+                text_widget.tag_add("number", f"{start} + {match.start()} chars", f"{start} + {match.end()} chars")
 
     def generate_html(self, text_widget):
         """Converts text widget content with tags to an HTML string."""
@@ -117,7 +252,7 @@ class JsonGeoTool:
         import copy
         truncated = copy.deepcopy(self.last_data)
         self._truncate_recursive(truncated)
-        truncated_str = json.dumps(truncated, indent=2, ensure_ascii=False)
+        truncated_str = fastjson.dumps(truncated, indent=2)
         self.copy_to_clipboard(None, override_text=truncated_str)
 
     def _truncate_recursive(self, obj):
@@ -134,40 +269,134 @@ class JsonGeoTool:
         self.input_text.delete("1.0", tk.END)
         self.pretty_text.delete("1.0", tk.END)
         self.geo_text.delete("1.0", tk.END)
+        self._highlighted.clear()
 
     def process_json(self):
         # Clear previous outputs
         self.pretty_text.delete("1.0", tk.END)
         self.geo_text.delete("1.0", tk.END)
+        self._highlighted.clear()
 
         raw_content = self.input_text.get("1.0", tk.END).strip()
         if not raw_content:
             return
 
+        # Parsing, formatting and conversion run on a worker thread
+        self._start_job(self._process_worker, raw_content, "Parsing JSON…")
+
+    def _start_job(self, target, argument, status):
+        # A newer job makes the results of any previous one obsolete; both job buttons
+        # stay disabled until it finishes
+        self._job_id += 1
+        worker = threading.Thread(target=target, args=(self._job_id, argument), daemon=True)
+        self.convert_btn.configure(state=tk.DISABLED)
+        self.folder_btn.configure(state=tk.DISABLED)
+        self.status_label.configure(text=status)
+        self.progress.start(10)
+        worker.start()
+        if not self._polling:
+            self._polling = True
+            self.root.after(WORKER_POLL_MS, self._poll_worker)
+
+    def _process_worker(self, job_id, raw_content):
+        # Runs off the Tk thread: must not touch any widget, only the results queue
         try:
             # Parse JSON
-            data = json.loads(raw_content)
-            
-            # 1. Output Pretty JSON with Highlighting
-            pretty_json = json.dumps(data, indent=2, ensure_ascii=False)
-            self.highlight_json(self.pretty_text, pretty_json)
-            self.last_data = data
+            data = fastjson.loads(raw_content)
+
+            # 1. Pretty JSON
+            self._results.put((job_id, "status", "Formatting JSON…"))
+            pretty_json = fastjson.dumps(data, indent=2)
 
-            # 2. Output GeoJSON
+            # 2. GeoJSON
+            self._results.put((job_id, "status", "Converting to GeoJSON…"))
             geojson_data = convert_to_geojson_data(data)
-            
             # Only show if there are actual features
-            if geojson_data.get("features"):
-                final_geojson = json.dumps(geojson_data, indent=2, ensure_ascii=False)
-                self.highlight_json(self.geo_text, final_geojson)
-            else:
-                self.geo_text.insert(tk.END, "No waypoints found in the input JSON.")
+            final_geojson = fastjson.dumps(geojson_data, indent=2) if geojson_data.get("features") else None
 
+            self._results.put((job_id, "done", (data, pretty_json, final_geojson)))
         except json.JSONDecodeError as e:
-            messagebox.showerror("JSON Error", f"Failed to parse input JSON:\n{str(e)}")
-            self.pretty_text.insert(tk.END, f"ERROR: {str(e)}", "error")
+            self._results.put((job_id, "json_error", e))
+        except Exception as e:
+            self._results.put((job_id, "error", e))
+
+    def open_trips_folder(self):
+        """Load every trip file of a folder and show them together on one map."""
+        directory = filedialog.askdirectory(title="Folder with Sentiance JSON / GeoJSON trips")
+        if not directory:
+            return
+
+        self._start_job(self._load_trips_worker, directory, "Loading trips…")
+
+    def _load_trips_worker(self, job_id, directory):
+        # Runs off the Tk thread: must not touch any widget, only the results queue
+        try:
+            paths = sorted(p for p in Path(directory).iterdir() if p.suffix.lower() in TRIP_SUFFIXES)
+            features, failed = [], []
+            for n, path in enumerate(paths, 1):
+                self._results.put((job_id, "status", f"Loading trips… {n}/{len(paths)}"))
+                try:
+                    file_features = _load_trip_file(path)
+                except Exception:
+                    failed.append(path.name)
+                    continue
+                for feature in file_features:
+                    # Tag every trip with its file, shown in the layers panel
+                    if feature.get("properties") is None:
+                        feature["properties"] = {}
+                    feature["properties"].setdefault("source_file", path.name)
+                    features.append(feature)
+            self._results.put((job_id, "trips", ({"type": "FeatureCollection", "features": features}, failed)))
         except Exception as e:
-            messagebox.showerror("Error", f"An unexpected error occurred:\n{str(e)}")
+            self._results.put((job_id, "error", e))
+
+    def _poll_worker(self):
+        while True:
+            try:
+                job_id, kind, payload = self._results.get_nowait()
+            except queue.Empty:
+                break
+            if job_id != self._job_id:
+                continue
+            if kind == "status":
+                self.status_label.configure(text=payload)
+                continue
+
+            self._polling = False
+            self.progress.stop()
+            self.status_label.configure(text="")
+            self.convert_btn.configure(state=tk.NORMAL)
+            self.folder_btn.configure(state=tk.NORMAL)
+            if kind == "done":
+                self._show_results(*payload)
+            elif kind == "trips":
+                self._show_trips(*payload)
+            elif kind == "json_error":
+                messagebox.showerror("JSON Error", f"Failed to parse input JSON:\n{str(payload)}")
+                self.pretty_text.insert(tk.END, f"ERROR: {str(payload)}", "error")
+            else:
+                messagebox.showerror("Error", f"An unexpected error occurred:\n{str(payload)}")
+            return
+        self.root.after(WORKER_POLL_MS, self._poll_worker)
+
+    def _show_results(self, data, pretty_json, final_geojson):
+        # 1. Output Pretty JSON with Highlighting
+        self.highlight_json(self.pretty_text, pretty_json)
+        self.last_data = data
+
+        # 2. Output GeoJSON
+        if final_geojson is not None:
+            self.highlight_json(self.geo_text, final_geojson)
+        else:
+            self.geo_text.insert(tk.END, "No waypoints found in the input JSON.")
+
+    def _show_trips(self, geojson_data, failed):
+        if failed:
+            messagebox.showwarning("Trips Folder", "Could not read:\n" + "\n".join(failed))
+        if not geojson_data["features"]:
+            messagebox.showwarning("No Data", "No trips with waypoints found in the folder.")
+            return
+        MapWindow(self.root, geojson_data)
 
     def show_map(self):
         content = self.geo_text.get("1.0", tk.END).strip()
@@ -176,7 +405,7 @@ class JsonGeoTool:
             return
         
         try:
-            geojson_data = json.loads(content)
+            geojson_data = fastjson.loads(content)
             MapWindow(self.root, geojson_data)
         except Exception as e:
             messagebox.showerror("Map Error", f"Could not display map: {str(e)}")
@@ -193,80 +422,291 @@ class MapWindow(tk.Toplevel):
         
         tk.Label(btn_frame, text="Use Right Click to change map tile provider", fg="gray").pack(side=tk.LEFT)
         tk.Button(btn_frame, text="📸 Copy Map to Clipboard", command=self.copy_map_to_clipboard, bg="#FF9800", fg="black").pack(side=tk.RIGHT)
+        # Trip identified by the last left click on the map
+        self.info_label = tk.Label(btn_frame, text="", anchor="w")
+        self.info_label.pack(side=tk.LEFT, fill=tk.X, expand=True, padx=10)
 
-        self.map_widget = tkintermapview.TkinterMapView(self, corner_radius=0)
+        # Tiles are read from / stored in the local SQLite cache (see tile_cache.py)
+        self.map_widget = CachedMapView(self, corner_radius=0)
         self.map_widget.pack(fill="both", expand=True)
         
         # Set default tile server (OpenStreetMap)
         self.map_widget.set_tile_server("https://a.tile.openstreetmap.org/{z}/{x}/{y}.png")
-        
+
+        # Full-resolution (lat, lon) arrays, their Douglas-Peucker significance and
+        # their map paths, one per LineString
+        self._routes = []
+        self._significance = []
+        self._paths = []
+        # Feature properties and (start, end) markers of each route; hidden layers
+        # have no path nor markers on the map
+        self._props = []
+        self._markers = []
+        self._visible = []
+        self._selected = None
+        # Grid index over every route, for identifying the trip under a click
+        self._index = GridIndex()
+        # zoom level -> simplified position lists (one per route)
+        self._lod_cache = {}
+        self._lod_zoom = None
+        self._lod_job = None
+        # Start/end dot icons, built once per color and shared by every marker of the window
+        self._icons = {}
+
         self.display_geojson(geojson_data)
+        self.map_widget.add_left_click_map_command(self.identify_trip)
+        self._lod_job = self.after(LOD_POLL_MS, self._poll_zoom)
+
+    def destroy(self):
+        if self._lod_job is not None:
+            self.after_cancel(self._lod_job)
+            self._lod_job = None
+        super().destroy()
+
+    def _marker_icons(self, color):
+        if color in self._icons:
+            return self._icons[color]
+        # Create small dot icons using PIL for a cleaner look
+        try:
+            from PIL import Image, ImageDraw, ImageTk
+            # Create 10x10 dots
+            start_dot = Image.new("RGBA", (10, 10), (0, 0, 0, 0))
+            end_dot = Image.new("RGBA", (10, 10), (0, 0, 0, 0))
+
+            # Start (White with a border in the route color)
+            draw_s = ImageDraw.Draw(start_dot)
+            draw_s.ellipse((1, 1, 8, 8), fill="#FFFFFF", outline=color, width=2)
+            # End (Route color with Black border)
+            draw_e = ImageDraw.Draw(end_dot)
+            draw_e.ellipse((1, 1, 8, 8), fill=color, outline="#000000", width=1)
+
+            # Keep references to avoid garbage collection (returned icons live on the window)
+            icons = ImageTk.PhotoImage(start_dot, master=self), ImageTk.PhotoImage(end_dot, master=self)
+        except Exception:
+            # Fallback to standard icons if PIL fails
+            icons = None, None
+        self._icons[color] = icons
+        return icons
 
     def display_geojson(self, geojson_data):
         features = geojson_data.get("features", [])
         if not features:
             return
 
-        all_coords = []
-        
         for feature in features:
             geom = feature.get("geometry", {})
-            props = feature.get("properties", {})
-            
             if geom.get("type") == "LineString":
-                coords = geom.get("coordinates", [])
-                # tkintermapview path needs (lat, lon)
-                path_coords = [(lat, lon) for lon, lat in coords]
-                if path_coords:
-                    # Color based on transport mode if available
-                    self.map_widget.set_path(path_coords, color="#00FF00", width=4)
-                    all_coords.extend(path_coords)
-                    
-                    # Create small dot icons using PIL for a cleaner look
-                    try:
-                        from PIL import Image, ImageTk
-                        # Create 10x10 dots
-                        start_dot = Image.new("RGBA", (10, 10), (0, 0, 0, 0))
-                        end_dot = Image.new("RGBA", (10, 10), (0, 0, 0, 0))
-                        
-                        from PIL import ImageDraw
-                        # Start (White with Green border)
-                        draw_s = ImageDraw.Draw(start_dot)
-                        draw_s.ellipse((1, 1, 8, 8), fill="#FFFFFF", outline="#00FF00", width=2)
-                        # End (Green with Black border)
-                        draw_e = ImageDraw.Draw(end_dot)
-                        draw_e.ellipse((1, 1, 8, 8), fill="#00FF00", outline="#000000", width=1)
-                        
-                        start_icon = ImageTk.PhotoImage(start_dot)
-                        end_icon = ImageTk.PhotoImage(end_dot)
-                        
-                        # Keep references to avoid garbage collection
-                        if not hasattr(self, "_marker_icons"): self._marker_icons = []
-                        self._marker_icons.extend([start_icon, end_icon])
-
-                        self.map_widget.set_marker(path_coords[0][0], path_coords[0][1], text="Start", icon=start_icon)
-                        self.map_widget.set_marker(path_coords[-1][0], path_coords[-1][1], text="End", icon=end_icon)
-                    except Exception:
-                        # Fallback to standard icons if PIL fails
-                        self.map_widget.set_marker(path_coords[0][0], path_coords[0][1], text="Start")
-                        self.map_widget.set_marker(path_coords[-1][0], path_coords[-1][1], text="End")
-        
-        if all_coords:
-            # Set map position to focus on the data
-            lats = [c[0] for c in all_coords]
-            lons = [c[1] for c in all_coords]
-            min_lat, max_lat = min(lats), max(lats)
-            min_lon, max_lon = min(lons), max(lons)
-            
-            avg_lat = (min_lat + max_lat) / 2
-            avg_lon = (min_lon + max_lon) / 2
-            
-            self.map_widget.set_position(avg_lat, avg_lon)
-            self.map_widget.set_zoom(14)
+                coords = np.asarray(geom.get("coordinates", []), dtype=float)
+                if coords.ndim == 2 and len(coords):
+                    # tkintermapview path needs (lat, lon)
+                    self._routes.append(coords[:, [1, 0]])
+                    self._props.append(feature.get("properties") or {})
+
+        if not self._routes:
+            return
+
+        # One simplification pass per route serves every zoom level (see `_lod_positions`)
+        finest = _lod_tolerance(self.map_widget.max_zoom)
+        self._significance = [polyline.dp_significance(route, finest) for route in self._routes]
+
+        # Set map position to focus on the data
+        all_coords = np.concatenate(self._routes)
+        min_lat, min_lon = all_coords.min(axis=0)
+        max_lat, max_lon = all_coords.max(axis=0)
+
+        avg_lat = (min_lat + max_lat) / 2
+        avg_lon = (min_lon + max_lon) / 2
+
+        self.map_widget.set_position(avg_lat, avg_lon)
+        self.map_widget.set_zoom(14)
+
+        # Paths are created already simplified for the current zoom level
+        self._lod_zoom = round(self.map_widget.zoom)
+        for i, route in enumerate(self._routes):
+            self._index.add(i, route)
+            self._paths.append(None)
+            self._markers.append(())
+            self._visible.append(True)
+            self._show_route(i)
+
+        # Several trips: one toggleable layer per transport mode and per trip
+        if len(self._routes) > 1:
+            self._build_layers_panel()
+
+    def _show_route(self, i):
+        route, props = self._routes[i], self._props[i]
+        # Color based on transport mode if available
+        color = self.get_color_by_mode(props.get("transportMode"))
+        positions = self._lod_positions(self._lod_zoom)[i]
+        self._paths[i] = self.map_widget.set_path(positions, color=color, width=4)
+
+        start, end = route[0].tolist(), route[-1].tolist()
+        start_icon, end_icon = self._marker_icons(color)
+        if start_icon is not None:
+            self._markers[i] = (self.map_widget.set_marker(start[0], start[1], text="Start", icon=start_icon),
+                                self.map_widget.set_marker(end[0], end[1], text="End", icon=end_icon))
+        else:
+            self._markers[i] = (self.map_widget.set_marker(start[0], start[1], text="Start"),
+                                self.map_widget.set_marker(end[0], end[1], text="End"))
+
+    def _hide_route(self, i):
+        if self._paths[i] is not None:
+            self._paths[i].delete()
+            self._paths[i] = None
+        for marker in self._markers[i]:
+            marker.delete()
+        self._markers[i] = ()
+        if self._selected == i:
+            self._select_route(None)
+
+    def set_route_visible(self, i, visible):
+        """Show or hide one trip (path and start/end markers)."""
+        if visible == self._visible[i]:
+            return
+        self._visible[i] = visible
+        if visible:
+            self._show_route(i)
+        else:
+            self._hide_route(i)
+        if hasattr(self, "layers_tree"):
+            self._refresh_layer_labels()
+
+    def _build_layers_panel(self):
+        panel = tk.Frame(self)
+        panel.pack(side=tk.RIGHT, fill=tk.Y, before=self.map_widget)
+
+        tk.Label(panel, text="Layers (double click / space to toggle)", fg="gray").pack(side=tk.TOP, anchor="w")
+        buttons = tk.Frame(panel)
+        buttons.pack(side=tk.BOTTOM, fill=tk.X)
+        tk.Button(buttons, text="Show all", command=lambda: self._set_all_visible(True)).pack(side=tk.LEFT, padx=2, pady=2)
+        tk.Button(buttons, text="Hide all", command=lambda: self._set_all_visible(False)).pack(side=tk.LEFT, padx=2, pady=2)
+
+        self.layers_tree = ttk.Treeview(panel, show="tree", selectmode="browse")
+        scrollbar = ttk.Scrollbar(panel, orient=tk.VERTICAL, command=self.layers_tree.yview)
+        self.layers_tree.configure(yscrollcommand=scrollbar.set)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.layers_tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+
+        for i, props in enumerate(self._props):
+            mode = props.get("transportMode") or "UNKNOWN"
+            mode_item = f"mode:{mode}"
+            if not self.layers_tree.exists(mode_item):
+                self.layers_tree.insert("", tk.END, iid=mode_item, open=True, tags=(mode_item,))
+                self.layers_tree.tag_configure(mode_item, foreground=self.get_color_by_mode(mode))
+            self.layers_tree.insert(mode_item, tk.END, iid=f"route:{i}")
+        self._refresh_layer_labels()
+
+        self.layers_tree.bind("<Double-1>", self._toggle_focused_layer)
+        self.layers_tree.bind("<space>", self._toggle_focused_layer)
+        self.layers_tree.bind("<<TreeviewSelect>>", self._on_layer_select)
+
+    def _refresh_layer_labels(self):
+        for mode_item in self.layers_tree.get_children():
+            children = self.layers_tree.get_children(mode_item)
+            shown = sum(self._visible[int(child.split(":")[1])] for child in children)
+            check = "☑" if shown == len(children) else ("☐" if shown == 0 else "◩")
+            self.layers_tree.item(mode_item, text=f"{check} {mode_item.split(':', 1)[1]} ({shown}/{len(children)})")
+            for child in children:
+                i = int(child.split(":")[1])
+                check = "☑" if self._visible[i] else "☐"
+                self.layers_tree.item(child, text=f"{check} {_route_label(self._props[i])}")
+
+    def _toggle_focused_layer(self, event=None):
+        item = self.layers_tree.focus()
+        if not item:
+            return "break"
+        if item.startswith("mode:"):
+            routes = [int(child.split(":")[1]) for child in self.layers_tree.get_children(item)]
+            visible = not all(self._visible[i] for i in routes)
+        else:
+            routes = [int(item.split(":")[1])]
+            visible = not self._visible[routes[0]]
+        for i in routes:
+            self.set_route_visible(i, visible)
+        return "break"
+
+    def _set_all_visible(self, visible):
+        for i in range(len(self._routes)):
+            self.set_route_visible(i, visible)
+
+    def _on_layer_select(self, event=None):
+        item = self.layers_tree.focus()
+        if item.startswith("route:"):
+            i = int(item.split(":")[1])
+            self._select_route(i if self._visible[i] else None)
+
+    def identify_trip(self, coords):
+        """Left click handler: highlight the visible trip closest to the clicked point."""
+        lat, lon = coords
+        # CLICK_TOLERANCE_PX screen pixels around the click, in degrees at the current zoom
+        radius = CLICK_TOLERANCE_PX * 360.0 / (256 * 2 ** round(self.map_widget.zoom))
+        visible = {i for i, shown in enumerate(self._visible) if shown}
+        hit = self._index.query(lat, lon, radius, visible)
+        self._select_route(hit[0] if hit else None)
+        if hit and hasattr(self, "layers_tree"):
+            item = f"route:{hit[0]}"
+            self.layers_tree.see(item)
+            self.layers_tree.selection_set(item)
+            self.layers_tree.focus(item)
+
+    def _select_route(self, i):
+        canvas = self.map_widget.canvas
+        previous = self._paths[self._selected] if self._selected is not None else None
+        if previous is not None:
+            previous.width = 4
+            if previous.canvas_line is not None:
+                canvas.itemconfigure(previous.canvas_line, width=4)
+        self._selected = i
+        if i is None or self._paths[i] is None:
+            self._selected = None
+            self.info_label.configure(text="")
+            return
+
+        path = self._paths[i]
+        path.width = 8
+        if path.canvas_line is not None:
+            canvas.itemconfigure(path.canvas_line, width=8)
+        props = self._props[i]
+        details = [_route_label(props), props.get("transportMode")]
+        if props.get("distance") is not None:
+            details.append(f"{props['distance']:.0f} m" if isinstance(props["distance"], (int, float)) else str(props["distance"]))
+        if props.get("endTime"):
+            details.append(f"→ {props['endTime']}")
+        self.info_label.configure(text=" · ".join(str(d) for d in details if d))
+
+    def _lod_positions(self, zoom):
+        """Simplified position lists of every route for `zoom`, computed once per zoom level."""
+        cached = self._lod_cache.get(zoom)
+        if cached is not None:
+            return cached
+
+        tolerance = _lod_tolerance(zoom)
+        simplified = [route[significance > tolerance]
+                      for route, significance in zip(self._routes, self._significance)]
+
+        total = sum(len(route) for route in simplified)
+        if total > MAX_RENDERED_VERTICES:
+            # Still too many vertices: thin every route evenly, keeping its endpoints
+            ratio = MAX_RENDERED_VERTICES / total
+            simplified = [route[_even_indices(len(route), max(2, int(len(route) * ratio)))] for route in simplified]
+
+        cached = self._lod_cache[zoom] = [route.tolist() for route in simplified]
+        return cached
+
+    def _poll_zoom(self):
+        # tkintermapview has no zoom event: check the level periodically and swap the detail
+        zoom = round(self.map_widget.zoom)
+        if zoom != self._lod_zoom and self._paths:
+            self._lod_zoom = zoom
+            for path, positions in zip(self._paths, self._lod_positions(zoom)):
+                if path is not None:
+                    path.set_position_list(positions)
+        self._lod_job = self.after(LOD_POLL_MS, self._poll_zoom)
 
     def get_color_by_mode(self, mode):
         # User requested bright green (#00FF00)
-        return "#00FF00"
+        # It stays the color of cars and of unknown modes; other modes get their own color
+        return MODE_COLORS.get(str(mode).upper(), "#00FF00")
 
     def copy_map_to_clipboard(self):
         try:
@@ -3,7 +3,7 @@
 
 a = Analysis(
     ['json_geo_gui.py'],
-    pathex=[],
+    pathex=['..'],
     binaries=[],
     datas=[],
     hiddenimports=[],
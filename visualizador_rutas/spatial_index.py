@@ -0,0 +1,99 @@
+"""
+Grid Spatial Index for Route Hit-Testing
+
+Answers "which route passes closest to this point?" for the multi-trip map view
+without measuring the distance to every segment of every loaded trip.
+
+Every segment is registered in the cells of a regular lat/lon grid that it
+crosses (long segments, e.g. GPS gaps, are sampled every half cell). A query
+only measures the segments registered in the cells within the search radius,
+with NumPy, and returns the nearest route.
+
+Distances are planar in degrees of latitude, with longitudes scaled by the
+cosine of the query latitude.
+"""
+import math
+from collections import defaultdict
+
+import numpy as np
+
+
+class GridIndex:
+    def __init__(self, cell_size=0.005):
+        # ~500 m cells: a click only inspects a handful of cells at street zoom levels
+        self.cell_size = cell_size
+        # (row, col) -> {route_id: array of segment indices}
+        self._cells = defaultdict(dict)
+        # route_id -> (lat, lon) array
+        self._routes = {}
+
+    def __len__(self):
+        return len(self._routes)
+
+    def add(self, route_id, coords):
+        """Register a route given as an `(N, 2)` array of `(lat, lon)`."""
+        coords = np.asarray(coords, dtype=float).reshape(-1, 2)
+        if len(coords) == 0:
+            return
+        if len(coords) == 1:
+            # A single point is indexed as a zero-length segment
+            coords = np.vstack([coords, coords])
+        self._routes[route_id] = coords
+
+        start, end = coords[:-1], coords[1:]
+        lengths = np.hypot(*(end - start).T)
+        # Samples per segment so that consecutive samples are at most half a cell apart
+        samples = np.ceil(lengths / (self.cell_size / 2)).astype(int) + 1
+        segment_ids = np.repeat(np.arange(len(start)), samples)
+        offsets = np.concatenate(([0], np.cumsum(samples)[:-1]))
+        t = (np.arange(len(segment_ids)) - np.repeat(offsets, samples)) / np.repeat(np.maximum(samples - 1, 1), samples)
+        points = start[segment_ids] + t[:, None] * (end - start)[segment_ids]
+
+        cells = np.floor(points / self.cell_size).astype(np.int64)
+        keys = np.unique(np.column_stack((cells, segment_ids)), axis=0)
+        # Group the (row, col, segment) triples by cell
+        boundaries = np.flatnonzero(np.any(np.diff(keys[:, :2], axis=0) != 0, axis=1)) + 1
+        for group in np.split(keys, boundaries):
+            row, col = int(group[0, 0]), int(group[0, 1])
+            self._cells[(row, col)][route_id] = group[:, 2]
+
+    def remove(self, route_id):
+        self._routes.pop(route_id, None)
+        for cell in list(self._cells):
+            entries = self._cells[cell]
+            entries.pop(route_id, None)
+            if not entries:
+                del self._cells[cell]
+
+    def query(self, lat, lon, radius, route_ids=None):
+        """
+        Nearest route to `(lat, lon)` within `radius` degrees, as `(route_id, distance)`,
+        or None. `route_ids` restricts the search (e.g. to the visible layers).
+        """
+        lon_scale = math.cos(math.radians(lat))
+        row0, col0 = math.floor((lat - radius) / self.cell_size), math.floor((lon - radius / max(lon_scale, 1e-6)) / self.cell_size)
+        row1, col1 = math.floor((lat + radius) / self.cell_size), math.floor((lon + radius / max(lon_scale, 1e-6)) / self.cell_size)
+
+        candidates = defaultdict(list)
+        for row in range(row0, row1 + 1):
+            for col in range(col0, col1 + 1):
+                for route_id, segments in self._cells.get((row, col), {}).items():
+                    if route_ids is None or route_id in route_ids:
+                        candidates[route_id].append(segments)
+
+        best = None
+        point = np.array([lat, lon * lon_scale])
+        for route_id, segment_lists in candidates.items():
+            coords = self._routes[route_id]
+            segments = np.unique(np.concatenate(segment_lists))
+            start = coords[segments] * [1.0, lon_scale]
+            end = coords[segments + 1] * [1.0, lon_scale]
+            delta = end - start
+            length_sq = np.einsum("ij,ij->i", delta, delta)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                t = np.where(length_sq > 0, np.einsum("ij,ij->i", point - start, delta) / length_sq, 0.0)
+            nearest = start + np.clip(t, 0.0, 1.0)[:, None] * delta
+            distance = float(np.min(np.hypot(*(nearest - point).T)))
+            if distance <= radius and (best is None or distance < best[1]):
+                best = (route_id, distance)
+        return best
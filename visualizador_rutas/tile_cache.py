@@ -0,0 +1,360 @@
+#!/usr/bin/env python3
+"""
+Offline Tile Cache for the Route Map Viewer
+
+Map tiles are kept in a local SQLite database so repeated views of the same area
+load from disk and the viewer keeps working without a network connection.
+
+Key Features:
+- `TileCache`: SQLite store using the same `tiles(zoom, x, y, server, tile_image)`
+  table as tkintermapview's offline databases, plus `nbytes` / `last_access`
+  columns for least-recently-used eviction once the cache exceeds its size limit.
+  A single connection is shared by all tile loader threads behind a lock.
+- `CachedMapView`: drop-in `TkinterMapView` that reads tiles from the cache
+  first and stores every downloaded tile (optionally cache-only / offline).
+- Pre-seeding: downloads every tile covering the bounding box of a GeoJSON file
+  for a range of zoom levels.
+
+Configuration (environment):
+    TILE_CACHE_PATH     database file (default: ~/.cache/visualizador_rutas/tiles.sqlite)
+    TILE_CACHE_MAX_MB   size limit before eviction (default: 500)
+    TILE_CACHE_OFFLINE  "1" to never hit the network
+
+Usage:
+    python tile_cache.py seed <route.geojson> --zoom 10-16 [--padding 0.01]
+    python tile_cache.py stats
+"""
+import argparse
+import io
+import math
+import os
+import sqlite3
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import PIL
+import requests
+import tkintermapview
+from PIL import Image, ImageTk
+
+# The shared JSON layer lives in sentiance_common/ at the repository root
+_REPO_ROOT = str(Path(__file__).resolve().parent.parent)
+if _REPO_ROOT not in sys.path:
+    sys.path.insert(0, _REPO_ROOT)
+
+from sentiance_common import fastjson
+
+DEFAULT_SERVER = "https://a.tile.openstreetmap.org/{z}/{x}/{y}.png"
+DEFAULT_PATH = Path.home() / ".cache" / "visualizador_rutas" / "tiles.sqlite"
+DEFAULT_MAX_MB = 500
+
+# OpenStreetMap's tile usage policy requires an identifying User-Agent
+USER_AGENT = "visualizador_rutas/1.0 (+tkintermapview)"
+REQUEST_TIMEOUT = 10
+
+# Refuse to seed more tiles than this unless explicitly allowed (bulk downloads
+# from the public OSM servers are against their usage policy)
+MAX_SEED_TILES = 10_000
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS tiles (
+    zoom INTEGER NOT NULL,
+    x INTEGER NOT NULL,
+    y INTEGER NOT NULL,
+    server VARCHAR(300) NOT NULL,
+    tile_image BLOB NOT NULL,
+    CONSTRAINT pk_tiles PRIMARY KEY (zoom, x, y, server)
+);
+"""
+
+
+def _tile_url(server, zoom, x, y):
+    return server.replace("{x}", str(x)).replace("{y}", str(y)).replace("{z}", str(zoom))
+
+
+def fetch_tile(server, zoom, x, y, session=None):
+    """Download one tile; returns its bytes, or None if the server has no image for it."""
+    response = (session or requests).get(_tile_url(server, zoom, x, y), timeout=REQUEST_TIMEOUT,
+                                         headers={"User-Agent": USER_AGENT})
+    if response.status_code == 404:
+        return None
+    response.raise_for_status()
+    return response.content
+
+
+class TileCache:
+    """Size-bounded SQLite tile store, safe to share between threads."""
+
+    def __init__(self, path=None, max_bytes=None):
+        self.path = Path(path or os.getenv("TILE_CACHE_PATH") or DEFAULT_PATH)
+        self.max_bytes = max_bytes if max_bytes is not None else \
+            int(float(os.getenv("TILE_CACHE_MAX_MB", DEFAULT_MAX_MB)) * 1024 * 1024)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        with self._conn:
+            self._conn.executescript(_SCHEMA)
+            # Databases created by tkintermapview's OfflineLoader lack the LRU bookkeeping
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(tiles)")}
+            if "nbytes" not in columns:
+                self._conn.execute("ALTER TABLE tiles ADD COLUMN nbytes INTEGER")
+                self._conn.execute("UPDATE tiles SET nbytes = length(tile_image)")
+            if "last_access" not in columns:
+                self._conn.execute("ALTER TABLE tiles ADD COLUMN last_access REAL NOT NULL DEFAULT 0")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS ix_tiles_last_access ON tiles (last_access)")
+        self._total = self._conn.execute("SELECT COALESCE(SUM(nbytes), 0) FROM tiles").fetchone()[0]
+
+    def get(self, zoom, x, y, server):
+        """Cached tile bytes, or None. A hit refreshes the tile's LRU position."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT tile_image FROM tiles WHERE zoom=? AND x=? AND y=? AND server=?",
+                (zoom, x, y, server)).fetchone()
+            if row is None:
+                return None
+            with self._conn:
+                self._conn.execute(
+                    "UPDATE tiles SET last_access=? WHERE zoom=? AND x=? AND y=? AND server=?",
+                    (time.time(), zoom, x, y, server))
+            return row[0]
+
+    def contains(self, zoom, x, y, server):
+        with self._lock:
+            return self._conn.execute(
+                "SELECT 1 FROM tiles WHERE zoom=? AND x=? AND y=? AND server=?",
+                (zoom, x, y, server)).fetchone() is not None
+
+    def put(self, zoom, x, y, server, data):
+        """Store a tile, evicting the least recently used ones if the size limit is exceeded."""
+        with self._lock:
+            with self._conn:
+                old = self._conn.execute(
+                    "SELECT nbytes FROM tiles WHERE zoom=? AND x=? AND y=? AND server=?",
+                    (zoom, x, y, server)).fetchone()
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO tiles (zoom, x, y, server, tile_image, nbytes, last_access) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (zoom, x, y, server, sqlite3.Binary(data), len(data), time.time()))
+            replaced = (old[0] or 0) if old else 0
+            self._total += len(data) - replaced
+            if self._total > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        # Free down to 90% of the limit so eviction does not run on every insert
+        target = int(self.max_bytes * 0.9)
+        with self._conn:
+            rows = self._conn.execute(
+                "SELECT rowid, nbytes FROM tiles ORDER BY last_access").fetchall()
+            doomed = []
+            for rowid, nbytes in rows:
+                if self._total <= target:
+                    break
+                doomed.append((rowid,))
+                self._total -= nbytes or 0
+            self._conn.executemany("DELETE FROM tiles WHERE rowid=?", doomed)
+
+    def stats(self):
+        """`(tile count, total bytes)` currently stored."""
+        with self._lock:
+            count = self._conn.execute("SELECT COUNT(*) FROM tiles").fetchone()[0]
+        return count, self._total
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def default_cache():
+    """The process-wide cache configured from the environment (shared by every map window)."""
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = TileCache()
+        return _default_cache
+
+
+class CachedMapView(tkintermapview.TkinterMapView):
+    """TkinterMapView whose tiles come from a `TileCache` before hitting the network."""
+
+    def __init__(self, *args, tile_cache=None, offline=None, **kwargs):
+        # Set before the base constructor: it starts the loader threads that call request_image
+        self.tile_cache = tile_cache if tile_cache is not None else default_cache()
+        self.offline = os.getenv("TILE_CACHE_OFFLINE") == "1" if offline is None else offline
+        self._session = requests.Session()
+        super().__init__(*args, **kwargs)
+
+    def request_image(self, zoom, x, y, db_cursor=None):
+        # Overlays are composed from two servers; leave them to the uncached implementation
+        if self.overlay_tile_server is not None:
+            return super().request_image(zoom, x, y, db_cursor=db_cursor)
+
+        try:
+            data = self.tile_cache.get(zoom, x, y, self.tile_server)
+            if data is None:
+                if self.offline:
+                    return self.empty_tile_image
+                data = fetch_tile(self.tile_server, zoom, x, y, self._session)
+                if data is None:
+                    # Image does not exist for given coordinates
+                    self.tile_image_cache[f"{zoom}{x}{y}"] = self.empty_tile_image
+                    return self.empty_tile_image
+                self.tile_cache.put(zoom, x, y, self.tile_server, data)
+
+            image = Image.open(io.BytesIO(data))
+            if not self.running:
+                return self.empty_tile_image
+            image_tk = ImageTk.PhotoImage(image)
+            self.tile_image_cache[f"{zoom}{x}{y}"] = image_tk
+            return image_tk
+
+        except PIL.UnidentifiedImageError:
+            self.tile_image_cache[f"{zoom}{x}{y}"] = self.empty_tile_image
+            return self.empty_tile_image
+
+        except Exception:
+            return self.empty_tile_image
+
+
+def geojson_bbox(geojson_data):
+    """`(min_lat, min_lon, max_lat, max_lon)` of every coordinate in a GeoJSON object, or None."""
+    lats, lons = [], []
+
+    def walk(coords):
+        if coords and isinstance(coords[0], (int, float)):
+            lons.append(coords[0])
+            lats.append(coords[1])
+        else:
+            for item in coords:
+                walk(item)
+
+    features = geojson_data.get("features") or [geojson_data]
+    for feature in features:
+        geom = feature.get("geometry") or feature
+        walk(geom.get("coordinates") or [])
+    if not lats:
+        return None
+    return min(lats), min(lons), max(lats), max(lons)
+
+
+def tiles_for_bbox(bbox, zooms):
+    """Every `(zoom, x, y)` tile covering `bbox` at each of `zooms`."""
+    min_lat, min_lon, max_lat, max_lon = bbox
+    for zoom in zooms:
+        n = 2 ** zoom
+        # Tile rows grow southwards: the north edge gives the smallest y
+        x0, y0 = tkintermapview.decimal_to_osm(max_lat, min_lon, zoom)
+        x1, y1 = tkintermapview.decimal_to_osm(min_lat, max_lon, zoom)
+        for x in range(max(0, math.floor(x0)), min(n - 1, math.floor(x1)) + 1):
+            for y in range(max(0, math.floor(y0)), min(n - 1, math.floor(y1)) + 1):
+                yield zoom, x, y
+
+
+def seed(cache, bbox, zooms, server=DEFAULT_SERVER, workers=2, max_tiles=MAX_SEED_TILES, progress=None):
+    """
+    Download the tiles covering `bbox` at `zooms` that are not cached yet.
+
+    Returns `(downloaded, already_cached, failed)`. Raises ValueError if more than
+    `max_tiles` tiles would be requested.
+    """
+    tiles = list(tiles_for_bbox(bbox, zooms))
+    if max_tiles is not None and len(tiles) > max_tiles:
+        raise ValueError(f"{len(tiles)} tiles requested (limit {max_tiles}); "
+                         "reduce the zoom range or raise the limit")
+
+    missing = [tile for tile in tiles if not cache.contains(*tile, server)]
+    cached = len(tiles) - len(missing)
+    session = requests.Session()
+    session.mount("https://", requests.adapters.HTTPAdapter(pool_maxsize=workers))
+
+    def download(tile):
+        try:
+            data = fetch_tile(server, *tile, session)
+        except requests.RequestException:
+            return False
+        if data is not None:
+            cache.put(*tile, server, data)
+        return True
+
+    downloaded = failed = 0
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for done, ok in enumerate(pool.map(download, missing), 1):
+            if ok:
+                downloaded += 1
+            else:
+                failed += 1
+            if progress is not None:
+                progress(done, len(missing))
+    return downloaded, cached, failed
+
+
+def _parse_zooms(spec):
+    if "-" in spec:
+        first, last = (int(part) for part in spec.split("-", 1))
+        return range(first, last + 1)
+    return [int(z) for z in spec.split(",")]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline tile cache for the route map viewer.")
+    parser.add_argument("--db", default=None, help=f"cache database (default: TILE_CACHE_PATH or {DEFAULT_PATH})")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    seed_parser = commands.add_parser("seed", help="download the tiles covering a GeoJSON file")
+    seed_parser.add_argument("geojson", help="GeoJSON file whose bounding box is downloaded")
+    seed_parser.add_argument("--zoom", default="10-16", help="zoom levels, e.g. 10-16 or 12,14 (default: %(default)s)")
+    seed_parser.add_argument("--padding", type=float, default=0.01, help="degrees added around the bbox (default: %(default)s)")
+    seed_parser.add_argument("--server", default=DEFAULT_SERVER, help="tile server URL template")
+    seed_parser.add_argument("-j", "--workers", type=int, default=2, help="parallel downloads (default: %(default)s)")
+    seed_parser.add_argument("--max-tiles", type=int, default=MAX_SEED_TILES,
+                             help="refuse larger requests (default: %(default)s)")
+
+    commands.add_parser("stats", help="show the number and size of cached tiles")
+    args = parser.parse_args()
+
+    cache = TileCache(args.db)
+    if args.command == "stats":
+        count, total = cache.stats()
+        print(f"{cache.path}: {count} tiles, {total / 1024 / 1024:.1f} MB (limit {cache.max_bytes / 1024 / 1024:.0f} MB)")
+        return
+
+    try:
+        with open(args.geojson, "rb") as f:
+            bbox = geojson_bbox(fastjson.loads(f.read()))
+    except (fastjson.JSONDecodeError, FileNotFoundError) as e:
+        print(f"Error: Failed to read '{args.geojson}'.")
+        print(f"Details: {e}")
+        sys.exit(1)
+    if bbox is None:
+        print(f"Error: no coordinates found in '{args.geojson}'.")
+        sys.exit(1)
+
+    pad = args.padding
+    bbox = (max(bbox[0] - pad, -85.0511), bbox[1] - pad, min(bbox[2] + pad, 85.0511), bbox[3] + pad)
+
+    def progress(done, total):
+        print(f"\r{done}/{total} tiles", end="", flush=True)
+
+    try:
+        downloaded, cached, failed = seed(cache, bbox, _parse_zooms(args.zoom), server=args.server,
+                                          workers=args.workers, max_tiles=args.max_tiles, progress=progress)
+    except ValueError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    print(f"\nDownloaded {downloaded} tiles, {cached} already cached, {failed} failed.")
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -16,28 +16,51 @@ Key Features:
     - Distance and timestamps
     - Event index for tracking
 - Generates a GeoJSON 'FeatureCollection' suitable for tools like geojson.io, QGIS, or Mapbox.
+- Streaming mode (--stream, requires ijson) for multi-GB exports: events are read
+  one at a time and written as a compact FeatureCollection or as GeoJSONSeq
+  (one Feature per line), so memory stays flat regardless of input size.
+- Optional encoded polyline property (--polyline, Google format), optionally
+  simplified first with Douglas-Peucker or Visvalingam-Whyatt (--simplify).
 
 Usage:
     python waypoints_to_geojson.py <input_json> <output_geojson>
+    python waypoints_to_geojson.py --stream <input_json> <output_geojson>
+    python waypoints_to_geojson.py <input_json> <output.geojsonl>   (GeoJSONSeq, streamed)
+
+Batch mode (a directory or glob as input; converted in parallel across a process
+pool, skipping inputs whose output is already newer):
+    python waypoints_to_geojson.py <input_dir> <output_dir> [-j N] [--force]
+    python waypoints_to_geojson.py "<dumps/*.json>" <merged.geojson> --merge
 """
+import argparse
+import glob
+import io
 import json
+import os
 import sys
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
-def extract_waypoints_to_geojson(input_path, output_path):
-    # Load input JSON
-    try:
-        with open(input_path, "r", encoding="utf-8") as f:
-            data = json.load(f)
-    except (json.JSONDecodeError, FileNotFoundError) as e:
-        print(f"Error: Failed to process file '{input_path}'.")
-        print(f"Details: {e}")
-        sys.exit(1)
+try:
+    import ijson
+except ImportError:  # pragma: no cover - only needed for --stream
+    ijson = None
+
+# The shared JSON layer lives in sentiance_common/ at the repository root
+_REPO_ROOT = str(Path(__file__).resolve().parent.parent)
+if _REPO_ROOT not in sys.path:
+    sys.path.insert(0, _REPO_ROOT)
 
-def convert_to_geojson_data(data):
+from sentiance_common import fastjson, polyline
+from sentiance_common import waypoints as waypoint_arrays
+
+def convert_to_geojson_data(data, polyline_options=None):
     """
     Core logic to convert Sentiance JSON data to GeoJSON.
     Returns a dictionary representing the GeoJSON FeatureCollection.
+
+    With `polyline_options` (a dict of `polyline.encode_waypoints` arguments,
+    possibly empty) each feature also gets an encoded `polyline` property.
     """
     events = []
     if "userContext" in data and "events" in data["userContext"]:
@@ -59,76 +82,439 @@ def convert_to_geojson_data(data):
     features = []
 
     for idx, ev in enumerate(events):
-        if not isinstance(ev, dict):
+        feature = event_to_feature(idx, ev, polyline_options)
+        if feature is not None:
+            features.append(feature)
+
+    return {
+        "type": "FeatureCollection",
+        "features": features,
+    }
+
+
+def event_to_feature(idx, ev, polyline_options=None):
+    """
+    Convert a single Sentiance event into a LineString Feature.
+    Returns None for events without usable waypoints.
+    """
+    if not isinstance(ev, dict):
+        return None
+        
+    waypoints = ev.get("waypoints")
+    if not waypoints:
+        return None
+
+    # Build coordinates array [lon, lat] (one pass into a structured NumPy array)
+    points = waypoint_arrays.to_array(waypoints)
+    if len(points) == 0:
+        return None
+    coords = waypoint_arrays.lonlat(points).tolist()
+
+    # Some useful props from the event if present
+    props = {
+        "event_index": idx,
+        "type": ev.get("type"),
+        "distance": ev.get("distance"),
+        "transportMode": ev.get("transportMode"),
+        "transportTags": ev.get("transportTags"),
+        "startTime": ev.get("startTime"),
+        "endTime": ev.get("endTime"),
+    }
+    if polyline_options is not None:
+        # Same compressed form as `Recorridos.polyline`
+        props["polyline"] = polyline.encode_waypoints(points, **polyline_options)
+
+    return {
+        "type": "Feature",
+        "geometry": {
+            "type": "LineString",
+            "coordinates": coords,
+        },
+        "properties": props,
+    }
+
+
+# Bytes read from the start of a document to find where its event list lives
+SNIFF_BYTES = 64 * 1024
+# Root-level fields event_to_feature reads when the root object is the event itself
+_ROOT_EVENT_KEYS = ("waypoints", "type", "distance", "transportMode", "transportTags", "startTime", "endTime")
+
+
+def _sniff_items_prefix(f):
+    """
+    ijson prefix of the event list when the first SNIFF_BYTES of the document
+    already settle it (a top-level list or `userContext.events`, which take
+    priority over any other structure), else None. `f` is left at the start.
+    """
+    head = f.read(SNIFF_BYTES)
+    f.seek(0)
+    try:
+        for prefix, event, value in ijson.parse(io.BytesIO(head)):
+            if prefix == "" and event == "start_array":
+                return "item"
+            if prefix == "userContext" and event == "map_key" and value == "events":
+                return "userContext.events.item"
+    except ijson.JSONError:
+        # The sniffed head is usually cut in the middle of a value
+        pass
+    return None
+
+
+def _iter_events(f):
+    """
+    Events of an open Sentiance document in a single incremental pass, with the
+    priority of convert_to_geojson_data: `userContext.events` (or a top-level
+    list), else `transportEvent`, else the root object when it has waypoints.
+    List items are yielded as soon as each one is complete; the fallbacks hold
+    at most one event until the end of the document.
+    """
+    items_prefix = "userContext.events.item"
+    has_events = False
+    # Fallback values already complete, and values still being built: prefix -> [builder, depth]
+    captured = {}
+    building = {}
+    for prefix, event, value in ijson.parse(f, use_float=True):
+        if prefix == "" and event == "start_array":
+            # Top-level list of events
+            items_prefix, has_events = "item", True
             continue
-            
-        waypoints = ev.get("waypoints")
-        if not waypoints:
+        if prefix == "userContext" and event == "map_key" and value == "events":
+            has_events = True
+
+        head = prefix.partition(".")[0]
+        if prefix == items_prefix or prefix.startswith(items_prefix + "."):
+            target = items_prefix
+        elif head == "transportEvent" or head in _ROOT_EVENT_KEYS:
+            target = head
+        else:
             continue
 
-        # Build coordinates array [lon, lat]
-        coords = []
-        for wp in waypoints:
-            lon = wp.get("longitude") or wp.get("lon")
-            lat = wp.get("latitude") or wp.get("lat")
-            if lon is None or lat is None:
+        state = building.get(target)
+        if state is None:
+            if event in ("start_map", "start_array"):
+                builder = ijson.ObjectBuilder()
+                builder.event(event, value)
+                building[target] = [builder, 1]
                 continue
-            coords.append([lon, lat])
+            # Scalar value: complete as soon as it is read
+            complete = value
+        else:
+            state[0].event(event, value)
+            if event in ("start_map", "start_array"):
+                state[1] += 1
+            elif event in ("end_map", "end_array"):
+                state[1] -= 1
+            if state[1]:
+                continue
+            complete = state[0].value
+            del building[target]
 
-        if not coords:
-            continue
+        if target == items_prefix:
+            yield complete
+        else:
+            captured[target] = complete
 
-        # Some useful props from the event if present
-        props = {
-            "event_index": idx,
-            "type": ev.get("type"),
-            "distance": ev.get("distance"),
-            "transportMode": ev.get("transportMode"),
-            "transportTags": ev.get("transportTags"),
-            "startTime": ev.get("startTime"),
-            "endTime": ev.get("endTime"),
-        }
+    if has_events:
+        return
+    if "transportEvent" in captured:
+        # Single transport event structure (like viaje.json)
+        yield captured["transportEvent"]
+    elif isinstance(captured.get("waypoints"), list):
+        # The root object is the event itself
+        yield {key: captured[key] for key in _ROOT_EVENT_KEYS if key in captured}
 
-        feature = {
-            "type": "Feature",
-            "geometry": {
-                "type": "LineString",
-                "coordinates": coords,
-            },
-            "properties": props,
-        }
-        features.append(feature)
 
-    return {
-        "type": "FeatureCollection",
-        "features": features,
-    }
+def iter_features(input_path, polyline_options=None):
+    """
+    Yield one Feature at a time from `input_path` with an incremental parser,
+    so memory stays flat regardless of the input size.
+    """
+    with open(input_path, "rb") as f:
+        # Common layouts go straight to ijson's item builder; anything else is
+        # resolved in the same single pass by _iter_events
+        items_prefix = _sniff_items_prefix(f)
+        events = ijson.items(f, items_prefix, use_float=True) if items_prefix else _iter_events(f)
+        for idx, ev in enumerate(events):
+            feature = event_to_feature(idx, ev, polyline_options)
+            if feature is not None:
+                yield feature
+
+
+def write_features(features, output_path, fmt="geojson"):
+    """
+    Write an iterable of Features without holding them all in memory.
+
+    fmt="geojson" writes a compact FeatureCollection; fmt="geojsonseq" writes
+    newline-delimited GeoJSON (one Feature per line). Returns the feature count.
+    """
+    count = 0
+    with open(output_path, "w", encoding="utf-8") as f:
+        if fmt == "geojsonseq":
+            for feature in features:
+                f.write(fastjson.dumps(feature))
+                f.write("\n")
+                count += 1
+            return count
 
+        f.write('{"type":"FeatureCollection","features":[')
+        for feature in features:
+            if count:
+                f.write(",")
+            f.write(fastjson.dumps(feature))
+            count += 1
+        f.write("]}")
+    return count
 
-def extract_waypoints_to_geojson(input_path, output_path):
-    # Load input JSON
+
+def load_features(input_path, stream=False, polyline_options=None):
+    """
+    Features of `input_path`: a lazy iterator with `stream=True`, otherwise a
+    list built from the fully loaded document. Parse errors propagate.
+    """
+    if stream:
+        if ijson is None:
+            raise RuntimeError("streaming mode requires the 'ijson' package (pip install ijson)")
+        return iter_features(input_path, polyline_options)
+    with open(input_path, "rb") as f:
+        data = fastjson.loads(f.read())
+    return convert_to_geojson_data(data, polyline_options)["features"]
+
+
+def convert_file(input_path, output_path, stream=False, fmt=None, polyline_options=None):
+    """
+    Convert `input_path` to GeoJSON at `output_path` and return the feature count.
+
+    By default the whole input is loaded and a pretty-printed FeatureCollection
+    is written. With `stream=True` the input is parsed incrementally and each
+    Feature is written as soon as it is built (compact, or GeoJSONSeq when
+    `fmt="geojsonseq"`, which always streams). Errors are raised to the caller.
+    `polyline_options` is passed on to `convert_to_geojson_data`.
+    """
+    if stream or fmt == "geojsonseq":
+        features = load_features(input_path, stream=True, polyline_options=polyline_options)
+        return write_features(features, output_path, fmt or "geojson")
+
+    fc = {"type": "FeatureCollection", "features": load_features(input_path, polyline_options=polyline_options)}
+    with open(output_path, "w", encoding="utf-8") as f:
+        f.write(fastjson.dumps(fc, indent=2))
+    return len(fc["features"])
+
+
+def _parse_errors():
+    errors = (json.JSONDecodeError, FileNotFoundError, RuntimeError)
+    return errors + ((ijson.JSONError,) if ijson is not None else ())
+
+
+def extract_waypoints_to_geojson(input_path, output_path, stream=False, fmt=None, polyline_options=None):
+    """Command-line wrapper around `convert_file`: reports errors and exits with status 1."""
     try:
-        with open(input_path, "r", encoding="utf-8") as f:
-            data = json.load(f)
-    except (json.JSONDecodeError, FileNotFoundError) as e:
+        return convert_file(input_path, output_path, stream=stream, fmt=fmt, polyline_options=polyline_options)
+    except _parse_errors() as e:
         print(f"Error: Failed to process file '{input_path}'.")
         print(f"Details: {e}")
         sys.exit(1)
 
-    fc = convert_to_geojson_data(data)
 
-    with open(output_path, "w", encoding="utf-8") as f:
-        json.dump(fc, f, ensure_ascii=False, indent=2)
+# Output extensions that select newline-delimited GeoJSON
+_SEQ_SUFFIXES = {".geojsonl", ".geojsons", ".geojsonseq", ".ndjson", ".jsonl"}
 
 
-def main():
-    if len(sys.argv) != 3:
-        print(f"Usage: {Path(sys.argv[0]).name} input.json output.geojson")
+def expand_inputs(spec):
+    """
+    Input files for `spec`: the `*.json` files of a directory, the matches of a
+    glob pattern, or the single file itself. Sorted for reproducible output.
+    """
+    path = Path(spec)
+    if path.is_dir():
+        return sorted(path.glob("*.json"))
+    if glob.has_magic(spec):
+        return sorted(Path(p) for p in glob.glob(spec, recursive=True) if Path(p).is_file())
+    return [path]
+
+
+def is_up_to_date(output_path, *input_paths):
+    """True if `output_path` exists and is newer than every input."""
+    try:
+        out_mtime = Path(output_path).stat().st_mtime_ns
+    except OSError:
+        return False
+    return all(Path(p).stat().st_mtime_ns < out_mtime for p in input_paths)
+
+
+def output_names(inputs, suffix):
+    """
+    Output file name of each input for `batch_convert`: `<stem><suffix>`, unless
+    several inputs share a stem (same name in different folders, or a different
+    extension). Those keep their path relative to the inputs' common folder,
+    joined with "__", and their original extension if that is still ambiguous.
+    """
+    paths = [Path(p).resolve() for p in inputs]
+    names = [p.stem for p in paths]
+    if len({name.casefold() for name in names}) == len(names):
+        return [name + suffix for name in names]
+
+    base = Path(os.path.commonpath([str(p.parent) for p in paths]))
+    relative = [p.relative_to(base) for p in paths]
+    for variant in (lambda rel: rel.with_suffix("").parts, lambda rel: rel.parts):
+        counts = {}
+        for name in names:
+            counts[name.casefold()] = counts.get(name.casefold(), 0) + 1
+        names = [name if counts[name.casefold()] == 1 else "__".join(variant(rel))
+                 for name, rel in zip(names, relative)]
+    return [name + suffix for name in names]
+
+
+def _convert_job(job):
+    # Runs in a worker process: never exits, failures are returned to the parent
+    input_path, output_path, stream, fmt, polyline_options = job
+    try:
+        count = convert_file(input_path, output_path, stream=stream, fmt=fmt, polyline_options=polyline_options)
+        return input_path, count, None
+    except Exception as e:
+        return input_path, None, f"{type(e).__name__}: {e}"
+
+
+def _features_job(job):
+    # Worker for --merge: each feature is tagged with the file it came from
+    input_path, stream, polyline_options = job
+    try:
+        features = list(load_features(input_path, stream=stream, polyline_options=polyline_options))
+    except Exception as e:
+        return input_path, None, f"{type(e).__name__}: {e}"
+    for feature in features:
+        feature["properties"]["source_file"] = Path(input_path).name
+    return input_path, features, None
+
+
+def batch_convert(inputs, output_dir, stream=False, fmt=None, jobs=None, force=False, polyline_options=None):
+    """
+    Convert every file of `inputs` into `output_dir/<stem>.geojson` (`.geojsonl`
+    for GeoJSONSeq) across a process pool.
+
+    Inputs whose stems collide get longer names instead of overwriting each
+    other (see `output_names`). Inputs whose output is already newer are
+    skipped unless `force=True`. Returns `(converted, skipped, failed)`, where
+    `failed` is a list of `(input, error)` pairs.
+    """
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    suffix = ".geojsonl" if fmt == "geojsonseq" else ".geojson"
+
+    pending, skipped = [], 0
+    for input_path, name in zip(inputs, output_names(inputs, suffix)):
+        output_path = output_dir / name
+        if not force and is_up_to_date(output_path, input_path):
+            skipped += 1
+            continue
+        pending.append((str(input_path), str(output_path), stream, fmt, polyline_options))
+
+    converted, failed = 0, []
+    if pending:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            # Small chunks amortize the IPC cost when converting thousands of trips
+            chunksize = max(1, len(pending) // ((jobs or os.cpu_count() or 1) * 4))
+            for input_path, _count, error in pool.map(_convert_job, pending, chunksize=chunksize):
+                if error:
+                    failed.append((input_path, error))
+                else:
+                    converted += 1
+    return converted, skipped, failed
+
+
+def batch_merge(inputs, output_path, stream=False, fmt=None, jobs=None, force=False, polyline_options=None):
+    """
+    Convert every file of `inputs` in parallel and write all their features, in
+    input order, to a single FeatureCollection (or GeoJSONSeq) at `output_path`.
+
+    Each feature gets a `source_file` property. Returns `(features, failed)`;
+    nothing is done (and `(None, [])` returned) if the output is newer than all inputs.
+    """
+    inputs = [str(p) for p in inputs]
+    if not force and inputs and is_up_to_date(output_path, *inputs):
+        return None, []
+
+    failed = []
+
+    def features():
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            job_args = [(p, stream, polyline_options) for p in inputs]
+            for input_path, batch, error in pool.map(_features_job, job_args):
+                if error:
+                    failed.append((input_path, error))
+                    continue
+                yield from batch
+
+    count = write_features(features(), output_path, fmt or "geojson")
+    return count, failed
+
+
+def _run_batch(args, fmt, polyline_options):
+    inputs = expand_inputs(args.input)
+    if not inputs:
+        print(f"Error: no input files match '{args.input}'.")
+        sys.exit(1)
+
+    if args.merge:
+        count, failed = batch_merge(inputs, args.output, stream=args.stream, fmt=fmt,
+                                    jobs=args.jobs, force=args.force, polyline_options=polyline_options)
+        if count is None:
+            print(f"{args.output} is up to date.")
+        else:
+            print(f"Merged {count} features from {len(inputs) - len(failed)} files into {args.output}.")
+    else:
+        converted, skipped, failed = batch_convert(inputs, args.output, stream=args.stream, fmt=fmt,
+                                                   jobs=args.jobs, force=args.force,
+                                                   polyline_options=polyline_options)
+        print(f"Converted {converted} files, skipped {skipped} up-to-date, {len(failed)} failed.")
+
+    for input_path, error in failed:
+        print(f"Error: Failed to process file '{input_path}': {error}")
+    if failed:
         sys.exit(1)
 
-    input_path = sys.argv[1]
-    output_path = sys.argv[2]
-    extract_waypoints_to_geojson(input_path, output_path)
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert Sentiance waypoints JSON to GeoJSON.")
+    parser.add_argument("input", help="Sentiance JSON export, or a directory / glob of exports (batch mode)")
+    parser.add_argument("output", help="GeoJSON output file, or output directory in batch mode")
+    parser.add_argument("--stream", action="store_true",
+                        help="parse the input incrementally (flat memory for multi-GB exports)")
+    parser.add_argument("--format", choices=["geojson", "geojsonseq"], default=None,
+                        help="output format (default: from the output extension; "
+                             "geojsonseq writes one Feature per line and implies --stream)")
+    parser.add_argument("--merge", action="store_true",
+                        help="batch mode: write every input into the single output file")
+    parser.add_argument("-j", "--jobs", type=int, default=None,
+                        help="batch mode: worker processes (default: CPU count)")
+    parser.add_argument("--force", action="store_true",
+                        help="batch mode: convert even if the output is newer than the input")
+    parser.add_argument("--polyline", action="store_true",
+                        help="add an encoded polyline (Google format) property to every feature")
+    parser.add_argument("--polyline-precision", type=int, default=polyline.DEFAULT_PRECISION,
+                        help="decimal digits kept by the polyline encoding (default: %(default)s)")
+    parser.add_argument("--simplify", type=float, default=None, metavar="TOLERANCE",
+                        help="simplify the polyline first (degrees for dp, squared degrees for vw); implies --polyline")
+    parser.add_argument("--simplify-method", choices=["dp", "vw"], default="dp",
+                        help="Douglas-Peucker or Visvalingam-Whyatt (default: %(default)s)")
+    args = parser.parse_args()
+
+    fmt = args.format
+    if fmt is None and Path(args.output).suffix.lower() in _SEQ_SUFFIXES:
+        fmt = "geojsonseq"
+
+    polyline_options = None
+    if args.polyline or args.simplify:
+        polyline_options = {
+            "precision": args.polyline_precision,
+            "tolerance": args.simplify,
+            "method": args.simplify_method,
+        }
+
+    if args.merge or Path(args.input).is_dir() or glob.has_magic(args.input):
+        _run_batch(args, fmt, polyline_options)
+    else:
+        extract_waypoints_to_geojson(args.input, args.output, stream=args.stream, fmt=fmt,
+                                     polyline_options=polyline_options)
 
 
 if __name__ == "__main__":